@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Measure the time spent by HostP2pD.handle() to dispatch a wpa_supplicant
+event, for a set of events that do not write commands to wpa_supplicant.
+
+Usage: python3 benchmarks/bench_dispatch.py [number_of_loops]
+"""
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from hostp2pd import HostP2pD
+
+EVENTS = [
+    "<3>CTRL-EVENT-SCAN-STARTED ",
+    "<3>CTRL-EVENT-SCAN-RESULTS ",
+    "<3>P2P-DEVICE-FOUND ae:e2:d3:41:27:14 p2p_dev_addr=ae:e2:d3:41:a7:14 "
+    "pri_dev_type=3-0050F204-1 name='test' config_methods=0x0 "
+    "dev_capab=0x25 group_capab=0x81 vendor_elems=1 new=1",
+    "<3>P2P-DEVICE-LOST p2p_dev_addr=02:87:01:8c:ce:f6",
+    "<3>RX-PROBE-REQUEST sa=b6:3b:9b:7a:08:96 signal=0",
+    "<3>CTRL-EVENT-EAP-PROPOSED-METHOD vendor=0 method=1",
+    "<3>WPS-SUCCESS",
+    "<3>P2P-GO-NEG-SUCCESS role=GO freq=5200 ht40=1 "
+    "peer_dev=ea:cb:a8:16:a5:d9 peer_iface=ea:cb:a8:16:a5:d9 "
+    "wps_method=PBC",
+    "<3>P2P-GROUP-FORMATION-SUCCESS",
+    "<3>WPS-TIMEOUT",
+    "<3>CTRL-EVENT-UNKNOWN-TO-HOSTP2PD something",
+]
+
+
+def bench(events, is_enroller, loops, repeat=5):
+    """ return the best time per event (seconds) of "repeat" runs """
+    hostp2pd = HostP2pD()
+    hostp2pd.is_enroller = is_enroller
+    hostp2pd.is_daemon = True  # the Enroller does not forward statistics
+    hostp2pd.can_register_cmds = True
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        for i in range(loops):
+            for event in events:
+                hostp2pd.handle(event)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / (loops * len(events))
+
+
+def main():
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    logging.disable(logging.CRITICAL)
+    for is_enroller in (False, True):
+        print("%-8s all events: %6.2f us/event" % (
+            "Enroller" if is_enroller else "Core",
+            bench(EVENTS, is_enroller, loops) * 1e6))
+        for event in EVENTS:
+            print("  %-36s %6.2f us" % (
+                event.split()[0][3:],
+                bench([event], is_enroller, loops // 4) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Compare the Enroller process (enroller_mode: "process") with the Enroller
+thread (enroller_mode: "thread"): memory (RSS and PSS of the Core and of
+its child processes) and CPU time spent to answer a sequence of
+WPS-ENROLLEE-SEEN events of the group. hostp2pd runs in a subprocess,
+connected to the local stand-ins of the wpa_supplicant control interface
+(wpa_transport: "socket", no wpa_cli subprocess) of the benchmark.
+
+Usage: python3 benchmarks/bench_enroller.py [number_of_events]
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from hostp2pd import HostP2pD
+from hostp2pd.wpa_ctrl import WpaCtrlStub
+
+MODES = ["process", "thread"]
+GROUP = "p2p-wlan0-0"
+EVENT = (
+    "WPS-ENROLLEE-SEEN 56:3b:c6:4a:4a:b3 "
+    "811e2280-33d1-5ce8-97e5-6fcf1598c173 10-0050F204-5 0x4388 0 1 [test]"
+)
+
+
+def children(pid):
+    """ list the descendants of a process """
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry) as f:
+                ppid = int(f.read().rpartition(")")[2].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            pids.append(int(entry))
+            pids.extend(children(int(entry)))
+    return pids
+
+
+def memory(pid):
+    """ return RSS and PSS of a process (kB) """
+    values = {"VmRSS:": 0, "Pss:": 0}
+    for name in ("/proc/%s/status" % pid, "/proc/%s/smaps_rollup" % pid):
+        try:
+            with open(name) as f:
+                for line in f:
+                    words = line.split()
+                    if words and words[0] in values:
+                        values[words[0]] = int(words[1])
+        except OSError:
+            pass
+    return values["VmRSS:"], values["Pss:"]
+
+
+def cpu_time(pid):
+    """ return user + system CPU time of a process (seconds) """
+    try:
+        with open("/proc/%s/stat" % pid) as f:
+            fields = f.read().rpartition(")")[2].split()
+    except OSError:
+        return 0.0
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def wait(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def run(mode, ctrl_interface):
+    """ run hostp2pd until stdin is closed """
+    HostP2pD.wpa_transport = "socket"
+    HostP2pD.ctrl_interface = ctrl_interface
+    HostP2pD.enroller_mode = mode
+    HostP2pD.warm_enroller = False
+    HostP2pD.confirm_timeout = 0.1
+    logging.disable(logging.CRITICAL)
+    with HostP2pD(interface="p2p-dev-wlan0", force_logging=logging.CRITICAL):
+        while os.read(0, 512):  # not sys.stdin, closed by the forked Enroller
+            pass
+
+
+def measure(mode, number_of_events):
+    """ start hostp2pd with an active group and measure its processes
+        while the Enroller answers the WPS-ENROLLEE-SEEN events
+    """
+    ctrl_interface = tempfile.mkdtemp()
+    device = WpaCtrlStub(ctrl_interface, "p2p-dev-wlan0", {
+        "LIST_NETWORKS": "network id / ssid / bssid / flags\n"
+        "0\tDIRECT-PP-group\t00:00:00:00:00:00\t[DISABLED][P2P-PERSISTENT]\n",
+        "GET": "keypad\n",
+    }).start()
+    group = WpaCtrlStub(ctrl_interface, GROUP, {
+        "STATUS": "bssid=x\nssid=DIRECT-PP-group\n",
+        "STA-FIRST": "FAIL\n",
+    }).start()
+    device.replies["P2P_GROUP_ADD"] = lambda request: (
+        device.send_event(
+            "P2P-GROUP-STARTED " + GROUP + ' GO ssid="DIRECT-PP-group" '
+            "freq=2412 go_dev_addr=aa persistent=0"),
+        "OK\n")[1]
+    hostp2pd = subprocess.Popen(
+        [sys.executable, __file__, mode, ctrl_interface],
+        stdin=subprocess.PIPE)
+
+    def activated():
+        device.send_event("CTRL-EVENT-SCAN-STARTED ")  # events of the Core
+        return "P2P_FIND" in group.requests
+
+    def responses():
+        return sum(r.startswith("WPS_PIN") for r in list(group.requests))
+
+    try:
+        if not wait(activated, 60):
+            return None  # Enroller not activated
+        time.sleep(0.5)
+        pids = [hostp2pd.pid] + children(hostp2pd.pid)
+        start = [cpu_time(pid) for pid in pids]
+        for i in range(number_of_events):
+            group.send_event(EVENT)
+            if i % 50 == 49:
+                time.sleep(0.01)  # do not overflow the socket buffers
+        if not wait(lambda: responses() >= number_of_events, 60):
+            return None
+        cpu = sum(cpu_time(pid) - s for pid, s in zip(pids, start))
+        rss, pss = (sum(values) for values in zip(
+            *(memory(pid) for pid in pids)))
+        return len(pids), rss, pss, cpu
+    finally:
+        hostp2pd.stdin.close()
+        hostp2pd.wait()
+        device.stop()
+        group.stop()
+
+
+def main():
+    if len(sys.argv) > 2:
+        run(sys.argv[1], sys.argv[2])
+        return
+    number_of_events = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print("%-8s %9s %10s %10s %10s %14s" % (
+        "mode", "processes", "RSS (kB)", "PSS (kB)", "CPU (ms)",
+        "CPU/event (us)"))
+    for mode in MODES:
+        result = measure(mode, number_of_events)
+        if result is None:
+            print("%-8s failed" % mode)
+            continue
+        processes, rss, pss, cpu = result
+        print("%-8s %9s %10s %10s %10.0f %14.1f" % (
+            mode, processes, rss, pss, cpu * 1e3,
+            cpu * 1e6 / number_of_events))
+
+
+if __name__ == "__main__":
+    main()
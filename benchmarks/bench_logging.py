@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Measure the time spent by HostP2pD.handle() to process a wpa_supplicant
+event with DEBUG logging to a rotating log file (like the shipped
+hostp2pd.yaml), with synchronous logging and with asynchronous logging
+(log_queue_size): mean, 99th percentile and worst time per event, and
+records dropped because the queue was full. The "slow" storage adds a
+delay to the write of each record, like an SD card under load.
+
+Usage: python3 benchmarks/bench_logging.py [number_of_loops]
+"""
+
+import os
+import sys
+import time
+import logging
+import logging.handlers
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from hostp2pd import HostP2pD
+from hostp2pd import hostp2pd as engine  # module of HostP2pD
+from bench_dispatch import EVENTS
+
+QUEUE_SIZE = 10000
+WRITE_DELAY = 0.0002  # seconds, "slow" storage
+
+
+class SlowFileHandler(logging.handlers.RotatingFileHandler):
+    def emit(self, record):
+        super().emit(record)
+        time.sleep(WRITE_DELAY)
+
+
+def bench(handler_class, log_queue_size, loops):
+    """ return the times per event (seconds) and the dropped records """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = handler_class(
+        os.path.join(tempfile.mkdtemp(), "hostp2pd.log"),
+        maxBytes=1000000, backupCount=2)
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(threadName)-9s %(funcName)-25s %(levelname)-8s "
+        "%(message)s"))
+    root.addHandler(handler)
+    root.setLevel(logging.DEBUG)
+    engine.queue_logging(log_queue_size)
+    hostp2pd = HostP2pD()
+    hostp2pd.is_daemon = True
+    hostp2pd.can_register_cmds = True
+    times = []
+    for i in range(loops):
+        for event in EVENTS:
+            start = time.perf_counter()
+            hostp2pd.handle(event)
+            times.append(time.perf_counter() - start)
+    log_queue = engine.log_queue
+    dropped = log_queue.handler.dropped if log_queue is not None else 0
+    engine.queue_logging(0)  # write the queued records
+    handler.close()
+    return sorted(times), dropped
+
+
+def main():
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print("%-8s %-12s %10s %10s %10s %8s" % (
+        "storage", "logging", "mean (us)", "p99 (us)", "max (us)",
+        "dropped"))
+    for name, handler_class in (
+            ("file", logging.handlers.RotatingFileHandler),
+            ("slow", SlowFileHandler),
+    ):
+        for log_queue_size in (0, QUEUE_SIZE):
+            times, dropped = bench(handler_class, log_queue_size, loops)
+            print("%-8s %-12s %10.1f %10.1f %10.1f %8s" % (
+                name,
+                "queue" if log_queue_size else "synchronous",
+                sum(times) / len(times) * 1e6,
+                times[int(len(times) * 0.99)] * 1e6,
+                times[-1] * 1e6,
+                dropped))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Measure the cost of parsing the fields of a wpa_supplicant event (Event
+class): creation only (fields never read, like for most events), and
+creation plus reading all the fields used by the event handlers.
+
+Usage: python3 benchmarks/bench_parse.py [number_of_loops]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from hostp2pd import HostP2pD
+from hostp2pd.hostp2pd import Event
+from bench_dispatch import EVENTS
+
+FIELDS = [
+    "mac_addr", "dev_name", "p2p_dev_addr", "sa_addr", "sa_name",
+    "device_name", "device_type", "dev_passwd_id", "password_id",
+    "go_intent", "ssid_arg", "persistent_arg",
+]
+
+
+def create(hostp2pd, line, words):
+    Event(line, words, hostp2pd)
+
+
+def create_and_read(hostp2pd, line, words):
+    event = Event(line, words, hostp2pd)
+    for field in FIELDS:
+        getattr(event, field)
+
+
+def bench(function, line, loops, repeat=5):
+    """ return the best time per event (seconds) of "repeat" runs """
+    hostp2pd = HostP2pD()
+    words = line.split()
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        for i in range(loops):
+            function(hostp2pd, line, words)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / loops
+
+
+def main():
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("%-36s %10s %10s" % ("", "create", "all fields"))
+    for line in EVENTS:
+        print("  %-34s %7.2f us %7.2f us" % (
+            line.split()[0][3:],
+            bench(create, line, loops) * 1e6,
+            bench(create_and_read, line, loops) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
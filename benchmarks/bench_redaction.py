@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Measure the cost of formatting a log record by the root handler while
+secrets are hidden from logging (hide_from_logging() is called by
+hostp2pd at each enrolment): time per record after a number of calls
+with the same PIN and with a different PIN at each call (e.g., pin_module
+generating a new PIN for each connection).
+
+Usage: python3 benchmarks/bench_redaction.py [number_of_loops]
+"""
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from hostp2pd.hostp2pd import hide_from_logging
+
+CALLS = [1, 10, 100, 1000, 5000]
+MESSAGES = [
+    "reading '<3>P2P-DEVICE-FOUND ae:e2:d3:41:27:14 "
+    "p2p_dev_addr=ae:e2:d3:41:a7:14 pri_dev_type=3-0050F204-1 "
+    "name='test' config_methods=0x0 dev_capab=0x25 group_capab=0x81'",
+    "Write: set_network 0 psk \"secret_passphrase\"",
+]
+
+
+def bench(handler, message, loops, repeat=5):
+    """ return the best time per record (seconds) of "repeat" runs """
+    record = logging.LogRecord(
+        "root", logging.DEBUG, __file__, 0, message, None, None)
+    best = None
+    for r in range(repeat):
+        start = time.perf_counter()
+        for i in range(loops):
+            handler.format(record)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / loops
+
+
+def measure(new_pin, loops):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)-8s %(message)s"))
+    root.addHandler(handler)
+    results = []
+    calls = 0
+    for target in CALLS:
+        while calls < target:
+            hide_from_logging(
+                ["%08d" % calls if new_pin else "00000000"], "********")
+            calls += 1
+        results.append(
+            sum(bench(handler, m, loops) for m in MESSAGES) / len(MESSAGES))
+    return results
+
+
+def main():
+    loops = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sys.setrecursionlimit(100000)  # nested formatters, if any
+    print("%-30s" % "hide_from_logging() calls" +
+          "".join("%10s" % c for c in CALLS))
+    for new_pin in (False, True):
+        results = measure(new_pin, loops)
+        print("%-30s" % ("  new PIN (us/record)" if new_pin
+                         else "  same PIN (us/record)") +
+              "".join("%10.2f" % (r * 1e6) for r in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,10 +11,16 @@ import subprocess
 import re
 import logging
 import logging.config
+import logging.handlers
 from pathlib import Path
 import yaml
 import threading
+import asyncio
 import time
+import heapq
+import functools
+import struct
+import copy
 import os
 import pty
 import errno
@@ -22,75 +28,1365 @@ import sys
 import traceback
 import ctypes
 import importlib.util
+import shlex
+import bisect
+import socket
+import socketserver
+import http.server
+import stat
 from ctypes.util import find_library
 from select import select
+from collections import deque, OrderedDict
+from queue import Queue, Full
+from concurrent.futures import ThreadPoolExecutor
 import signal
 from distutils.spawn import find_executable
 from multiprocessing import Process, Manager
 from .__version__ import __version__
 from .pin import get_pin
+from .wpa_ctrl import WpaCtrl
+
+# Loggers of the components (log_levels and loglevel command of the
+# interpreter); records are propagated to the handlers of the root logger
+core_logger = logging.getLogger("hostp2pd.core")
+enroller_logger = logging.getLogger("hostp2pd.enroller")
+transport_logger = logging.getLogger("hostp2pd.transport")  # wpa_supplicant
+hooks_logger = logging.getLogger("hostp2pd.hooks")  # run_program, hook_module
+config_logger = logging.getLogger("hostp2pd.config")
+LOGGERS = {
+    "core": core_logger,
+    "enroller": enroller_logger,
+    "transport": transport_logger,
+    "hooks": hooks_logger,
+    "config": config_logger,
+}
+
+# wpa_cli output lines which are not part of a command reply
+EVENT_LINE = re.compile(
+    r"<[0-9]>"
+    r"|HOSTP2PD_"
+    r"|Interactive mode"
+    r"|Connection established"
+    r"|Connection to wpa_supplicant"
+    r"|Could not connect to wpa_supplicant"
+    r"|Not connected to wpa_supplicant"
+    r"|'[^']*' command (?:timed out|failed)"
+)
+
+# wpa_cli messages which drop the pending commands
+CONNECTION_LOST = ("Connection to wpa_supplicant lost",
+                   "Not connected to wpa_supplicant")
+
+
+def command_name(cmd):
+    """ name of a wpa_supplicant command (label of command_seconds) """
+    words = cmd.split(None, 1)
+    return words[0].lower() if words else ""
+
+
+class LineReader(object):
+    """
+    Buffered reader of text lines from a file descriptor.
+    Data is read in large chunks into a reusable buffer and split into
+    complete lines (newline and carriage returns are removed); a partial
+    line is kept until the next read completes it.
+    """
 
+    chunk_size = 4096
 
-class RedactingFormatter(object):
+    def __init__(self, fd):
+        self.fd = fd
+        self.chunk = bytearray(self.chunk_size)
+        self.pending = bytearray()
+
+    def read_lines(self):
+        """
+        Read the available data (one chunk, without blocking if select()
+        reported the descriptor as readable) and return the list of
+        completed lines (void list if no line is complete).
+        OSError(EIO) is raised at end of file.
+        """
+        size = os.readv(self.fd, [self.chunk])
+        if size == 0:
+            raise OSError(errno.EIO, "End of file")
+        self.pending += memoryview(self.chunk)[:size]
+        end = self.pending.rfind(b"\n")
+        if end < 0:
+            return []
+        data = self.pending[:end].decode("utf8", "ignore")
+        del self.pending[: end + 1]
+        if "\r" in data:
+            data = data.replace("\r", "")
+        return data.split("\n")
+
+
+class Command(object):
+    """ command waiting for its reply (see HostP2pD.submit()) """
+
+    def __init__(self, cmd, future):
+        self.cmd = cmd
+        self.future = future
+        self.lines = []  # reply lines received by wpa_cli
+
+
+class Channel(object):
     """
-    Logging formatter that masks sensitive data like secrets and passwords
-    from logging.
-    patterns = list of secrets to mask (check also hardcoded patterns)
-    mask = string to substitute to secrets
+    Framed channel used by the Enroller to send its HOSTP2PD_ messages to
+    the Core, separated from the wpa_cli output: a pipe created by the
+    Core and inherited by the Enroller processes. Each message is sent
+    with a single write, prefixed by its length, so that it is never
+    split or interleaved with the messages of another process (writes of
+    up to PIPE_BUF bytes are atomic).
     """
 
-    def __init__(self, orig_formatter, patterns, mask):
-        self.orig_formatter = orig_formatter
-        self._patterns = patterns
-        self._mask = mask
+    header = struct.Struct("!I")
+    max_size = 4096 - header.size  # PIPE_BUF
 
-    def format(self, record):
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.chunk = bytearray(LineReader.chunk_size)
+        self.pending = bytearray()
+
+    def fileno(self):
+        return self.read_fd
+
+    def send(self, message):
+        data = message.encode()[: self.max_size]
+        os.write(self.write_fd, self.header.pack(len(data)) + data)
+
+    def receive(self):
         """
-        Masked items:
-        - psk password (hardcoded here)
-        - psk "password" (hardcoded here)
-        - passphrase=password
-        - passphrase="password"
-        - all items included in the "patterns" list
+        Read the available data and return the list of the complete
+        messages (void list if no message is complete).
         """
-        msg = self.orig_formatter.format(record)
+        size = os.readv(self.read_fd, [self.chunk])
+        self.pending += memoryview(self.chunk)[:size]
+        messages = []
+        start = 0
+        pending = self.pending
+        while len(pending) - start >= self.header.size:
+            size, = self.header.unpack_from(pending, start)
+            end = start + self.header.size + size
+            if len(pending) < end:
+                break
+            messages.append(
+                pending[start + self.header.size:end].decode(
+                    "utf8", "ignore"))
+            start = end
+        del pending[:start]
+        return messages
+
+    def close(self):
+        for fd in (self.read_fd, self.write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
 
-        match = re.search(
-            r'.*[ \t]+psk[ \t]+("?[^" \t\']*").*', msg, flags=re.DOTALL
-        )
-        if match:
-            secret = match.expand("\\1")
-            if secret and secret not in self._patterns:
-                self._patterns.append(secret)
-        match = re.search(
-            r'.*[ \t]+passphrase=("?[^" \t\']*").*', msg, flags=re.DOTALL
-        )
-        if match:
-            secret = match.expand("\\1")
-            if secret and secret not in self._patterns:
-                self._patterns.append(secret)
 
-        for pattern in self._patterns:
-            msg = msg.replace(pattern, self._mask)
-        return msg
+class Event(object):
+    """
+    wpa_supplicant event (or HOSTP2PD_ message) passed by handle() to the
+    event handlers.
+    line = whole line
+    words = list of the words of the line (without prompt)
+    name = event name (first word, without the "<n>" level)
+    stat_name = name used for the statistics
+    fields = dictionary of the key=value fields of the line; quoted values
+        (name='...', ssid="...") can include spaces and are returned
+        without quotes. The line is tokenized once, at the first access.
+    The other attributes are computed when read (void string if the field
+    is not present): mac_addr (second word), dev_name (name=),
+    p2p_dev_addr, sa_addr (sa=), dev_passwd_id, go_intent, ssid_arg
+    (ssid=), persistent_arg (persistent=); sa_name, device_name (name of
+    p2p_dev_addr), device_type (from pri_dev_type) and password_id (from
+    dev_passwd_id) are decoded through the registers of hostp2pd.
+    """
+
+    field_re = re.compile(r"""(\w+)=('[^']*'|"[^"]*"|[^ \t]*)""")
+
+    def __init__(self, line, words, hostp2pd):
+        self.line = line
+        self.words = words
+        self.hostp2pd = hostp2pd
+        self.name = ""
+        self.stat_name = ""
+        self._fields = None
+
+    @property
+    def fields(self):
+        if self._fields is None:
+            self._fields = {}
+            if "=" in self.line:
+                for key, value in self.field_re.findall(self.line):
+                    if value[:1] in ("'", '"'):
+                        value = value[1:-1]
+                    self._fields[key] = value
+        return self._fields
+
+    @property
+    def mac_addr(self):  # second word is generally the mac_addr
+        return self.words[1] if len(self.words) > 1 else ""
+
+    @property
+    def dev_name(self):  # some events have "name="
+        return self.fields.get("name", "")
+
+    @property
+    def p2p_dev_addr(self):
+        return self.fields.get("p2p_dev_addr", "")
+
+    @property
+    def sa_addr(self):
+        return self.fields.get("sa", "")
+
+    @property
+    def dev_passwd_id(self):
+        return self.fields.get("dev_passwd_id", "")
+
+    @property
+    def go_intent(self):
+        return self.fields.get("go_intent", "")
+
+    @property
+    def ssid_arg(self):
+        return self.fields.get("ssid", "")
+
+    @property
+    def persistent_arg(self):
+        return self.fields.get("persistent", "")
+
+    @property
+    def sa_name(self):
+        return self.hostp2pd.addr_register.get(self.sa_addr, "[unknown]")
+
+    @property
+    def device_name(self):
+        return self.hostp2pd.addr_register.get(
+            self.p2p_dev_addr, "[unknown]")
+
+    @property
+    def device_type(self):
+        device_types = self.hostp2pd.p2p_primary_device_type
+        return device_types.get(
+            self.fields.get("pri_dev_type"), device_types['255-0050F204-1'])
+
+    @property
+    def password_id(self):
+        dev_passwd_id = self.dev_passwd_id
+        if not dev_passwd_id.isnumeric():
+            return 'Unknown'
+        return self.hostp2pd.p2p_password_id.get(
+            int(dev_passwd_id), 'Random')
+
+
+class EventQueue(object):
+    """
+    Queue of the lines to be processed by handle(), with priority classes:
+    lines are returned by order of priority and, within the same priority,
+    by order of arrival. Provisioning, GO negotiation, group, WPS and
+    station events, as well as the Enroller messages, have the highest
+    priority; discovery events (scan, device found/lost, probe requests)
+    have the lowest priority and are dropped when the queue already
+    includes max_size lines or more. Other lines are never dropped.
+    None can be queued as end of data mark, returned after all lines.
+    """
+
+    HIGH = 0
+    NORMAL = 1
+    LOW = 2
+    END = 3
+
+    high_priority = (
+        "P2P-PROV-DISC-",
+        "P2P-GO-NEG-",
+        "P2P-GROUP-",
+        "P2P-INVITATION-",
+        "AP-STA-",
+        "AP-DISABLED",
+        "WPS-",
+        "CTRL-EVENT-DISCONNECTED",
+        "HOSTP2PD_",
+    )
+    low_priority = (
+        "CTRL-EVENT-SCAN-",
+        "P2P-DEVICE-FOUND",
+        "P2P-DEVICE-LOST",
+        "RX-PROBE-REQUEST",
+    )
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.queues = [deque(), deque(), deque(), deque()]
+        self.depth = 0
+        self.max_depth = 0  # max number of queued lines
+        self.dropped = 0  # number of dropped lines
+
+    def __len__(self):
+        return self.depth
+
+    def priority(self, line):
+        if line is None:
+            return self.END
+        if line[:1] == "<":  # remove "<n>" level
+            line = line.partition(">")[2]
+        if line.startswith(self.high_priority):
+            return self.HIGH
+        if line.startswith(self.low_priority):
+            return self.LOW
+        return self.NORMAL
+
+    def put(self, line):
+        """ queue a line (void lines are discarded); returns False if the
+            line is dropped
+        """
+        if line == "":
+            return True
+        priority = self.priority(line)
+        if priority == self.LOW and self.depth >= self.max_size:
+            self.dropped += 1
+            return False
+        self.queues[priority].append(line)
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+        return True
+
+    def extend(self, lines):
+        for line in lines:
+            self.put(line)
+
+    def get(self):
+        """ return the next line (None if the queue is void) """
+        for queue in self.queues:
+            if queue:
+                self.depth -= 1
+                return queue.popleft()
+        return None
+
+    def clear(self):
+        for queue in self.queues:
+            queue.clear()
+        self.depth = 0
+
+
+class Scheduler(object):
+    """
+    Deadline scheduler of one-shot and recurring tasks, based on the
+    monotonic clock (not affected by changes of the system time).
+    Each task has a name: adding a task with the name of a scheduled one
+    replaces it. The engine loop waits at most timeout() seconds and then
+    invokes run_due(), which runs the expired tasks in order of deadline,
+    also while events keep arriving.
+    """
+
+    def __init__(self):
+        self.heap = []  # [deadline, sequence, name, function, interval]
+        self.tasks = {}  # name: heap entry
+        self.sequence = 0
+
+    def __contains__(self, name):
+        return name in self.tasks
+
+    def add(self, name, delay, function, interval=None):
+        """ run function after delay seconds and then every interval
+            seconds, if interval is not None
+        """
+        self.cancel(name)
+        entry = [time.monotonic() + delay, self.sequence, name, function,
+                 interval]
+        self.sequence += 1
+        self.tasks[name] = entry
+        heapq.heappush(self.heap, entry)
+
+    def cancel(self, name):
+        entry = self.tasks.pop(name, None)
+        if entry is not None:
+            entry[3] = None  # removed from the heap when expired
+
+    def timeout(self, max_timeout):
+        """ seconds to the next deadline (at most max_timeout) """
+        while self.heap and self.heap[0][3] is None:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return max_timeout
+        return min(max(self.heap[0][0] - time.monotonic(), 0), max_timeout)
+
+    def run_due(self):
+        """ run the expired tasks """
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, sequence, name, function, interval = heapq.heappop(
+                self.heap)
+            if function is None:
+                continue
+            del self.tasks[name]
+            if interval is not None:
+                self.add(name, max(deadline + interval - now, 0),
+                         function, interval)
+            function()
+
+
+class ScanGovernor(object):
+    """
+    Adaptive period of the p2p_find refreshes, kept between min_interval
+    and max_interval seconds and updated at each refresh, depending on the
+    discovery activity observed in the last period:
+    - provision discovery requests (a station is connecting): the period
+      is reset to min_interval;
+    - new stations found: the period is halved;
+    - no activity: the period grows by 50%.
+    A scan trigger rejected by wpa_supplicant (a scan is already pending)
+    immediately doubles the period.
+    rate is the moving average of the number of new stations found per
+    minute.
+    """
+
+    def __init__(self, interval, min_interval, max_interval):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = self.bounded(interval)
+        self.found = 0  # new stations found in the current period
+        self.requests = 0  # provision discovery requests in the period
+        self.rejected = 0  # total number of rejected scan triggers
+        self.rate = 0.0
+        self.last_update = time.monotonic()
+
+    def bounded(self, interval):
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def device_found(self):
+        self.found += 1
+
+    def prov_disc(self):
+        self.requests += 1
+
+    def scan_rejected(self):
+        self.rejected += 1
+        self.interval = self.bounded(self.interval * 2)
+
+    def update(self):
+        """ compute the period of the next refresh """
+        now = time.monotonic()
+        elapsed = max(now - self.last_update, 1)
+        self.last_update = now
+        self.rate = 0.7 * self.rate + 0.3 * self.found * 60 / elapsed
+        if self.requests:
+            self.interval = self.min_interval
+        elif self.found:
+            self.interval = self.bounded(self.interval / 2)
+        else:
+            self.interval = self.bounded(self.interval * 1.5)
+        self.found = 0
+        self.requests = 0
+        return self.interval
+
+
+class Supervisor(object):
+    """
+    Restart policy of a child process (wpa_cli or the Enroller): the delay
+    before restarting a process which died starts from min_delay seconds
+    and is doubled at each consecutive failure, up to max_delay; it is
+    reset when the process has run for more than max_delay seconds.
+    restarts is the number of restarts and downtime the total time (seconds)
+    in which the process was not running.
+    """
+
+    def __init__(self, min_delay, max_delay):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min_delay
+        self.restarts = 0
+        self.down_since = None  # time.monotonic() of the failure
+        self.up_since = time.monotonic()
+        self.total_downtime = 0.0
+
+    def exited(self):
+        """ the process died: return the delay before restarting it """
+        now = time.monotonic()
+        if self.down_since is None:
+            self.down_since = now
+            if now - self.up_since > self.max_delay:
+                self.delay = self.min_delay  # it was running fine
+        delay = min(self.delay, self.max_delay)
+        self.delay = min(delay * 2, self.max_delay)
+        return delay
+
+    def restarted(self):
+        self.restarts += 1
+        self.cancel()
+
+    def cancel(self):
+        """ the process is not down any more (restarted or not needed) """
+        now = time.monotonic()
+        if self.down_since is not None:
+            self.total_downtime += now - self.down_since
+            self.down_since = None
+        self.up_since = now
+
+    @property
+    def downtime(self):
+        """ total downtime, including the current one """
+        if self.down_since is None:
+            return self.total_downtime
+        return self.total_downtime + time.monotonic() - self.down_since
+
+
+class Histogram(object):
+    """
+    Histogram of durations (seconds) with fixed buckets: counts[i] is the
+    number of the samples not greater than buckets[i] and greater than the
+    previous bound (the last count is the one of the samples above the
+    last bound). Percentiles are estimated by linear interpolation within
+    the bucket including them.
+    """
+
+    buckets = (
+        0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, counts, total, maximum):
+        """ add the samples of another histogram with the same buckets """
+        for i, count in enumerate(counts[:len(self.counts)]):
+            self.counts[i] += count
+            self.count += count
+        self.sum += total
+        self.max = max(self.max, maximum)
+
+    def copy(self):
+        histogram = Histogram()
+        histogram.merge(self.counts, self.sum, self.max)
+        return histogram
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def percentile(self, percent):
+        """ estimated value below which "percent" % of the samples fall
+            (None without samples)
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.max
+                if i < len(self.buckets) and self.buckets[i] < upper:
+                    upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.max
+
+
+class Metrics(object):
+    """
+    Registry of the metrics of hostp2pd: counters and gauges (name: {label:
+    value}), histograms of durations (name: {label: Histogram}) and info
+    strings (name: value). The label is optional (None = no label); see
+    "descriptions" for the meaning of the label of each metric. Durations
+    between two events are measured with start() and stop(). The registry
+    is also updated by the threads of the hooks: snapshot() returns a copy
+    which can be read without locking.
+    """
+
+    descriptions = {  # name: (description, name of the label)
+        "events": ("Events and replies of wpa_supplicant", "event"),
+        "response_messages": ("Events and replies (total)", None),
+        "n_stations": ("Stations connected to the group", None),
+        "connection_seconds": (
+            "Provisioning request to AP-STA-CONNECTED", None),
+        "go_negotiation_seconds": ("GO negotiation", None),
+        "group_start_seconds": ("Group start", None),
+        "wps_enrolment_seconds": (
+            "WPS-ENROLLEE-SEEN to AP-STA-CONNECTED", None),
+        "enroller_ready_seconds": ("Group start to Enroller ready", None),
+        "enroller_wps_seconds": ("Group start to first WPS response", None),
+        "hook_seconds": ("Run time of the hooks", "action"),
+        "hook_failures": ("Failed hooks", "action"),
+        "hook_timeouts": ("Timed out hooks", "action"),
+        "command_seconds": ("Round trip of the commands", "command"),
+    }
+    max_timers = 100  # durations measured at the same time
+    max_duration = 300  # seconds. Older start() times are stale
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = OrderedDict()  # (name, key): start time
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.info = {}
+        self.timers.clear()
+
+    def inc(self, name, label=None, value=1):
+        with self.lock:
+            family = self.counters.setdefault(name, {})
+            family[label] = family.get(label, 0) + value
+
+    def set(self, name, value, label=None):
+        with self.lock:
+            self.gauges.setdefault(name, {})[label] = value
+
+    def observe(self, name, value, label=None):
+        with self.lock:
+            family = self.histograms.setdefault(name, {})
+            histogram = family.get(label)
+            if histogram is None:
+                histogram = family[label] = Histogram()
+            histogram.observe(value)
+
+    def merge(self, name, label, counts, total, maximum):
+        """ add the samples of a histogram (e.g., of the Enroller) """
+        with self.lock:
+            family = self.histograms.setdefault(name, {})
+            histogram = family.get(label)
+            if histogram is None:
+                histogram = family[label] = Histogram()
+            histogram.merge(counts, total, maximum)
+
+    def start(self, name, key=None, restart=True):
+        """ start measuring the duration "name" of "key" (e.g., a station);
+            without restart, a duration already being measured (for less
+            than max_duration seconds) is kept
+        """
+        now = time.monotonic()
+        start = self.timers.get((name, key))
+        if (
+                not restart and start is not None
+                and now - start < self.max_duration
+        ):
+            return
+        self.timers.pop((name, key), None)
+        self.timers[(name, key)] = now
+        if len(self.timers) > self.max_timers:
+            self.timers.popitem(last=False)
+
+    def stop(self, name, key=None, label=None):
+        """ account the duration measured since start(), which is
+            returned (None if not started or stale)
+        """
+        start = self.timers.pop((name, key), None)
+        if start is None:
+            return None
+        duration = time.monotonic() - start
+        if duration >= self.max_duration:
+            return None
+        self.observe(name, duration, label)
+        return duration
+
+    def cancel(self, name, key=None):
+        self.timers.pop((name, key), None)
+
+    def snapshot(self):
+        """ copy of counters, gauges, histograms and info """
+        with self.lock:
+            return {
+                "counters": {
+                    name: dict(family)
+                    for name, family in self.counters.items()},
+                "gauges": {
+                    name: dict(family)
+                    for name, family in self.gauges.items()},
+                "histograms": {
+                    name: {
+                        label: histogram.copy()
+                        for label, histogram in family.items()}
+                    for name, family in self.histograms.items()},
+                "info": dict(self.info),
+            }
+
+    def take_histograms(self):
+        """ return the histograms and clear them (see flush_statistics) """
+        with self.lock:
+            histograms, self.histograms = self.histograms, {}
+        return histograms
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """ GET /metrics (or /) of the MetricsExporter """
+
+    timeout = 10  # seconds. Max time to receive a request
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        openmetrics = "application/openmetrics-text" in self.headers.get(
+            "Accept", "")
+        try:
+            body = self.server.exporter.render(openmetrics).encode()
+        except Exception as e:
+            core_logger.error(
+                "Cannot render the metrics: %s", e, exc_info=True)
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header(
+            "Content-Type",
+            MetricsExporter.openmetrics_type if openmetrics
+            else MetricsExporter.text_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        core_logger.debug(
+            "Metrics request from %s: %s", self.address_string(), format % args)
+
+
+class MetricsHTTPServer(http.server.HTTPServer):
+    allow_reuse_address = True
+
+
+class MetricsHTTP6Server(MetricsHTTPServer):
+    address_family = socket.AF_INET6
+
+
+class MetricsUnixServer(socketserver.UnixStreamServer):
+    pass
+
+
+class MetricsExporter(object):
+    """
+    Server of the metrics of the Core in OpenMetrics text format (or in
+    the Prometheus text format, if the client does not accept OpenMetrics),
+    run by its own thread. address is "host:port" ("[host]:port" for IPv6;
+    a port alone means all interfaces) or the path of a unix socket. Each
+    request reads a snapshot of the metrics (see Metrics.snapshot()) and
+    the attributes of the Core, never waiting for the engine. The events
+    of the Enroller are included when sent to the Core (see
+    statistics_interval).
+    """
+
+    openmetrics_type = (
+        "application/openmetrics-text; version=1.0.0; charset=utf-8")
+    text_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, hostp2pd, address):
+        self.hostp2pd = hostp2pd
+        self.address = address
+        self.path = None  # unix socket
+        if address.startswith("/"):
+            try:
+                if stat.S_ISSOCK(os.stat(address).st_mode):
+                    os.unlink(address)  # left by a previous run
+            except FileNotFoundError:
+                pass
+            self.server = MetricsUnixServer(address, MetricsRequestHandler)
+            self.path = address
+        else:
+            host, _, port = address.rpartition(":")
+            server_class = MetricsHTTPServer
+            if host.startswith("["):
+                host = host.strip("[]")
+                server_class = MetricsHTTP6Server
+            self.server = server_class((host, int(port)), MetricsRequestHandler)
+        self.server.exporter = self
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="Metrics", daemon=True)
+        self.thread.start()
+        core_logger.debug('Exporting the metrics to "%s".', self.address)
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def close(self):
+        """ close the socket (also of an Enroller process, which
+            inherited it)
+        """
+        self.server.server_close()
+
+    @staticmethod
+    def format_labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(
+            '%s="%s"' % (
+                name,
+                str(value).replace("\\", "\\\\").replace('"', '\\"')
+                .replace("\n", "\\n"))
+            for name, value in labels) + "}"
+
+    @staticmethod
+    def format_value(value):
+        return repr(float(value)) if isinstance(value, float) else str(
+            int(value))
+
+    def format_family(self, openmetrics, name, kind, description, samples):
+        """ return the lines of a metric family; samples is a list of
+            (suffix, labels, value), with labels a list of (name, value)
+        """
+        lines = []
+        name = "hostp2pd_" + name
+        suffix = {"counter": "_total", "info": "_info"}.get(kind, "")
+        type_name = name
+        if not openmetrics:
+            type_name += suffix
+            if kind == "info":
+                kind = "gauge"
+        lines.append("# TYPE %s %s" % (type_name, kind))
+        lines.append("# HELP %s %s" % (type_name, description))
+        for sample_suffix, labels, value in samples:
+            lines.append(
+                name + (sample_suffix or suffix) + self.format_labels(labels)
+                + " " + self.format_value(value))
+        return lines
+
+    def render(self, openmetrics=True):
+        """ metrics in OpenMetrics (or Prometheus) text format """
+        hostp2pd = self.hostp2pd
+        snapshot = hostp2pd.metrics.snapshot()
+        lines = []
+
+        def add_family(*args):
+            lines.extend(self.format_family(openmetrics, *args))
+
+        add_family("build", "info", "Version of hostp2pd", [
+            (None, [("version", __version__)], 1)])
+        for kind, key in ("counter", "counters"), ("gauge", "gauges"):
+            for name, family in sorted(snapshot[key].items()):
+                description, label_name = Metrics.descriptions.get(
+                    name, (name, "label"))
+                add_family(name, kind, description, [
+                    (None, [] if label is None else [(label_name, label)],
+                     value)
+                    for label, value in sorted(
+                        family.items(), key=lambda item: str(item[0]))])
+        bounds = [repr(float(bound)) for bound in Histogram.buckets] + ["+Inf"]
+        for name, family in sorted(snapshot["histograms"].items()):
+            description, label_name = Metrics.descriptions.get(
+                name, (name, "label"))
+            samples = []
+            for label, histogram in sorted(
+                    family.items(), key=lambda item: str(item[0])):
+                labels = [] if label is None else [(label_name, label)]
+                cumulative = 0
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    samples.append(
+                        ("_bucket", labels + [("le", bound)], cumulative))
+                samples.append(("_count", labels, histogram.count))
+                samples.append(("_sum", labels, float(histogram.sum)))
+            add_family(name, "histogram", description, samples)
+
+        # State of the Core
+        group = hostp2pd.monitor_group
+        add_family(
+            "group_active", "gauge", "Whether a group is active",
+            [(None, [], 1 if group else 0)])
+        if group:
+            add_family("group", "info", "Active group", [(None, [
+                ("group", group),
+                ("ssid", hostp2pd.ssid_group or ""),
+                ("type", hostp2pd.group_type or "")], 1)])
+        event_queue = hostp2pd.event_queue
+        add_family(
+            "event_queue_depth", "gauge", "Queued events",
+            [(None, [], len(event_queue))])
+        add_family(
+            "event_queue_dropped", "counter",
+            "Dropped discovery events", [(None, [], event_queue.dropped)])
+        hook_executor = hostp2pd.hook_executor
+        add_family(
+            "hook_queue_depth", "gauge", "Queued and running hooks",
+            [(None, [], hook_executor.pending if hook_executor else 0)])
+        if log_queue is not None:
+            add_family(
+                "log_queue_depth", "gauge", "Queued log records",
+                [(None, [], log_queue.handler.queue.qsize())])
+            add_family(
+                "log_dropped", "counter", "Dropped log records",
+                [(None, [], log_queue.handler.dropped)])
+        add_family(
+            "log_suppressed", "counter", "Suppressed debug logs",
+            [(None, [], hostp2pd.log_limiter.suppressed)])
+        add_family(
+            "enroller_starts", "counter", "Starts of the Enroller",
+            [(None, [("mode", mode)], count)
+             for mode, count in sorted(hostp2pd.enroller_starts.items())])
+        supervisors = (
+            ("wpa_cli", hostp2pd.process_supervisor),
+            ("enroller", hostp2pd.enroller_supervisor))
+        add_family(
+            "restarts", "counter", "Restarts of the processes",
+            [(None, [("process", process)], supervisor.restarts)
+             for process, supervisor in supervisors])
+        add_family(
+            "downtime_seconds", "counter",
+            "Time in which the processes were not running",
+            [(None, [("process", process)], float(supervisor.downtime))
+             for process, supervisor in supervisors])
+        add_family(
+            "scan_interval_seconds", "gauge",
+            "Adaptive period of the p2p_find refreshes",
+            [(None, [], float(hostp2pd.scan_governor.interval))])
+        add_family(
+            "wpa_supplicant_errors", "gauge",
+            "Consecutive wpa_supplicant errors",
+            [(None, [], hostp2pd.wpa_supplicant_errors)])
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class HookExecutor(object):
+    """
+    Runner of the external program (run_program) and of the callbacks of
+    hook_module which does not block the event processing: commands are
+    lists of arguments run without shell, or callables (functools.partial),
+    executed by a pool of up to "workers" threads; the commands submitted
+    with the same key are run in order, while different keys are run in
+    parallel. A program running for more than "timeout" seconds is killed;
+    a callback cannot be killed, so it is left running in its own thread
+    and the worker proceeds with the next command.
+    The executions are accounted in "metrics" by action (on_<action> for
+    callbacks): hook_seconds, hook_failures and hook_timeouts; exit_codes
+    is the exit code of the last run of each action (None if not run,
+    killed or raising).
+    """
+
+    def __init__(self, workers, timeout, coalesce=False, metrics=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(int(workers), 1), thread_name_prefix="Hook")
+        self.timeout = timeout
+        self.coalesce = coalesce  # see submit()
+        self.queues = {}  # key: deque of (tag, command), the first running
+        self.lock = threading.Lock()
+        self.metrics = metrics or Metrics()
+        self.exit_codes = {}
+        self.coalesced = 0  # number of commands dropped by coalescing
+
+    def submit(self, key, command, tag, cancels=None):
+        """ queue a command; with coalesce, a command which cancels the
+            tag of a queued one (not yet running) drops both of them
+        """
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue is None:
+                self.queues[key] = deque([(tag, command)])
+            else:
+                if self.coalesce and cancels is not None:
+                    for hook in list(queue)[1:]:
+                        if hook[0] == cancels:
+                            queue.remove(hook)
+                            self.coalesced += 2
+                            hooks_logger.debug(
+                                "Coalesced %s and %s", cancels, tag)
+                            return
+                queue.append((tag, command))
+                return  # run after the previous commands of the key
+        self.executor.submit(self.run_queue, key)
+
+    @property
+    def pending(self):
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def run_queue(self, key):
+        queue = self.queues[key]
+        while True:
+            with self.lock:
+                tag, command = queue[0]
+            try:
+                self.run(tag, command)
+            except Exception as e:
+                hooks_logger.critical(
+                    'PANIC - Internal error in hook "%s": %s',
+                    tag[0], e, exc_info=True)
+            finally:  # the next commands of the key are not stalled
+                with self.lock:
+                    queue.popleft()
+                    done = not queue
+                    if done:
+                        del self.queues[key]
+            if done:
+                return
+
+    def run(self, tag, command):
+        action = tag[0]
+        start = time.monotonic()
+        if callable(command):
+            exit_code, timed_out = self.call(action, command)
+        else:
+            exit_code, timed_out = self.spawn(action, command)
+        self.metrics.observe("hook_seconds", time.monotonic() - start, action)
+        self.metrics.inc("hook_failures", action, exit_code != 0)
+        self.metrics.inc("hook_timeouts", action, timed_out)
+        self.exit_codes[action] = exit_code
+
+    def call(self, action, callback):
+        """ run a callback of hook_module in a separate thread: return
+            exit code (0, or None if it raised an exception or it is still
+            running after timeout) and timed out flag
+        """
+        hooks_logger.debug(
+            "Calling %s(%s)", action, ", ".join(map(repr, callback.args)))
+        result = []
+
+        def target():
+            try:
+                callback()
+                result.append(0)
+            except Exception as e:
+                hooks_logger.error(
+                    'Hook "%s" failed: %s', action, e, exc_info=True)
+                result.append(None)
+
+        thread = threading.Thread(
+            target=target, name="Hook-" + action, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        if thread.is_alive():  # a thread cannot be killed
+            hooks_logger.error(
+                'Hook "%s" still running after %s seconds: abandoned',
+                action, self.timeout)
+            return None, True
+        return result[0], False
+
+    def spawn(self, action, command):
+        """ run the external program: return exit code (None if it could
+            not be run or it was killed) and timed out flag
+        """
+        hooks_logger.debug("Running %s", " ".join(command))
+        exit_code = None
+        timed_out = False
+        start = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                command, stdin=subprocess.DEVNULL, start_new_session=True)
+            try:
+                exit_code = process.wait(self.timeout)
+            except subprocess.TimeoutExpired:
+                timed_out = True
+                hooks_logger.error(
+                    '%s "%s" killed after %s seconds',
+                    command[0], action, self.timeout)
+                try:  # including its children
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+                process.wait()
+        except OSError as e:
+            hooks_logger.error("Cannot run %s: %s", command[0], e)
+        hooks_logger.debug(
+            "%s completed with exit code %s in %.3f seconds",
+            command[0], exit_code, time.monotonic() - start)
+        return exit_code, timed_out
+
+    def shutdown(self, wait=True):
+        """ wait=True: complete the queued commands """
+        self.executor.shutdown(wait=wait)
+
+
+class EnrollerThread(threading.Thread):
+    """
+    Enroller running in a thread of the Core process (enroller_mode
+    "thread"), with the interface of the Enroller process used by the
+    Core: pid, sentinel (readable when the thread ends), exitcode,
+    terminate() and send_signal(), which emulates the signals sent to
+    the Enroller process (SIGUSR1: statistics; SIGHUP: configuration).
+    hostp2pd is the Enroller instance, core the Core instance.
+    """
+
+    def __init__(self, core, hostp2pd):
+        super().__init__(name="Enroller", daemon=True)
+        self.core = core
+        self.hostp2pd = hostp2pd
+        self.pid = os.getpid()
+        self.sentinel, self.sentinel_w = os.pipe()
+        self.exitcode = None
+
+    def run(self):
+        self.exitcode = 1
+        try:
+            self.hostp2pd.run()
+            self.exitcode = 0
+        except Exception as e:
+            enroller_logger.critical(
+                "PANIC - Internal error in the Enroller thread: %s",
+                e, exc_info=True)
+        finally:
+            os.close(self.sentinel_w)  # the sentinel gets EOF
+
+    def join(self, timeout=None):
+        super().join(timeout)
+        if not self.is_alive() and self.sentinel is not None:
+            os.close(self.sentinel)
+            self.sentinel = None
+
+    def terminate(self):
+        self.hostp2pd.terminate()
+
+    def send_signal(self, signum):
+        if signum == signal.SIGUSR1:
+            self.hostp2pd.request_statistics()
+        elif signum == signal.SIGHUP:
+            self.hostp2pd.copy_configuration(self.core)
+            self.hostp2pd.do_activation = True
+
+
+class Redactor(object):
+    """
+    Set of the secrets and passwords to be masked in the logs, shared by
+    the RedactingFormatter of all handlers. The secrets are matched by a
+    single precompiled regular expression, rebuilt when a secret is added.
+    Permanent secrets (the configured ones) are always masked; of the
+    rotating ones (e.g., a new PIN for each connection, or the passwords
+    found in the logs), only the most recent max_secrets are kept, so that
+    the cost of masking a record does not grow with the uptime.
+    Masked items:
+    - psk "password" (hardcoded here)
+    - passphrase="password" (hardcoded here)
+    - all items added with add()
+    """
+    max_secrets = 100
+    find_secret = re.compile(r'[ \t]+(?:psk[ \t]+|passphrase=)("?[^" \t\']*")')
+
+    def __init__(self, mask="********"):
+        self.mask = mask
+        self.permanent = set()  # never evicted
+        self.secrets = OrderedDict()  # rotating secret: None (insertion order)
+        self.matcher = None  # regular expression matching all secrets
+        self.lock = threading.Lock()
+
+    def add(self, secrets, permanent=False):
+        with self.lock:
+            changed = False
+            for secret in secrets:
+                if not secret or not isinstance(secret, str):
+                    continue
+                if secret in self.permanent:
+                    continue
+                if permanent:
+                    self.secrets.pop(secret, None)
+                    self.permanent.add(secret)
+                    changed = True
+                    continue
+                if secret in self.secrets:
+                    self.secrets.move_to_end(secret)
+                    continue
+                self.secrets[secret] = None
+                changed = True
+                if len(self.secrets) > self.max_secrets:
+                    self.secrets.popitem(last=False)
+            if changed:  # longest first, so that it is entirely masked
+                self.matcher = re.compile("|".join(
+                    re.escape(secret) for secret in
+                    sorted(self.permanent.union(self.secrets),
+                           key=len, reverse=True)))
+
+    def redact(self, msg):
+        if "psk" in msg or "passphrase=" in msg:
+            self.add(self.find_secret.findall(msg))
+        matcher = self.matcher
+        if matcher is None:
+            return msg
+        return matcher.sub(self.mask, msg)
+
+
+redactor = Redactor()
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    """ QueueHandler dropping (and counting) the records when the queue
+        is full, instead of blocking the caller
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # formatted by the handlers of the listener: only merge the
+        # arguments, which might change before being formatted
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+
+class LogQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)  # wait for room in the queue
+
+
+class LogQueue(object):
+    """
+    Asynchronous logging (log_queue_size): the handlers of the root logger
+    are run by a listener thread, behind a LogQueueHandler with a queue of
+    "size" records, so that the Core and the Enroller do not wait for the
+    formatting and the writing of the logs.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.root = logging.getLogger()
+        self.handlers = self.root.handlers[:]
+        self.handler = LogQueueHandler(Queue(size))
+        for handler in self.handlers:
+            self.root.removeHandler(handler)
+        self.root.addHandler(self.handler)
+        self.listener = None
+        self.start()
+
+    def start(self):
+        self.listener = LogQueueListener(
+            self.handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def restart(self):
+        """ in the Enroller process, where the listener thread of the
+            Core is not running
+        """
+        self.handler.queue = Queue(self.size)
+        self.start()
+
+    def stop(self):
+        """ write the queued records and give the handlers back to the
+            root logger
+        """
+        self.listener.stop()
+        self.root.removeHandler(self.handler)
+        for handler in self.handlers:
+            self.root.addHandler(handler)
+
+
+log_queue = None  # LogQueue, if asynchronous logging is enabled
+
+
+def queue_logging(size):
+    """
+    Enable asynchronous logging with a queue of "size" records, or
+    disable it (size = 0)
+    """
+    global log_queue
+    if log_queue is not None:
+        if log_queue.size == size:
+            return
+        log_queue.stop()
+        log_queue = None
+    if size and size > 0:
+        log_queue = LogQueue(size)
+
+
+class LogRateLimiter(object):
+    """
+    Per-event limit of the debug logs (log_rate_limits): the lines of the
+    event "name" are logged at most limits[name] times in each period of
+    "interval" seconds; the following ones are suppressed and counted,
+    then summarized by a "suppressed N similar messages" log when the
+    period ends (see flush()).
+    """
+
+    def __init__(self, limits, interval):
+        self.limits = dict(limits or {})
+        self.interval = interval
+        self.periods = {}  # name: [start time, logged, suppressed]
+        self.suppressed = 0  # total number of suppressed lines
+
+    def allow(self, name, logger):
+        limit = self.limits.get(name)
+        if limit is None:
+            return True
+        now = time.monotonic()
+        period = self.periods.get(name)
+        if period is None or now - period[0] >= self.interval:
+            self.summarize(name, logger)
+            period = self.periods[name] = [now, 0, 0]
+        if period[1] < limit:
+            period[1] += 1
+            return True
+        period[2] += 1
+        self.suppressed += 1
+        return False
+
+    def summarize(self, name, logger):
+        period = self.periods.pop(name, None)
+        if period and period[2]:
+            logger.debug(
+                "%s: suppressed %s similar messages", name, period[2])
+
+    def flush(self, logger):
+        """ summarize the ended periods """
+        now = time.monotonic()
+        for name, period in list(self.periods.items()):
+            if now - period[0] >= self.interval:
+                self.summarize(name, logger)
+
+
+class RedactingFormatter(object):
+    """
+    Logging formatter that masks sensitive data like secrets and passwords
+    from logging, through the shared Redactor. A handler is wrapped once:
+    see hide_from_logging().
+    """
+
+    def __init__(self, orig_formatter, redactor):
+        self.orig_formatter = orig_formatter
+        self.redactor = redactor
+
+    def format(self, record):
+        return self.redactor.redact(self.orig_formatter.format(record))
 
     def __getattr__(self, attr):
         return getattr(self.orig_formatter, attr)
 
 
-def hide_from_logging(password_list, mask):
+def hide_from_logging(password_list, mask, permanent=False):
     """
-    Loop to all root log handlers adding a formatter plugin to hide
-    secrets and passwords from logging
+    Add secrets and passwords to be hidden from logging, wrapping the
+    formatter of the root log handlers which are not yet redacted;
+    permanent secrets are never evicted (see Redactor)
     """
+    redactor.mask = mask
+    redactor.add(password_list, permanent)
     root = logging.getLogger()
-    if root and root.handlers:
-        for h in root.handlers:
-            h.setFormatter(
-                RedactingFormatter(
-                    h.formatter, patterns=password_list, mask=mask
-                )
-            )
+    handlers = root.handlers if log_queue is None else log_queue.handlers
+    if handlers:
+        for h in handlers:
+            if not isinstance(h.formatter, RedactingFormatter):
+                h.setFormatter(RedactingFormatter(
+                    h.formatter or logging.Formatter(), redactor))
 
 
 def get_type(value, conf_schema):
@@ -108,7 +1404,7 @@ def get_type(value, conf_schema):
             return {key: get_type(value[key], conf_schema) for key in value}
         for key in value:
             if key not in conf_schema:
-                logging.critical(
+                config_logger.critical(
                     'Configuration Error: unknown parameter "%s" '
                     "in configuration file.",
                     key,
@@ -122,7 +1418,7 @@ def get_type(value, conf_schema):
         if ret_val == "<class 'NoneType'>":
             ret_val = conf_schema
         if conf_schema is not None and conf_schema != ret_val:
-            logging.critical(
+            config_logger.critical(
                 'Configuration Error: "%s" shall be "%s" and not "%s".',
                 value,
                 conf_schema,
@@ -227,15 +1523,33 @@ class HostP2pD:
         # Greater numbers: 0x0010 to 0xFFFF - Randomly generated value for Password given to the Enrollee or Registrar via an Out-of-Band Device Password attribute.
     }
 
-    select_timeout_secs = {  # see read_wpa() and find_timing_level
-        "normal": 10,    # seconds. Period to send p2p_find refreshes
+    select_timeout_secs = {  # see refresh_find() and find_timing_level
+        "normal": 10,    # seconds. Initial period of the adaptive p2p_find refreshes
         "connect": 90,   # seconds. Increased timing while p2p_connect
-        "long": 600,     # seconds. Period to send p2p_find refreshes after exceeding self.max_scan_polling
+        "long": 600,     # seconds. Max period of the adaptive p2p_find refreshes
         "enroller": 600, # seconds. Period used by the enroller
     }
 
     p2p_client = "wpa_cli"             # wpa_cli program name
+    wpa_transport = "wpa_cli"          # "wpa_cli" (subprocess via pty) or "socket" (wpa_supplicant control interface)
+    ctrl_interface = "/var/run/wpa_supplicant" # wpa_supplicant control interface directory (used by the "socket" transport)
     min_conn_delay = 40                # seconds delay before issuing another p2p_connect or enroll
+    command_timeout = 10               # seconds. Time to wait for the reply of a wpa_supplicant command
+    max_queued_events = 100            # max number of queued events before dropping the discovery ones
+    confirm_timeout = 2                # seconds. Max time to wait for P2P-FIND-STOPPED or P2P-GROUP-REMOVED
+    check_interval = 5                 # seconds. Period of the wpa_cli liveness check (when process exits cannot be watched)
+    restart_delay = 1                  # seconds. Initial delay before restarting wpa_cli or the Enroller when they die (doubled at each failure)
+    max_restart_delay = 60             # seconds. Max delay before restarting wpa_cli or the Enroller
+    statistics_interval = 5            # seconds. Period of the statistics sent by the Enroller to the Core
+    metrics_address = None             # "host:port" (HTTP) or unix socket path of the OpenMetrics exporter (None = disabled)
+    log_queue_size = 0                 # >0: log handlers run by a thread, behind a queue of this size (records dropped when full)
+    warm_enroller = False              # Keep a standby Enroller, configured and connected, to be attached to the next group (one more process)
+    enroller_mode = "process"          # "process" (Enroller subprocess) or "thread" (Enroller thread of the Core, for low-memory devices)
+    hook_workers = 2                   # max number of run_program executions in parallel
+    hook_timeout = 30                  # seconds. Max run time of run_program, then it is killed (a hook_module function is abandoned)
+    hook_module = None                 # external Python module with the on_<action> callbacks of run_program actions
+    coalesce_hooks = False             # drop the queued "connect" of a station with its "disconnect"
+    min_find_interval = 5              # seconds. Min period of the adaptive p2p_find refreshes (max: select_timeout_secs long)
     max_num_failures = 3               # max number of retries for a p2p_connect
     max_num_wpa_cli_failures = 9       # max number of wpa_cli errors
     max_scan_polling = 2               # max number of p2p_find consecutive polling (0=infinite number)
@@ -263,6 +1577,14 @@ class HostP2pD:
         'CTRL-EVENT-SCAN-STARTED',
         'CTRL-EVENT-SCAN-RESULTS'
     ]
+    log_rate_limits = {                # max number of debug logs of the events in each log_rate_interval (then suppressed)
+        'P2P-DEVICE-FOUND': 10,
+        'RX-PROBE-REQUEST': 10,
+        'CTRL-EVENT-EAP-RETRANSMIT': 10,
+        'P2P-FIND-STOPPED': 10,
+    }
+    log_rate_interval = 60             # seconds. Period of log_rate_limits
+    log_levels = {}                    # logging level of the components (core, enroller, transport, hooks, config)
     conf_schema = """
 %YAML 1.1
 ---
@@ -271,7 +1593,25 @@ select_timeout_secs:
   connect: <class 'float'>
   long: <class 'float'>
 p2p_client: <class 'str'>
+wpa_transport: <class 'str'>
+ctrl_interface: <class 'str'>
 min_conn_delay: <class 'float'>
+command_timeout: <class 'float'>
+max_queued_events: <class 'int'>
+confirm_timeout: <class 'float'>
+check_interval: <class 'float'>
+restart_delay: <class 'float'>
+max_restart_delay: <class 'float'>
+statistics_interval: <class 'float'>
+metrics_address: <class 'str'>
+log_queue_size: <class 'int'>
+warm_enroller: <class 'bool'>
+enroller_mode: <class 'str'>
+hook_workers: <class 'int'>
+hook_timeout: <class 'float'>
+hook_module: <class 'str'>
+coalesce_hooks: <class 'bool'>
+min_find_interval: <class 'float'>
 max_num_failures: <class 'float'>
 max_num_wpa_cli_failures: <class 'float'>
 max_scan_polling: <class 'float'>
@@ -294,6 +1634,10 @@ run_program: <class 'str'>
 pbc_white_list: <class 'list'>
 network_parms: <class 'list'>
 config_parms: <class 'open_dict'>
+do_not_debug: <class 'list'>
+log_rate_limits: <class 'open_dict'>
+log_rate_interval: <class 'float'>
+log_levels: <class 'open_dict'>
 """
 
     ################# End of static configuration ##################################
@@ -337,7 +1681,7 @@ config_parms: <class 'open_dict'>
                         config = yaml.safe_load(f.read())
                     except Exception as e:
                         config = None
-                        logging.critical(
+                        config_logger.critical(
                             'Cannot parse YAML configuration file "%s": %s.',
                             self.config_file,
                             e,
@@ -345,12 +1689,15 @@ config_parms: <class 'open_dict'>
                         success = False
                     # Logging configuration ('logging' section)
                     if self.force_logging is None:
+                        queue_logging(0)  # handlers replaced by dictConfig
                         if config and "logging" in config:
                             try:
                                 logging.config.dictConfig(config["logging"])
+                                for logger in LOGGERS.values():
+                                    logger.disabled = False  # disable_existing_loggers
                             except Exception as e:
                                 logging.basicConfig(level=default_level)
-                                logging.critical(
+                                config_logger.critical(
                                     'Wrong "logging" section in YAML '
                                     'configuration file "%s": %s.',
                                     self.config_file,
@@ -358,7 +1705,7 @@ config_parms: <class 'open_dict'>
                                 )
                                 success = False
                         else:
-                            logging.warning(
+                            config_logger.warning(
                                 'Missing "logging" section in YAML '
                                 'configuration file "%s".',
                                 self.config_file,
@@ -379,7 +1726,7 @@ config_parms: <class 'open_dict'>
                         if types:
                             for key, val in types.items():
                                 if val is None:
-                                    logging.critical(
+                                    config_logger.critical(
                                         'Invalid parameter: "%s".', key
                                     )
                                     types = None
@@ -392,7 +1739,7 @@ config_parms: <class 'open_dict'>
                                         and self.interface == "auto"):
                                     self.interface = old_interface
                             except Exception as e:
-                                logging.critical(
+                                config_logger.critical(
                                     'Wrong "hostp2pd" section in YAML '
                                     'configuration file "%s": %s.',
                                     self.config_file,
@@ -400,14 +1747,14 @@ config_parms: <class 'open_dict'>
                                 )
                                 success = False
                     else:
-                        logging.debug(
+                        config_logger.debug(
                             'Missing "hostp2pd" section in YAML '
                             'configuration file "%s".',
                             self.config_file,
                         )
                         # success = False
             except (PermissionError, FileNotFoundError) as e:
-                logging.critical(
+                config_logger.critical(
                     'Cannot open YAML configuration file "%s": %s.',
                     self.config_file,
                     e,
@@ -416,7 +1763,7 @@ config_parms: <class 'open_dict'>
         else:
             logging.basicConfig(level=default_level)
             if configuration_file == "reset":
-                logging.debug("Resetting configuration to default values")
+                config_logger.debug("Resetting configuration to default values")
                 self.config_file = None
                 if self.force_logging is None:
                     logging.basicConfig(level=default_level)
@@ -424,79 +1771,117 @@ config_parms: <class 'open_dict'>
                     self.logger.setLevel(self.force_logging)
             else:
                 if self.config_file:
-                    logging.critical(
+                    config_logger.critical(
                         'Cannot find YAML configuration file "%s".',
                         self.config_file,
                     )
                     success = False
-        # logging.debug("YAML configuration logging pathname: %s", self.config_file)
-        self.last_pwd = self.get_pin(self.pin)
-        hide_from_logging([self.last_pwd], "********")
+        # config_logger.debug("YAML configuration logging pathname: %s", self.config_file)
+        self.apply_configuration()
         if do_activation:
             if not self.is_enroller:
-                logging.debug(
-                    'Reloading "wpa_supplicant" configuration file...')
-                self.threadState = self.THREAD.PAUSED
-                time.sleep(0.1)
-                self.write_wpa("ping")
-                time.sleep(0.1)
-                self.write_wpa("ping")
-                time.sleep(0.1)
-                self.write_wpa("reconfigure")
-                cmd_timeout = time.time()
-                error = 0
-                while True:  # Wait 'OK' before continuing
-                    input_line = self.read_wpa()
-                    if input_line is None:
-                        if error > self.max_num_failures:
-                            logging.error(
-                                "Internal Error (read_configuration): "
-                                "read_wpa() abnormally terminated"
-                            )
-                            self.terminate_enrol()
-                            self.terminate()
-                        logging.error("no data (read_configuration)")
-                        time.sleep(0.5)
-                        error += 1
-                        continue
-                    error = 0
-                    logging.debug("(reconfigure) Read '%s'", input_line)
-                    if self.warn_on_input_errors(input_line):
-                        continue
-                    if time.time() > cmd_timeout + self.min_conn_delay:
-                        logging.debug(
-                            'Terminating reloading "wpa_supplicant" '
-                            "configuration file after timeout "
-                            "of %s seconds",
-                            self.min_conn_delay,
-                        )
-                        break
-                    if "OK" in input_line:
-                        logging.debug('"wpa_supplicant" configuration reloaded.')
-                        self.configure_wpa()
-                        break
-                    logging.debug("(reconfigure) PUSH '%s'", input_line)
-                    self.stack.append(input_line)
-                self.threadState = self.THREAD.ACTIVE
+                self.reload_wpa_configuration()
             self.do_activation = True
         if success:
             if self.check_enrol():
-                os.kill(
-                    self.enroller.pid, signal.SIGHUP
+                self.signal_enroller(
+                    self.enroller, signal.SIGHUP
                 )  # Ask the enroller to reload its configuration
-            logging.debug("Configuration successfully loaded.")
+            if self.standby is not None:
+                if (
+                        self.warm_enroller
+                        and self.enroller_mode != "thread"
+                        and self.standby.is_alive()
+                ):
+                    os.kill(self.standby.pid, signal.SIGHUP)
+                else:
+                    self.stop_standby()
+            config_logger.debug("Configuration successfully loaded.")
         else:
-            logging.error("Loading configuration failed.")
+            config_logger.error("Loading configuration failed.")
+        return success
+
+    def set_log_levels(self, log_levels):
+        """ set the logging level of the components in the dictionary
+            (component: level name or number); return False in case of
+            invalid component or level
+        """
+        success = True
+        for component, level in (log_levels or {}).items():
+            if isinstance(level, str) and not level.isnumeric():
+                level = logging.getLevelName(level.upper())
+            try:
+                level = int(level)
+            except (TypeError, ValueError):
+                level = None
+            if component not in LOGGERS:
+                config_logger.error('Invalid logging component "%s".', component)
+                success = False
+                continue
+            if level is None:
+                config_logger.error(
+                    'Invalid logging level "%s" of component "%s".',
+                    log_levels[component], component)
+                success = False
+                continue
+            LOGGERS[component].setLevel(level)
         return success
 
+    def apply_configuration(self):
+        """ update the objects depending on the configuration settings """
+        self.event_queue.max_size = self.max_queued_events
+        for supervisor in (self.process_supervisor, self.enroller_supervisor):
+            supervisor.min_delay = self.restart_delay
+            supervisor.max_delay = self.max_restart_delay
+        self.scan_governor = self.new_scan_governor()
+        self.no_debug_events = frozenset(self.do_not_debug or [])
+        self.log_limiter.limits = dict(self.log_rate_limits or {})
+        self.log_limiter.interval = self.log_rate_interval
+        queue_logging(self.log_queue_size)
+        self.set_log_levels(self.log_levels)
+        self.last_pwd = self.get_pin(self.pin)
+        hide_from_logging([self.pin, self.last_pwd], "********", True)
+        if self.hook_executor is not None:
+            self.hook_executor.timeout = self.hook_timeout
+            self.hook_executor.coalesce = self.coalesce_hooks
+        if self.hook_module != self.loaded_hook_module:
+            self.load_hook_module()
+        if not self.is_enroller and self.channel is not None:  # running Core
+            self.start_exporter()
+
+    def copy_configuration(self, hostp2pd):
+        """ apply the configuration settings of another instance: the
+            Enroller thread does not read the configuration file, which
+            would also reconfigure the logging of the Core
+        """
+        for name in list(yaml.safe_load(self.conf_schema)) + [
+                "config_file", "enroller_handlers"]:
+            if name in hostp2pd.__dict__ and name != "interface":
+                setattr(self, name, copy.deepcopy(getattr(hostp2pd, name)))
+        self.apply_configuration()
+
+    def reload_wpa_configuration(self):
+        """ reload the wpa_supplicant configuration file and apply
+            config_parms (see reconfigure_wpa()); also invoked by other
+            threads and by signal handlers
+        """
+        loop = self.loop
+        if loop is None:  # the activation will configure wpa_supplicant
+            return
+        procedure = self.reconfigure_wpa()
+        try:
+            loop.call_soon_threadsafe(self.schedule, procedure)
+        except RuntimeError:  # loop already closed
+            procedure.close()
+
     def reset(self, sleep=0):
         """
         Resets statistics and address registers to their defaults
         """
-        logging.debug(
+        self.log.debug(
             "Resetting statistics and sleeping for %s seconds", sleep)
         time.sleep(sleep)
-        self.statistics = {}
+        self.metrics.reset()
         self.addr_register = {}
         self.dev_type_register = {}
 
@@ -509,26 +1894,58 @@ config_parms: <class 'open_dict'>
         self.station = None
         self.wpa_supplicant_errors = 0
         self.run_prog_stopped = False
+        self.hook_executor = None  # HookExecutor running run_program
+        self.hook_callbacks = {}  # action: callback of hook_module
+        self.loaded_hook_module = None  # hook_module of hook_callbacks
         self.scan_polling = 0
         self.process = None
+        self.process_fd = None  # pidfd of the wpa_cli process
+        self.child_fds = {}  # fd becoming readable when a child exits: callback
+        self.process_supervisor = Supervisor(
+            self.restart_delay, self.max_restart_delay)
+        self.enroller_supervisor = Supervisor(
+            self.restart_delay, self.max_restart_delay)
+        self.wpa_ctrl = None
+        self.reader = None
         self.thread = None
         self.threadState = self.THREAD.STOPPED
         self.master_fd = None
         self.slave_fd = None
         self.ssid_group = None
         self.do_activation = False
+        self.do_resync = False  # resync() requested by a reconnection
+        self.synced_state = None  # state applied by activate(), see resync()
+        self.scheduler = Scheduler()  # timers of the engine
+        self.scan_governor = self.new_scan_governor()
+        self.no_debug_events = frozenset(self.do_not_debug or [])
+        self.log_limiter = LogRateLimiter(
+            self.log_rate_limits, self.log_rate_interval)
+        self.logged_line = None  # last line evaluated by log_event()
+        self.log_line = True  # log_event() result of logged_line
         self.find_timing_level = "normal"
         self.config_method_in_use = ""
         self.use_enroller = True  # False = run obsolete procedure instead of Enroller
         self.is_enroller = False  # False if I am Core, True if I am Enroller
         self.enroller = None  # Core can check this to know whether Enroller is active
+        self.standby = None  # warm Enroller waiting for a group (run_standby)
+        self.standby_fd = None  # pipe sending the group name to the standby
+        self.is_warm = False  # Enroller configured before attaching the group
+        self.is_thread = False  # Enroller running in a thread of the Core
+        self.group_start_times = {}  # run_enrol() time of the latencies to measure
+        self.enroller_starts = {"warm": 0, "cold": 0, "thread": 0}
+        self.wps_responded = False  # Enroller sent HOSTP2PD_WPS_RESPONSE
         self.terminate_is_active = False  # silence read/write errors if terminating
-        self.statistics = {}
+        self.metrics = Metrics()  # counters, gauges and histograms
+        self.exporter = None  # MetricsExporter of the Core (metrics_address)
+        self.pending_statistics = {}  # events accounted by the Enroller
+        self.statistics_received = threading.Event()  # sent by the Enroller
         self.addr_register = {}
         self.dev_type_register = {}
         self.is_daemon = False
         self.last_pwd = None
-        self.stack = []
+        self.event_queue = EventQueue(self.max_queued_events)
+        self.do_flush_statistics = False  # requested before the engine runs
+        self.channel = None  # messages of the Enroller to the Core
 
     def __init__(
             self,
@@ -547,6 +1964,18 @@ config_parms: <class 'open_dict'>
         self.logger = logging.getLogger()
         self.set_defaults()
 
+        # State of the engine (see run_async()), kept by set_defaults()
+        self.loop = None  # asyncio event loop running the engine
+        self.loop_thread = None  # thread running the event loop
+        self.ready = None  # set when event_queue has lines for handle()
+        self.procedures = None  # queue of the procedures run in sequence
+        self.pending = []  # wpa_cli commands waiting for their reply
+        self.unsent = []  # commands to be sent in the current iteration
+        self.waiters = []  # futures waiting for a specific event
+        self.executor = None  # thread sending commands to the ctrl interface
+        self.event_fd = None  # control interface socket watched by the loop
+        self.switching = 0  # number of pending "interface" commands
+
         # Argument handling
         self.config_file = config_file
         self.interface = interface
@@ -556,14 +1985,25 @@ config_parms: <class 'open_dict'>
         self.pin = pin
         global get_pin
         self.get_pin = get_pin
+        self.core_handlers = dict(self.core_handlers)  # see register_handler()
+        self.enroller_handlers = dict(self.enroller_handlers)
 
     def start_process(self):
         """
-        Run an external subprocess interconnected via pty, disabling echo
+        Run an external subprocess interconnected via pty, disabling echo,
+        or connect the wpa_supplicant control interface (wpa_transport)
         """
+        if self.wpa_transport == "socket":
+            return self.start_wpa_ctrl()
+        if self.wpa_transport != "wpa_cli":
+            transport_logger.critical(
+                'PANIC - Invalid wpa_transport "%s".', self.wpa_transport)
+            return False
+
         # make a new pty
         self.master_fd, self.slave_fd = pty.openpty()
         self.slave_name = os.ttyname(self.slave_fd)
+        self.reader = LineReader(self.master_fd)
 
         # Disable echo
         no_echo = termios.tcgetattr(self.slave_fd)
@@ -574,7 +2014,13 @@ config_parms: <class 'open_dict'>
         if 'HOME' in os.environ:
             del os.environ['HOME']
 
-        # Start process connected to the slave pty
+        return self.spawn_process()
+
+    def spawn_process(self):
+        """
+        Start wpa_cli connected to the slave pty, watching its termination
+        """
+        self.close_process_fd()
         if self.interface == "auto":
             command = [self.p2p_client]
         else:
@@ -590,14 +2036,44 @@ config_parms: <class 'open_dict'>
                 universal_newlines=True,
             )
         except FileNotFoundError as e:
-            logging.critical('PANIC - Cannot run "wpa_cli" software: %s', e)
+            transport_logger.critical('PANIC - Cannot run "wpa_cli" software: %s', e)
             return False
+        try:
+            self.process_fd = os.pidfd_open(self.process.pid)
+        except (AttributeError, OSError):  # Python < 3.9 or Linux < 5.3
+            self.process_fd = None  # check_liveness() polls the process
+        else:
+            self.watch_child(self.process_fd, self.process_exited)
+        return True
+
+    def close_process_fd(self):
+        process_fd, self.process_fd = self.process_fd, None
+        if process_fd is None:
+            return
+        self.unwatch_child(process_fd)
+        try:
+            os.close(process_fd)
+        except OSError:
+            pass
+
+    def start_wpa_ctrl(self):
+        """
+        Connect the wpa_supplicant control interface without wpa_cli
+        """
+        self.wpa_ctrl = WpaCtrl(self.ctrl_interface, self.interface)
+        if self.wpa_ctrl.open():
+            transport_logger.debug(
+                'Connected to control interface "%s".',
+                os.path.join(self.ctrl_interface, self.wpa_ctrl.interface),
+            )
+            self.wpa_ctrl.lines.append("Interactive mode")  # start activation
         return True
 
     def __enter__(self):
         """
         Activated when starting the Context Manager
         """
+        self.read_configuration(configuration_file=self.config_file)
         if not self.start_process():
             return None
         threading.current_thread().name = "Main"
@@ -622,14 +2098,21 @@ config_parms: <class 'open_dict'>
         if self.terminate_is_active:
             return False
         self.terminate_is_active = True
-        logging.debug("Start termination procedure.")
+        self.log.debug("Start termination procedure.")
+        loop = self.loop
+        if loop is not None:  # stop the engine
+            try:
+                loop.call_soon_threadsafe(self.stop)
+            except RuntimeError:  # loop already closed
+                pass
         self.terminate_enrol()
+        self.stop_standby()
         if self.thread and self.threadState != self.THREAD.STOPPED:
             time.sleep(0.1)
             try:
                 self.thread.join(1)
             except:
-                logging.debug("Cannot join current thread.")
+                self.log.debug("Cannot join current thread.")
             self.thread = None
         self.threadState = self.THREAD.STOPPED
         try:
@@ -638,109 +2121,465 @@ config_parms: <class 'open_dict'>
             if self.master_fd:
                 os.close(self.master_fd)
         except:
-            logging.debug("Cannot close file descriptors.")
+            self.log.debug("Cannot close file descriptors.")
+        if self.channel is not None:
+            if not self.is_thread:  # the Enroller thread shares it
+                self.channel.close()
+            self.channel = None
         if not self.is_enroller:
             self.external_program(self.EXTERNAL_PROG_ACTION.TERMINATED)
-        if self.process is not None:
-            self.process.terminate()
-            try:
-                self.process.wait(1)
-            except:
-                logging.debug("wpa_cli process not terminated.")
+        if self.hook_executor is not None:
+            self.hook_executor.shutdown()
+            self.hook_executor = None
+        if self.exporter is not None:
+            self.exporter.stop()
+            self.exporter = None
+        is_thread = self.is_thread  # logging shared with the Core
+        log = self.log  # the Enroller logger is reset by set_defaults()
+        if self.process is not None or self.wpa_ctrl is not None:
+            if self.process is not None:
+                self.close_process_fd()
+                self.process.terminate()
+                try:
+                    self.process.wait(1)
+                except:
+                    self.log.debug("wpa_cli process not terminated.")
+            if self.wpa_ctrl is not None:
+                self.wpa_ctrl.close()
             self.set_defaults()
-        logging.debug("Terminated.")
+        log.debug("Terminated.")
+        if not is_thread:  # write the queued log records
+            queue_logging(0)
         return True
 
     def run_enrol(self, child=False):
         """
-        Core starts the Enroller child; child activates itself
+        Core starts the Enroller child, or attaches the standby one to the
+        group (see run_standby()); child activates itself
         """
         if not child and self.check_enrol():
             return  # Avoid double instance of the Enroller process
         if child:  # I am Enroller
-            threading.current_thread().name = "Enroller"
-            self.enroller.name = threading.current_thread().name
-
-            # Receive SIGTERM if the father dies
-            libc = ctypes.CDLL(find_library("c"))
-            PR_SET_PDEATHSIG = 1  # <sys/prctl.h>
-            libc.prctl(PR_SET_PDEATHSIG, signal.SIGTERM, 0, 0, 0)
-
-            self.wpa_supplicant_errors = 0
+            self.prepare_enroller()
             if not self.monitor_group:
-                logging.critical("PANIC - Internal error: null monitor_group")
+                self.log.critical("PANIC - Internal error: null monitor_group")
                 return
-            self.is_enroller = True
-            self.father_slave_fd = self.slave_fd
             self.interface = self.monitor_group
-            signal.SIGTERM: lambda signum, frame: self.terminate()
-            signal.SIGINT: lambda signum, frame: self.terminate()
-            signal.signal(  # Allow reloading Enroller configuration with SIGHUP
-                signal.SIGHUP,
-                lambda signum, frame: self.read_configuration(
-                    configuration_file=self.config_file, do_activation=True
-                ),
-            )
-            try:
-                self.run()
-            except KeyboardInterrupt:
-                logging.debug("Enroller interrupted.")
-                self.terminate()
-                return None
+            self.run_child()
         else:  # I am Core
-            self.enroller = Process(target=self.run_enrol, args=(True,))
-            self.enroller.daemon = True
-            self.enroller.start()
-            logging.debug(
-                "Starting enroller process with PID %s", self.enroller.pid
-            )
+            start_time = time.monotonic()
+            self.group_start_times = dict.fromkeys(
+                ("ready", "wps"), start_time)
+            if self.enroller_mode == "thread":
+                self.enroller = self.start_thread()
+                self.enroller_starts["thread"] += 1
+                self.log.debug("Starting enroller thread")
+            else:
+                if self.attach_standby(self.monitor_group):
+                    self.enroller_starts["warm"] += 1
+                else:
+                    self.enroller = self.start_child(self.run_enrol, (True,))
+                    self.enroller_starts["cold"] += 1
+                self.log.debug(
+                    "Starting enroller process with PID %s",
+                    self.enroller.pid
+                )
+            self.watch_child(self.enroller.sentinel, self.enroller_exited)
 
-    def check_enrol(self):
+    def start_child(self, target, args):
         """
-        Core checks whether Enroller process is active
+        Core forks an Enroller process; SIGUSR1 and SIGHUP are blocked
+        until the Enroller installs its handlers (see prepare_enroller())
         """
-        if (
-                self.use_enroller
-                and not self.is_enroller
-                and self.enroller is not None
-                and self.enroller.is_alive()
-                and self.enroller.pid > 0
-        ):
-            return True
-        return False
+        child = Process(target=target, args=args)
+        child.daemon = True
+        signals = {signal.SIGUSR1, signal.SIGHUP}
+        signal.pthread_sigmask(signal.SIG_BLOCK, signals)
+        try:
+            child.start()
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, signals)
+        return child
 
-    def terminate_enrol(self):
+    def start_thread(self):
         """
-        Core terminates active Enroller process
+        Core starts the Enroller in a thread, with its own connection to
+        the group interface (see EnrollerThread)
         """
-        if self.check_enrol():
-            enroller = self.enroller
-            self.enroller = None
-            logging.debug("Terminating Enroller process.")
-            time.sleep(0.5)
-            enroller.terminate()
-            enroller.join(2)
-            logging.debug("Enroller process terminated.")
+        enroller = type(self)(config_file=self.config_file)
+        enroller.hook_callbacks = self.hook_callbacks  # module already loaded
+        enroller.loaded_hook_module = self.loaded_hook_module
+        enroller.copy_configuration(self)
+        enroller.is_enroller = True
+        enroller.is_thread = True
+        enroller.interface = self.monitor_group
+        enroller.monitor_group = self.monitor_group
+        enroller.ssid_group = self.ssid_group
+        enroller.channel = self.channel
+        enroller.threadState = self.THREAD.STARTING
+        thread = EnrollerThread(self, enroller)
+        thread.start()
+        return thread
+
+    def signal_enroller(self, enroller, signum):
+        """
+        Core sends a signal to the Enroller process (emulated by the
+        Enroller thread)
+        """
+        if isinstance(enroller, EnrollerThread):
+            enroller.send_signal(signum)
+        else:
+            os.kill(enroller.pid, signum)
 
-    def run(self):
-        """ Main procedure """
-        if os.getppid() == 1 and os.getpgrp() == os.getsid(0):
+    def prepare_enroller(self):
+        """
+        Enroller drops the resources inherited from the Core and installs
+        its signal handlers
+        """
+        if log_queue is not None:  # the listener thread of the Core
+            log_queue.restart()
+        threading.current_thread().name = "Enroller"
+
+        # Receive SIGTERM if the father dies
+        libc = ctypes.CDLL(find_library("c"))
+        PR_SET_PDEATHSIG = 1  # <sys/prctl.h>
+        libc.prctl(PR_SET_PDEATHSIG, signal.SIGTERM, 0, 0, 0)
+
+        self.wpa_supplicant_errors = 0
+        self.is_enroller = True
+        self.child_fds = {}  # the children of the Core are not mine
+        self.close_process_fd()
+        self.process = None  # wpa_cli of the Core
+        if self.wpa_ctrl is not None:  # sockets shared with the Core
+            self.wpa_ctrl.close(release=False)
+            self.wpa_ctrl = None
+        self.standby = None
+        if self.standby_fd is not None:
+            os.close(self.standby_fd)
+            self.standby_fd = None
+        self.hook_executor = None  # threads of the Core
+        if self.exporter is not None:  # socket of the Core
+            self.exporter.close()
+            self.exporter = None
+        self.metrics = Metrics()  # histograms sent by flush_statistics()
+        self.loop = None  # event loop of the Core
+        self.event_queue.clear()
+        signal.SIGTERM: lambda signum, frame: self.terminate()
+        signal.SIGINT: lambda signum, frame: self.terminate()
+        signal.signal(  # Allow reloading Enroller configuration with SIGHUP
+            signal.SIGHUP,
+            lambda signum, frame: self.read_configuration(
+                configuration_file=self.config_file, do_activation=True
+            ),
+        )
+        signal.signal(  # Core requests the statistics with SIGUSR1
+            signal.SIGUSR1,
+            lambda signum, frame: self.request_statistics(),
+        )
+        signal.pthread_sigmask(
+            signal.SIG_UNBLOCK, {signal.SIGUSR1, signal.SIGHUP})
+
+    def run_child(self):
+        """ Enroller main procedure """
+        try:
+            self.run()
+        except KeyboardInterrupt:
+            self.log.debug("Enroller interrupted.")
+            self.terminate()
+
+    def run_standby(self, group_fd):
+        """
+        Warm Enroller: load the configuration and connect wpa_supplicant
+        in advance, then wait for the group and the config method sent by
+        the Core (see attach_standby()), switch the connection to the group
+        interface and activate itself. Terminate when the Core closes the
+        pipe.
+        """
+        self.prepare_enroller()
+        self.is_warm = True
+        self.read_configuration(configuration_file=self.config_file)
+        group = None
+        if self.start_process():
+            group = self.wait_group(group_fd)
+        os.close(group_fd)
+        if not group:
+            self.terminate()
+            return
+        group, _, config_method = group.partition("\t")
+        if config_method:  # inherited by the group interface
+            self.config_method_in_use = config_method
+            self.pbc_in_use = config_method == "virtual_push_button"
+        self.monitor_group = group
+        self.interface = group  # connected by attach_group()
+        self.run_child()
+
+    async def attach_group(self):
+        """ warm Enroller: switch the connection to the group interface
+            and start the activation (see run_standby())
+        """
+        await self.request("interface " + self.interface)
+        self.event_queue.clear()  # events of the P2P-Device interface
+        self.put_event("Interactive mode")  # start activation
+
+    def wait_group(self, group_fd):
+        """
+        Standby Enroller discards the events of wpa_supplicant while
+        waiting for the name of the group; returns None if the pipe is
+        closed or the connection fails
+        """
+        data = b""
+        while not data.endswith(b"\n"):
+            read_fds = [group_fd]
+            wpa_ctrl = self.wpa_ctrl
+            if wpa_ctrl is None:
+                read_fds.append(self.master_fd)
+            elif wpa_ctrl.connected:
+                read_fds.append(wpa_ctrl.fileno())
+            try:
+                reads, _, _ = select(read_fds, [], [], self.check_interval)
+                if group_fd in reads:
+                    received = os.read(group_fd, 256)
+                    if not received:
+                        return None
+                    data += received
+                elif wpa_ctrl is None:
+                    if reads:
+                        self.reader.read_lines()
+                else:
+                    if not wpa_ctrl.connected:
+                        wpa_ctrl.reconnect()
+                    elif reads:
+                        wpa_ctrl.receive()
+                    wpa_ctrl.lines.clear()
+            except OSError as e:
+                self.log.debug("Standby Enroller interrupted: %s", e)
+                return None
+        return data.decode("utf8", "ignore").strip()
+
+    def start_standby(self):
+        """
+        Core starts a warm Enroller for the next group (see run_standby())
+        """
+        if (
+                not self.warm_enroller
+                or self.enroller_mode == "thread"
+                or not self.use_enroller
+                or self.is_enroller
+                or self.terminate_is_active
+                or self.check_enrol()
+                or (self.standby is not None and self.standby.is_alive())
+        ):
+            return
+        self.stop_standby()
+        group_fd, self.standby_fd = os.pipe()
+        try:
+            self.standby = self.start_child(self.run_standby, (group_fd,))
+        finally:
+            os.close(group_fd)
+        self.log.debug(
+            "Starting standby Enroller process with PID %s", self.standby.pid
+        )
+
+    def stop_standby(self):
+        """
+        Core terminates the standby Enroller by closing its pipe
+        """
+        standby, self.standby = self.standby, None
+        if self.standby_fd is not None:
+            os.close(self.standby_fd)
+            self.standby_fd = None
+        if standby is None:
+            return
+        standby.join(1)
+        if standby.is_alive():
+            standby.terminate()
+            standby.join(1)
+
+    def attach_standby(self, group):
+        """
+        Core sends the group and its config method to the standby Enroller,
+        which becomes the Enroller; returns False if no standby is available
+        """
+        standby = self.standby
+        if standby is None or not standby.is_alive():
+            self.stop_standby()
+            return False
+        try:
+            os.write(self.standby_fd, (
+                group + "\t" + self.config_method_in_use + "\n").encode())
+        except OSError as e:
+            self.log.debug("Cannot attach the standby Enroller: %s", e)
+            self.stop_standby()
+            return False
+        os.close(self.standby_fd)
+        self.standby_fd = None
+        self.standby = None
+        self.enroller = standby
+        return True
+
+    def check_enrol(self):
+        """
+        Core checks whether Enroller process is active
+        """
+        if (
+                self.use_enroller
+                and not self.is_enroller
+                and self.enroller is not None
+                and self.enroller.is_alive()
+                and self.enroller.pid > 0
+        ):
+            return True
+        return False
+
+    def terminate_enrol(self):
+        """
+        Core terminates active Enroller process
+        """
+        if self.check_enrol():
+            enroller = self.enroller
+            self.enroller = None
+            self.unwatch_child(enroller.sentinel)
+            self.log.debug("Terminating Enroller process.")
+            self.statistics_received.clear()
+            try:  # the Enroller sends its statistics before terminating
+                self.signal_enroller(enroller, signal.SIGUSR1)
+            except OSError:
+                pass
+            self.join_enroller(enroller)
+        self.start_standby()
+
+    def join_enroller(self, enroller):
+        """
+        Core stops the Enroller process and waits for its termination,
+        without blocking the event loop
+        """
+        if self.in_loop():
+            self.loop.run_in_executor(None, self.stop_enroller, enroller)
+        else:
+            self.stop_enroller(enroller)
+
+    def stop_enroller(self, enroller):
+        self.statistics_received.wait(0.5)  # requested by terminate_enrol()
+        enroller.terminate()
+        enroller.join(2)
+        self.log.debug("Enroller process terminated.")
+
+    async def close_enroller(self):
+        """
+        Enroller sends the number of active sessions to the Core, then
+        terminates
+        """
+        await self.count_active_sessions()
+        self.flush_statistics()
+        self.send_to_core("HOSTP2PD_TERMINATE_ENROLLER")
+        self.terminate()
+
+    def count_statistics(self, event_stat_name):
+        """ Enroller accounts an event in the statistics of the Core,
+            sent by flush_statistics()
+        """
+        if not event_stat_name:
+            return
+        count = self.pending_statistics.pop(event_stat_name, 0)
+        self.pending_statistics[event_stat_name] = count + 1  # last one last
+
+    def flush_statistics(self):
+        """ Enroller sends the events accounted since the previous call
+            to the Core, as HOSTP2PD_STATISTICS messages with tab separated
+            names and counters (also without events, to acknowledge the
+            request of statistics_update()), preceded by HOSTP2PD_HISTOGRAM
+            messages with the histograms of its metrics (tab separated name,
+            label, sum, max and comma separated counts of each histogram)
+        """
+        message = "HOSTP2PD_HISTOGRAM"
+        for name, family in self.metrics.take_histograms().items():
+            for label, histogram in family.items():
+                item = "\t" + "\t".join((
+                    name, label or "", repr(histogram.sum),
+                    repr(histogram.max), ",".join(map(str, histogram.counts))))
+                if len(message) + len(item) > Channel.max_size:
+                    self.send_to_core(message)
+                    message = "HOSTP2PD_HISTOGRAM"
+                message += item
+        if message != "HOSTP2PD_HISTOGRAM":
+            self.send_to_core(message)
+        pending, self.pending_statistics = self.pending_statistics, {}
+        message = "HOSTP2PD_STATISTICS"
+        for name, count in pending.items():
+            item = "\t" + name + "\t" + str(count)
+            if len(message) + len(item) > Channel.max_size:
+                self.send_to_core(message)
+                message = "HOSTP2PD_STATISTICS"
+            message += item
+        self.send_to_core(message)
+
+    def request_statistics(self):
+        """ signal handler of the Enroller (also invoked by the Core thread
+            with the Enroller thread): flush the statistics
+        """
+        loop = self.loop
+        if loop is None:  # flushed when the event loop starts
+            self.do_flush_statistics = True
+            return
+        try:
+            loop.call_soon_threadsafe(self.flush_statistics)
+        except RuntimeError:  # loop already closed
+            pass
+
+    def statistics_update(self, timeout=1):
+        """ Core requests the Enroller to send its statistics and waits
+            for them (up to timeout seconds), so that the totals are exact
+        """
+        if not self.check_enrol():
+            return False
+        self.statistics_received.clear()
+        try:
+            self.signal_enroller(self.enroller, signal.SIGUSR1)
+        except (AttributeError, OSError):
+            return False
+        return self.statistics_received.wait(timeout)
+
+    def send_to_core(self, message):
+        """ Enroller sends a HOSTP2PD_ message to the Core """
+        try:
+            self.channel.send(message)
+        except (AttributeError, OSError) as e:
+            self.log.debug("Cannot send %s to the Core: %s", message, e)
+
+    def initialize(self):
+        """ Startup of the Core and of the Enroller before processing events;
+            returns False if the process cannot be started
+        """
+        if os.getppid() == 1 and os.getpgrp() == os.getsid(0):
             self.is_daemon = True
         if not self.is_enroller:
             threading.current_thread().name = "Core"
+            if self.channel is None:  # inherited by the Enroller processes
+                self.channel = Channel()
+            self.start_exporter()
+        if self.is_enroller:
+            if self.process is None and self.wpa_ctrl is None:
+                if not self.start_process():
+                    return False
+            if not (self.is_warm or self.is_thread):  # already loaded
+                self.read_configuration(configuration_file=self.config_file)
+        elif self.process is None and self.wpa_ctrl is None:
+            self.read_configuration(configuration_file=self.config_file)
             self.external_program(self.EXTERNAL_PROG_ACTION.STARTED)
-        if self.is_enroller or self.process is None:
             if not self.start_process():
-                return
-        self.read_configuration(configuration_file=self.config_file)
+                return False
+        else:
+            self.external_program(self.EXTERNAL_PROG_ACTION.STARTED)
 
         if self.is_enroller:
-            logging.info(
-                'Enroller subprocess for group "%s" started',
-                self.monitor_group
+            self.log.info(
+                'Enroller %s for group "%s" started%s',
+                "thread" if self.is_thread else "subprocess",
+                self.monitor_group,
+                " (warm)" if self.is_warm else "",
             )
         else:
-            logging.warning(
+            self.log.warning(
                 "__________"
                 "hostp2pd Service started (v%s) "
                 "PID=%s, PPID=%s, PGRP=%s, SID=%s, is_daemon=%s"
@@ -753,9 +2592,6 @@ config_parms: <class 'open_dict'>
                 self.is_daemon,
             )
 
-        if self.interface == "auto":
-            self.auto_select_interface()
-
         # Load pin module
         if self.pin_module:
             module_name = "get_pin"
@@ -765,10 +2601,10 @@ config_parms: <class 'open_dict'>
             module = importlib.util.module_from_spec(spec)
             try:
                 spec.loader.exec_module(module)
-                logging.debug(
+                self.log.debug(
                     'Using imported pin module "%s".', self.pin_module)
                 if not "get_pin" in dir(module):
-                    logging.error(
+                    self.log.error(
                         'Missing "get_pin" function '
                         'in imported pin module "%s".',
                         self.pin_module,
@@ -776,172 +2612,666 @@ config_parms: <class 'open_dict'>
                     raise ValueError("missing function in imported module.")
                 self.get_pin = module.get_pin
             except Exception as e:
-                logging.error(
+                self.log.error(
                     'Using builtin "get_pin" function ' "for this reason: %s",
                     e
                 )
         self.last_pwd = self.get_pin(self.pin)
-        hide_from_logging([self.last_pwd], "********")
+        hide_from_logging([self.pin, self.last_pwd], "********", True)
 
         if self.activate_persistent_group and self.activate_autonomous_group:
-            logging.error(
+            self.log.error(
                 'Error: "activate_persistent_group" '
                 'and "activate_autonomous_group" are both active. '
                 "Considering peristent group."
             )
             self.activate_autonomous_group = False
+        return True
 
-        self.threadState = self.THREAD.ACTIVE
+    def run(self):
+        """ Main procedure: run the engine until it is terminated """
+        if not self.initialize():
+            return
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.run_async())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
 
-        """ main loop """
-        self.stack = []
-        time.sleep(0.3)
+    async def run_async(self):
+        """
+        Engine: reading wpa_cli (or the control interface), the Enroller
+        messages, the timers and the command round-trips run on the same
+        event loop. Each command is correlated with its reply, which is
+        returned to the awaiting coroutine, while the events are queued
+        and processed by handle(), also while a procedure requiring more
+        round-trips (e.g., activation or group management) is in
+        progress. Procedures are run in sequence (see schedule()).
+        """
+        loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.ready = asyncio.Event()
+        self.procedures = asyncio.Queue()
+        self.pending = []
+        self.unsent = []
+        self.waiters = []
+        self.event_fd = None
+        self.switching = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        master_fd = self.master_fd
+        if master_fd is not None:  # wpa_cli
+            loop.add_reader(master_fd, self.read_output, self.reader)
+        channel = None if self.is_enroller else self.channel
+        if channel is not None:
+            loop.add_reader(channel.fileno(), self.read_channel, channel)
+        if self.is_enroller and not self.is_thread:  # requested by the Core
+            loop.add_signal_handler(signal.SIGUSR1, self.flush_statistics)
+        if self.do_flush_statistics:  # requested before the loop started
+            self.do_flush_statistics = False
+            loop.call_soon(self.flush_statistics)
+        for fd in self.child_fds:  # wpa_cli started by initialize()
+            loop.add_reader(fd, self.child_exited, fd)
+        self.watch_events()
+        self.forward_lines()
+        worker = loop.create_task(self.run_procedures())
+        try:
+            if self.interface == "auto":
+                await self.auto_select_interface()
+            if self.is_warm:
+                await self.attach_group()
+            if self.threadState != self.THREAD.STOPPED:
+                self.threadState = self.THREAD.ACTIVE
+            self.start_timers()
+            if await self.consume():  # complete the Enroller procedures
+                try:
+                    await asyncio.wait_for(
+                        self.procedures.join(), self.command_timeout)
+                except asyncio.TimeoutError:
+                    self.log.debug("Pending procedures not completed.")
+        finally:
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+            while not self.procedures.empty():
+                self.procedures.get_nowait().close()
+            if master_fd is not None:
+                loop.remove_reader(master_fd)
+            if channel is not None:
+                loop.remove_reader(channel.fileno())
+            if self.is_enroller and not self.is_thread:
+                loop.remove_signal_handler(signal.SIGUSR1)
+            for fd in self.child_fds:
+                loop.remove_reader(fd)
+            self.unwatch_events()
+            for command in self.pending + self.unsent:
+                if not command.future.done():
+                    command.future.set_result(None)
+            self.pending = []
+            self.unsent = []
+            self.executor.shutdown(wait=False)
+            self.loop = None
+
+    async def consume(self):
+        """ process the event queue with handle(); returns True if
+            stopped by handle(), False if terminated
+        """
         while self.threadState != self.THREAD.STOPPED:
 
             if self.threadState == self.THREAD.PAUSED:
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
                 continue
 
-            # get the command and process it
-            self.cmd = None
-            while len(self.stack) > 0:
-                self.cmd = self.stack.pop(0)
-                logging.debug(
-                    "(enroller) POP: %s" if self.is_enroller else "POP: %s",
-                    repr(self.cmd),
-                )
-                if self.cmd:
-                    break
-            if not self.cmd:
-                self.cmd = None
-            if self.cmd is None:
-                self.cmd = self.read_wpa()
+            self.scheduler.run_due()
+            if not self.event_queue:
+                timeout = self.scheduler.timeout(
+                    self.select_timeout_secs["long"])
+                wpa_ctrl = self.wpa_ctrl
+                if wpa_ctrl is not None and not wpa_ctrl.connected:
+                    timeout = min(timeout, wpa_ctrl.reconnect_secs)
+                self.ready.clear()
+                try:
+                    await asyncio.wait_for(self.ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    if wpa_ctrl is not None and not wpa_ctrl.connected:
+                        await self.loop.run_in_executor(
+                            self.executor, wpa_ctrl.reconnect)
+                        self.watch_events()
+                        self.forward_lines()
+                continue
+            self.cmd = self.event_queue.get()
             if self.cmd is None:
                 self.terminate()
-                return
+                return False
             if self.threadState == self.THREAD.STOPPED:
-                return
-            if not any(skip in self.cmd for skip in self.do_not_debug):
-                logging.debug(
+                return False
+            if self.log_event(self.cmd):
+                self.log.debug(
                     "(enroller) recv: %s" if self.is_enroller
                     else "recv: %s", repr(self.cmd),
                 )
             if not self.handle(self.cmd):
                 self.threadState = self.THREAD.STOPPED
+                return True
+        return False
+
+    def in_loop(self):
+        """ True if invoked by the thread running the event loop """
+        return (
+            self.loop is not None
+            and threading.get_ident() == self.loop_thread
+        )
+
+    def stop(self):
+        """ wake up and terminate the event processing """
+        self.threadState = self.THREAD.STOPPED
+        self.event_queue.put(None)
+        self.ready.set()
+
+    @property
+    def log(self):
+        """ logger of the role of the instance (Core or Enroller) """
+        return enroller_logger if self.is_enroller else core_logger
+
+    def log_event(self, line):
+        """ whether the debug logs of an event line are written (see
+            do_not_debug and log_rate_limits); evaluated once per line
+        """
+        if not self.log.isEnabledFor(logging.DEBUG):
+            return False
+        if line is not self.logged_line:
+            self.logged_line = line
+            words = line.split(None, 2) if line else []
+            name = words[0] if words else ""
+            if name == ">" and len(words) > 1:  # prompt
+                name = words[1]
+            if name[:1] == "<":  # remove "<n>" level
+                name = name.partition(">")[2]
+            self.log_line = (
+                name not in self.no_debug_events
+                and self.log_limiter.allow(name, self.log)
+            )
+        return self.log_line
+
+    _find_timing_level = None
 
-    def read_wpa(self):
-        """reads from wpa_cli until the next newline
-        Returned value: void string (no data),
-        or data (valued string), or None (error)
+    @property
+    def find_timing_level(self):
+        """ period of the p2p_find refreshes (key of select_timeout_secs) """
+        return self._find_timing_level
+
+    @find_timing_level.setter
+    def find_timing_level(self, level):
+        if level == self._find_timing_level:
+            return
+        self._find_timing_level = level
+        if "find" in self.scheduler:  # apply the new period
+            self.schedule_find()
+
+    def new_scan_governor(self):
+        return ScanGovernor(
+            self.select_timeout_secs["normal"],
+            self.min_find_interval,
+            self.select_timeout_secs["long"])
+
+    def find_interval(self):
+        """ period of the p2p_find refreshes: adaptive while discovering
+            (normal and long timing levels), otherwise defined by
+            select_timeout_secs
         """
-        buffer = ""
+        if self.find_timing_level in ("normal", "long"):
+            return self.scan_governor.interval
+        return self.select_timeout_secs[self.find_timing_level]
 
-        try:
-            while True:
-                if (
-                        self.find_timing_level == "normal"
-                        and self.max_scan_polling > 0
-                        and self.scan_polling >= self.max_scan_polling
-                ):
-                    self.find_timing_level = "long"
-                    logging.debug(
-                        "New read_wpa timeout: %s seconds.",
-                        self.select_timeout_secs[self.find_timing_level],
-                    )
-                timeout = self.select_timeout_secs[self.find_timing_level]
-                reads, _, _ = select([self.master_fd], [], [], timeout)
-                if len(reads) > 0:
-                    c = os.read(self.master_fd, 1).decode("utf8", "ignore")
-                else:
-                    # Here some periodic tasks are handled:
-
-                    # Controlling whether an active Enroller died
-                    if self.process is not None:
-                        ret = self.process.poll()
-                        if ret is not None:  # Enroller died with ret code
-                            logging.critical(
-                                "wpa_cli died with return code %s."
-                                " Terminating hostp2pd.",
-                                ret,
-                            )
-                            os.kill(os.getpid(), signal.SIGTERM)
-
-                    # Controlling frequency of periodic "p2p_find" and sending it
-                    if (
-                            self.max_scan_polling > 0
-                            and self.scan_polling > self.max_scan_polling
-                    ):
-                        logging.info(
-                            "Exceeded number of p2p_find pollings "
-                            "after read timeout of %s seconds: %s",
-                            timeout,
-                            self.scan_polling,
-                        )
-                    else:
-                        self.scan_polling += 1
-                        logging.debug(
-                            "p2p_find polling after read timeout "
-                            "of %s seconds: %s of %s",
-                            timeout,
-                            self.scan_polling,
-                            self.max_scan_polling,
-                        )
-                        self.write_wpa("p2p_find")
-                    continue
+    def schedule_find(self):
+        self.scheduler.add("find", self.find_interval(), self.refresh_find)
 
-                if c == "\n":
-                    break  # complete the read operation and does not include the newline
+    def start_timers(self):
+        """ schedule the periodic tasks of the engine """
+        self.schedule_find()
+        if self.is_enroller:
+            self.scheduler.add(
+                "statistics",
+                self.statistics_interval,
+                self.flush_statistics,
+                interval=self.statistics_interval)
+        self.scheduler.add(
+            "liveness",
+            self.check_interval,
+            self.check_liveness,
+            interval=self.check_interval)
+        if self.log_limiter.limits:
+            self.scheduler.add(
+                "log_rate",
+                self.log_rate_interval,
+                lambda: self.log_limiter.flush(self.log),
+                interval=self.log_rate_interval)
+
+    def check_liveness(self):
+        """ scheduled task controlling whether wpa_cli died (exits are
+            immediately detected through process_fd when pidfd is supported)
+        """
+        if self.process is not None and self.process.poll() is not None:
+            self.process_exited()
 
-                if c == "\r":
-                    continue  # skip carriage returns
+    def watch_child(self, fd, callback):
+        """ invoke callback when fd becomes readable, i.e., when the child
+            process of the pidfd or of the sentinel fd exits
+        """
+        self.child_fds[fd] = callback
+        if self.in_loop():  # otherwise watched when the event loop starts
+            self.loop.add_reader(fd, self.child_exited, fd)
+
+    def unwatch_child(self, fd):
+        if fd in self.child_fds and self.in_loop():
+            self.loop.remove_reader(fd)
+        self.child_fds.pop(fd, None)
+
+    def child_exited(self, fd):
+        callback = self.child_fds.get(fd)
+        self.unwatch_child(fd)
+        if callback is not None:
+            callback()
+        self.ready.set()  # consume() computes the timeout of the restart
+
+    def process_exited(self):
+        """ wpa_cli died: restart it on the same pty after the backoff delay
+        """
+        self.drop_pending()  # never answered by the dead wpa_cli
+        if self.terminate_is_active or "restart_process" in self.scheduler:
+            return
+        self.close_process_fd()
+        ret = self.process.poll()
+        delay = self.process_supervisor.exited()
+        transport_logger.error(
+            "wpa_cli died with return code %s. Restarting it in %s seconds.",
+            ret,
+            delay,
+        )
+        self.scheduler.add("restart_process", delay, self.restart_process)
+
+    def restart_process(self):
+        """ scheduled task restarting wpa_cli """
+        try:  # discard the commands written while wpa_cli was not running
+            termios.tcflush(self.slave_fd, termios.TCIFLUSH)
+        except (termios.error, TypeError):
+            pass
+        if not self.spawn_process():
+            delay = self.process_supervisor.exited()
+            transport_logger.error("Restarting wpa_cli in %s seconds.", delay)
+            self.scheduler.add("restart_process", delay, self.restart_process)
+            return
+        self.process_supervisor.restarted()
+        transport_logger.warning(
+            "wpa_cli restarted with PID %s (%s restarts, downtime %.1f s).",
+            self.process.pid,
+            self.process_supervisor.restarts,
+            self.process_supervisor.downtime,
+        )
 
-                buffer += c
-        except TypeError as e:
-            if self.master_fd is None:
-                logging.debug("Process interrupted.")
-            else:
-                logging.critical(
-                    "PANIC - Internal TypeError in read_wpa(): %s",
-                    e,
-                    exc_info=True,
-                )
-            return None  # error
+    def enroller_exited(self):
+        """ the Enroller process ended: if it did not terminate regularly,
+            restart it after the backoff delay
+        """
+        enroller = self.enroller
+        if enroller is None or self.terminate_is_active:
+            return
+        enroller.join(1)
+        if enroller.is_alive():
+            return
+        self.enroller = None
+        if enroller.exitcode == 0:  # close_enroller() or terminate()
+            self.log.debug("Enroller process ended.")
+            self.start_standby()
+            return
+        delay = self.enroller_supervisor.exited()
+        self.log.error(
+            "Enroller process died with exit code %s. "
+            "Restarting it in %s seconds.",
+            enroller.exitcode,
+            delay,
+        )
+        self.scheduler.add("restart_enroller", delay, self.restart_enroller)
+
+    def restart_enroller(self):
+        """ scheduled task restarting the Enroller, if its group is still
+            active
+        """
+        if not self.monitor_group or self.check_enrol():
+            self.enroller_supervisor.cancel()
+            return
+        self.run_enrol()
+        self.enroller_supervisor.restarted()
+        self.log.warning(
+            "Enroller restarted (%s restarts, downtime %.1f s).",
+            self.enroller_supervisor.restarts,
+            self.enroller_supervisor.downtime,
+        )
+
+    def refresh_find(self):
+        """ scheduled task sending the periodic "p2p_find" refreshes
+            (see find_interval())
+        """
+        timeout = self.find_interval()
+        if (
+                self.max_scan_polling > 0
+                and self.scan_polling > self.max_scan_polling
+        ):
+            self.log.info(
+                "Exceeded number of p2p_find pollings "
+                "after a period of %s seconds: %s",
+                timeout,
+                self.scan_polling,
+            )
+        else:
+            self.scan_polling += 1
+            self.log.debug(
+                "p2p_find polling after a period "
+                "of %s seconds: %s of %s",
+                timeout,
+                self.scan_polling,
+                self.max_scan_polling,
+            )
+            self.write_wpa("p2p_find")
+        if self.find_timing_level in ("normal", "long"):
+            self.scan_governor.update()
+            self.log.debug(
+                "p2p_find refresh period: %.1f seconds.",
+                self.scan_governor.interval,
+            )
+        self.schedule_find()
+
+    def conn_delay_expired(self):
+        """ True if min_conn_delay expired after the last p2p_connect """
+        return (
+            not self.p2p_connect_time
+            or time.monotonic() > self.p2p_connect_time + self.min_conn_delay
+        )
+
+    def restart_find_after_conn_delay(self):
+        """ send p2p_find, or schedule it at the end of min_conn_delay """
+        if self.conn_delay_expired():
+            self.write_wpa("p2p_find")
+            return
+        self.scheduler.add(
+            "find",
+            self.p2p_connect_time + self.min_conn_delay - time.monotonic(),
+            self.refresh_find)
+
+    def negotiation_timeout(self):
+        """ scheduled task ending a p2p_connect which did not complete
+            within max_negotiation_time
+        """
+        if not self.p2p_connect_time:  # completed or failed
+            return
+        self.log.warning(
+            'Connection of station "%s" not completed within %s seconds.',
+            self.station,
+            self.max_negotiation_time,
+        )
+        self.p2p_connect_time = 0
+        self.find_timing_level = "normal"
+        self.write_wpa("p2p_find")
+
+    # Input ___________________________________________________________________
+
+    def put_event(self, line):
+        """ queue a line to handle(), waking up the waiters of the event
+            (see expect())
+        """
+        consumed = False
+        for waiter in list(self.waiters):
+            name, future, consume = waiter
+            if name in line:
+                self.waiters.remove(waiter)
+                if not future.done():
+                    future.set_result(line)
+                    consumed = consumed or consume
+        if consumed:
+            return
+        self.event_queue.put(line)
+        self.ready.set()
+
+    def read_output(self, reader):
+        """ read wpa_cli, routing replies to the pending commands """
+        try:
+            lines = reader.read_lines()
         except OSError as e:
-            if (
-                    e.errno == errno.EBADF or e.errno == errno.EIO
-            ):  # [Errno 9] Bad file descriptor/[Errno 5] Input/output error
-                logging.debug("Read interrupted.")
+            if e.errno == errno.EBADF or e.errno == errno.EIO:
+                transport_logger.debug("Read interrupted.")
             else:
-                logging.critical(
-                    "PANIC - Internal OSError in read_wpa(): %s",
-                    e,
-                    exc_info=True,
+                transport_logger.critical(
+                    "PANIC - Internal OSError in read_output(): %s",
+                    e, exc_info=True
                 )
-            return None  # error
-        except Exception as e:
-            if self.terminate_is_active:
-                logging.debug("Read interrupted: %s", e)
-                return None  # error
-            logging.critical(
-                "PANIC - Internal error in read_wpa(): %s", e, exc_info=True
-            )
+            self.loop.remove_reader(reader.fd)
+            self.event_queue.put(None)
+            self.ready.set()
+            return
+        for line in lines:
+            self.route(line)
+
+    def read_channel(self, channel):
+        """ read the messages of the Enroller """
+        try:
+            messages = channel.receive()
+        except OSError as e:
+            self.log.debug("Channel interrupted: %s", e)
+            self.loop.remove_reader(channel.fileno())
+            return
+        for message in messages:
+            self.put_event(message)
+
+    def route(self, line):
+        """ pass a line to the command waiting for its reply,
+            or to the event queue
+        """
+        while line.startswith("> "):  # wpa_cli prompts
+            line = line[2:]
+        if (
+                self.wpa_ctrl is not None
+                or not self.pending
+                or EVENT_LINE.match(line)
+        ):
+            if line.startswith(CONNECTION_LOST):
+                self.drop_pending()
+            self.put_event(line)
+            return
+        command = self.pending[0]
+        if "PONG" in line:
+            self.pending.pop(0)
+            if not command.future.done():
+                command.future.set_result(command.lines)
+            return
+        command.lines.append(line)
+
+    def drop_pending(self):
+        """ the pending wpa_cli commands will never be answered """
+        for command in self.pending:
+            if not command.future.done():
+                command.future.set_result(None)
+        self.pending = []
+
+    def watch_events(self):
+        """ watch the event socket of the control interface """
+        if self.switching:
+            return
+        wpa_ctrl = self.wpa_ctrl
+        fd = None if wpa_ctrl is None else wpa_ctrl.fileno()
+        if self.event_fd is not None:
+            self.loop.remove_reader(self.event_fd)
+        self.event_fd = fd
+        if fd is not None:
+            self.loop.add_reader(fd, self.read_events, wpa_ctrl)
+
+    def unwatch_events(self):
+        if self.event_fd is not None:
+            self.loop.remove_reader(self.event_fd)
+            self.event_fd = None
+
+    def read_events(self, wpa_ctrl):
+        """ read the events of the control interface """
+        wpa_ctrl.receive()
+        if not wpa_ctrl.connected:
+            self.unwatch_events()
+        self.forward_lines()
+
+    def forward_lines(self):
+        """ queue the lines produced by the control interface """
+        wpa_ctrl = self.wpa_ctrl
+        if wpa_ctrl is None:
+            return
+        while wpa_ctrl.lines:
+            self.route(wpa_ctrl.lines.popleft())
+
+    # Commands ________________________________________________________________
 
-        return buffer
+    def submit(self, cmd):
+        """ send a command; return a future with the list of the reply
+            lines (None in case of error or timeout). Commands submitted
+            in the same iteration of the event loop are sent together.
+        """
+        if transport_logger.isEnabledFor(logging.DEBUG):
+            transport_logger.debug(
+                "(enroller) Write: %s" if self.is_enroller else "Write: %s",
+                repr(cmd),
+            )
+        future = self.loop.create_future()
+        if self.master_fd is None and self.wpa_ctrl is None:
+            transport_logger.debug("Process interrupted.")
+            future.set_result(None)
+            return future
+        if not self.unsent:
+            self.loop.call_soon(self.flush_unsent)
+        self.unsent.append(Command(cmd, future))
+        return future
+
+    def flush_unsent(self):
+        """ send the submitted commands: with wpa_cli, a single write
+            includes all of them, each one followed by ping, so that the
+            output up to the related PONG is the reply; with the control
+            interface, they are pipelined by the executor thread
+        """
+        commands, self.unsent = self.unsent, []
+        if not commands:
+            return
+        wpa_ctrl = self.wpa_ctrl
+        if wpa_ctrl is not None:
+            cmds = [command.cmd for command in commands]
+            if any(cmd.startswith("interface ") for cmd in cmds):
+                self.switching += 1  # sockets are replaced
+                self.unwatch_events()
+            replies = self.loop.run_in_executor(
+                self.executor, wpa_ctrl.execute_all, cmds,
+                self.command_timeout)
+            replies.add_done_callback(
+                lambda replies: self.executed(commands, replies))
+            return
+        self.pending.extend(commands)
+        if self.write_output(
+                "".join(
+                    command.cmd + "\n"
+                    + ("" if command.cmd == "ping" else "ping\n")
+                    for command in commands
+                )
+        ) is None:
+            for command in commands:
+                self.pending.remove(command)
+                command.future.set_result(None)
+            return
+        for command in commands:
+            self.loop.call_later(self.command_timeout, self.expire, command)
+
+    def executed(self, commands, replies):
+        """ commands of the control interface were processed """
+        if any(command.cmd.startswith("interface ") for command in commands):
+            self.switching -= 1
+        if replies.cancelled() or replies.exception() is not None:
+            replies = [None] * len(commands)
+        else:
+            replies = replies.result()
+        for command, lines in zip(commands, replies):
+            if not command.future.done():
+                command.future.set_result(lines)
+        self.watch_events()
+        self.forward_lines()
+
+    def expire(self, command):
+        """ deadline of a wpa_cli command """
+        if command.future.done():
+            return
+        transport_logger.debug("'%s' command timed out.", command.cmd)
+        if command in self.pending:
+            self.pending.remove(command)
+        command.future.set_result(None)
+
+    async def request(self, cmd):
+        """ send a command and wait for its reply, which is returned as a
+            list of lines (None in case of error or timeout, see
+            command_timeout). Events received in the meanwhile are queued
+            to handle() in their order, not mixed with the reply.
+        """
+        if self.loop is None:
+            return None
+        start = time.monotonic()
+        lines = await self.submit(cmd)
+        if lines is not None:  # not timed out
+            self.metrics.observe(
+                "command_seconds", time.monotonic() - start, command_name(cmd))
+        if transport_logger.isEnabledFor(logging.DEBUG):
+            transport_logger.debug("(%s) Read %s", cmd, lines)
+        return lines
+
+    async def request_all(self, cmds):
+        """ send a list of commands together and wait for all their
+            replies, returned in the same order (see request())
+        """
+        return await asyncio.gather(*(self.request(cmd) for cmd in cmds))
 
     def write_wpa(self, resp):
-        """ write to wpa_cli """
-        logging.debug(
-            "(enroller) Write: %s" if self.is_enroller else "Write: %s",
-            repr(resp),
-        )
-        resp += "\n"
+        """ send a command without waiting; the reply is processed by
+            handle(). Also invoked by other threads.
+        """
+        loop = self.loop
+        if loop is None:  # engine not running
+            if transport_logger.isEnabledFor(logging.DEBUG):
+                transport_logger.debug("Write: %s", repr(resp))
+            if self.wpa_ctrl is not None:
+                return self.wpa_ctrl.write(resp)
+            return self.write_output(resp + "\n")
+        if self.in_loop():
+            self.send(resp)
+        else:
+            try:
+                loop.call_soon_threadsafe(self.send, resp)
+            except RuntimeError:  # loop already closed
+                return None
+        return len(resp)
+
+    def send(self, cmd):
+        if self.loop is not None:
+            self.submit(cmd).add_done_callback(self.forward_reply)
+
+    def forward_reply(self, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        for line in future.result() or []:
+            self.put_event(line)
+
+    def write_output(self, data):
+        """ write data to the wpa_cli pty """
         try:
-            return os.write(self.master_fd, resp.encode())
+            return os.write(self.master_fd, data.encode())
         except TypeError as e:
             if self.master_fd is None:
-                logging.debug("Process interrupted.")
+                transport_logger.debug("Process interrupted.")
             else:
-                logging.critical(
+                transport_logger.critical(
                     "PANIC - Internal TypeError in write_wpa(): %s",
                     e,
                     exc_info=True,
@@ -949,33 +3279,95 @@ config_parms: <class 'open_dict'>
             return None  # error
         except Exception as e:
             if not self.terminate_is_active:
-                logging.critical(
+                transport_logger.critical(
                     "PANIC - Internal error in write_wpa(): %s",
                     e, exc_info=True
                 )
             return None  # error
 
-    def rotate_config_method(self):
+    def expect(self, name, consume=False):
+        """ register a future receiving the next event including name, to
+            be registered before sending the command producing the event
+            (see wait_event()); with consume, the event is not queued to
+            handle()
+        """
+        future = self.loop.create_future()
+        self.waiters.append((name, future, consume))
+        return future
+
+    async def wait_event(self, future, timeout):
+        """ wait for an expected event; returns the event line or None """
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.waiters = [w for w in self.waiters if w[1] is not future]
+
+    # Procedures ______________________________________________________________
+
+    def schedule(self, procedure):
+        """ run a procedure (coroutine) of the engine after the ones
+            already scheduled; also invoked by other threads
+        """
+        if self.in_loop():
+            self.procedures.put_nowait(procedure)
+            return
+        try:
+            self.loop.call_soon_threadsafe(
+                self.procedures.put_nowait, procedure)
+        except (AttributeError, RuntimeError):  # loop not running
+            procedure.close()
+
+    async def run_procedures(self):
+        while True:
+            procedure = await self.procedures.get()
+            try:
+                await procedure
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log.critical(
+                    "PANIC - Internal error in procedure: %s",
+                    e, exc_info=True
+                )
+            finally:
+                self.procedures.task_done()
+
+    async def stop_find(self):
+        """ send p2p_stop_find and wait for P2P-FIND-STOPPED, at most
+            confirm_timeout seconds (the event is not sent if the discovery
+            was not in progress); the Enroller only waits for the reply, as
+            the event is not sent to the group interface
+        """
+        if self.is_enroller:
+            await self.request("p2p_stop_find")
+            return
+        stopped = self.expect("P2P-FIND-STOPPED", consume=True)
+        stopping = self.is_ok(await self.request("p2p_stop_find"))
+        await self.wait_event(
+            stopped, self.confirm_timeout if stopping else 0)
+
+    async def set_config_method(self, config_method):
+        """ set the config method, waiting for its confirmation """
+        if not self.is_ok(
+                await self.request("set config_methods " + config_method)):
+            self.log.error('Cannot set config method "%s".', config_method)
+        self.config_method_in_use = config_method
+
+    async def rotate_config_method(self):
+        await self.stop_find()
         if self.pbc_in_use:
-            self.write_wpa("p2p_stop_find")
-            time.sleep(2)
-            self.write_wpa("set config_methods keypad")
-            self.config_method_in_use = "keypad"
+            await self.set_config_method("keypad")
             self.pbc_in_use = False
-            self.write_wpa("p2p_find")
-            time.sleep(2)
         else:
-            self.write_wpa("p2p_stop_find")
-            time.sleep(2)
-            self.write_wpa("set config_methods virtual_push_button")
-            self.config_method_in_use = "virtual_push_button"
+            await self.set_config_method("virtual_push_button")
             self.pbc_in_use = True
-            self.write_wpa("p2p_find")
-            time.sleep(2)
+        await self.request("p2p_find")
 
     def start_session(self, station=None):
-        if time.time() < self.p2p_connect_time + self.min_conn_delay:
-            logging.debug(
+        if not self.conn_delay_expired():
+            self.log.debug(
                 "Will not p2p_conect due to unsufficient p2p_connect_time"
             )
             return
@@ -993,620 +3385,288 @@ config_parms: <class 'open_dict'>
             if self.persistent_network_id is not None:
                 persistent_postfix += "=" + self.persistent_network_id
         self.p2p_command(self.P2P_COMMAND.P2P_CONNECT, station)
-        self.p2p_connect_time = time.time()
+        self.metrics.start("go_negotiation_seconds", station)
+        self.metrics.start("group_start_seconds")
+        self.p2p_connect_time = time.monotonic()
+        self.scheduler.add(
+            "negotiation", self.max_negotiation_time, self.negotiation_timeout)
         self.group_type = "Negotiated (always won)"
 
-    def list_or_remove_group(self, remove=False):
-        """ list or remove p2p groups; group name is returned """
-        logging.debug(
+    async def retry_session(self):
+        """ retry p2p_connect after a failure, using the last station; the
+            further retries are delayed by the scheduler, without holding
+            the next procedures
+        """
+        if self.num_failures > 1:  # leave the peer the time to listen again
+            self.scheduler.add("retry_session", 2, self.start_session)
+            return
+        self.start_session()
+
+    async def remove_groups(self):
+        """ remove all the p2p groups """
+        self.monitor_group = await self.list_or_remove_group(True)
+
+    async def restart_find(self, remove_group=False):
+        """ send p2p_find; with remove_group, the active group is removed
+            before
+        """
+        if remove_group:
+            if self.monitor_group:
+                removed = self.expect("P2P-GROUP-REMOVED ")  # also handled
+                await self.request("p2p_group_remove " + self.monitor_group)
+                self.external_program(
+                    self.EXTERNAL_PROG_ACTION.STOP_GROUP,
+                    self.monitor_group)
+                self.monitor_group = ""
+                await self.wait_event(removed, self.confirm_timeout)
+            else:
+                await self.remove_groups()  # waits for P2P-GROUP-REMOVED
+                self.external_program(
+                    self.EXTERNAL_PROG_ACTION.STOP_GROUP)
+        self.write_wpa("p2p_find")
+
+    async def list_or_remove_group(self, remove=False):
+        """ list or remove p2p groups; group name is returned """
+        self.log.debug(
             'Starting list_or_remove_group procedure. remove="%s"', remove
         )
-        self.write_wpa("interface")
-        self.write_wpa("ping")
         monitor_group = None
-        wait_cmd = 0
-        cmd_timeout = time.time()
-        error = 0
-        can_append = False
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (list_or_remove_group): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (list_or_remove_group)")
-                time.sleep(0.5)
-                error += 1
+        for input_line, tokens in self.parse_p2p_interfaces(
+                await self.request("interface")):
+            if not tokens[2].isnumeric():
                 continue
-            error = 0
-            logging.debug("reading '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
+            monitor_group = input_line
+            if not remove:
+                self.log.debug(
+                    'Found "%s": %s group %s of interface %s',
+                    input_line,
+                    tokens[0],
+                    tokens[2],
+                    tokens[1],
+                )
                 continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
+            self.log.debug(
+                'Removing "%s": %s group %s of interface %s',
+                input_line,
+                tokens[0],
+                tokens[2],
+                tokens[1],
+            )
+            removed = self.expect("P2P-GROUP-REMOVED ", consume=True)
+            await self.request("p2p_group_remove " + monitor_group)
+            self.external_program(
+                self.EXTERNAL_PROG_ACTION.STOP_GROUP, monitor_group)
+            monitor_group = None
+            self.log.warning("removed %s", input_line)
+            if await self.wait_event(removed, self.min_conn_delay) is None:
+                self.log.debug(
                     "Terminating group list/deletion procedure "
                     "after timeout of %s seconds.",
                     self.min_conn_delay,
                 )
                 break
-            if "P2P-GROUP-REMOVED " in input_line:
-                self.p2p_connect_time = 0
-                self.find_timing_level = "normal"
-                logging.debug(
-                    "Received %s. Terminating group list/deletion procedure.",
-                    input_line,
-                )
-                break
-            if "PONG" in input_line and not wait_cmd:
-                logging.debug(
-                    'Terminating group list/deletion. Group="%s".',
-                    monitor_group
-                )
-                break
-            tokens = input_line.split("-")
-            if len(tokens) != 3:
-                if can_append:
-                    logging.debug("(list_or_remove_group) PUSH '%s'",
-                                  input_line)
-                    self.stack.append(input_line)
-                continue
-            if tokens[0] != "p2p":
-                if can_append:
-                    logging.debug("(list_or_remove_group) PUSH '%s'",
-                                  input_line)
-                    self.stack.append(input_line)
-                continue
-            if tokens[2].isnumeric() and not ">" in input_line:
-                monitor_group = input_line
-                if remove:
-                    can_append = True
-                    logging.debug(
-                        'Removing "%s": %s group %s of interface %s',
-                        input_line,
-                        tokens[0],
-                        tokens[2],
-                        tokens[1],
-                    )
-                    self.write_wpa("p2p_group_remove " + monitor_group)
-                    wait_cmd = time.time()
-                    self.external_program(
-                        self.EXTERNAL_PROG_ACTION.STOP_GROUP, monitor_group)
-                    monitor_group = None
-                    logging.warning("removed %s", input_line)
-                    time.sleep(2)
-                else:
-                    logging.debug(
-                        'Found "%s": %s group %s of interface %s',
-                        input_line,
-                        tokens[0],
-                        tokens[2],
-                        tokens[1],
-                    )
-                continue
-            if can_append:
-                logging.debug("(list_or_remove_group) PUSH '%s'", input_line)
-                self.stack.append(input_line)
+            self.p2p_connect_time = 0
+            self.find_timing_level = "normal"
+            self.log.debug("Group removed. Terminating group deletion.")
+            break
+        self.log.debug(
+            'Terminating group list/deletion. Group="%s".', monitor_group
+        )
         return monitor_group
 
-    def auto_select_interface(self):
+    async def auto_select_interface(self):
         """ auto-select p2p device interface """
-        logging.debug('Starting auto_select_interface.')
-        self.write_wpa("interface")
-        self.write_wpa("ping")
-        wait_cmd = 0
-        cmd_timeout = time.time()
-        error = 0
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (auto_select_interface): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (auto_select_interface)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("reading '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
-                    "Terminating auto_select_interface procedure "
-                    "after timeout of %s seconds.",
-                    self.min_conn_delay,
-                )
-                break
-            if "PONG" in input_line and not wait_cmd:
-                logging.debug(
-                    'Terminating auto_select_interface. Interface="%s".',
-                    self.interface
-                )
-                break
-            tokens = input_line.split("-")
-            if len(tokens) != 3:
-                continue
-            if tokens[0] != "p2p":
-                continue
+        self.log.debug('Starting auto_select_interface.')
+        for input_line, tokens in self.parse_p2p_interfaces(
+                await self.request("interface")):
             if tokens[1] != "dev":
                 continue
             if self.interface == "auto":
-                logging.info('Using interface "%s".', input_line)
+                self.log.info('Using interface "%s".', input_line)
                 self.interface = input_line
                 self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_DEVICE)
             else:
-                logging.debug('List interface "%s".', input_line)
-                continue
-        return
+                self.log.debug('List interface "%s".', input_line)
+        self.log.debug(
+            'Terminating auto_select_interface. Interface="%s".',
+            self.interface
+        )
 
-    def count_active_sessions(self):
+    async def count_active_sessions(self):
         """Enroller counts the number of active sessions
         of a P2P-GO group and writes this number to Core
         """
-        logging.debug("Starting count_active_sessions procedure")
+        self.log.debug("Starting count_active_sessions procedure")
         if not self.is_enroller:
             self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_GO)
-        self.write_wpa("ping")
-        self.write_wpa("list_sta")
-        self.write_wpa("ping")
-        n_stations = 0
-        flush_data = True  # skip the first ping (used to flush previous data)
-        cmd_timeout = time.time()
-        error = 0
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (count_active_sessions): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (count_active_sessions)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("reading '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
-                    "Terminating count_active_sessions procedure "
-                    "after timeout of %s seconds.",
-                    self.min_conn_delay,
-                )
-                break
-            if flush_data:
-                if "PONG" in input_line:
-                    flush_data = False
-                continue
-            if re.match(
-                    "^(?:> )?[0-9a-f]{2}([-:]?)[0-9a-f]{2}(\\1[0-9a-f]{2}){4}$",
-                    input_line.lower(),
-            ):
-                n_stations += 1
-                logging.debug(
-                    'Active station "%s". n_stations=%s',
-                    input_line, n_stations
-                )
-                continue
-            if "PONG" in input_line:
-                logging.debug(
-                    "Terminating count_active_sessions. n_stations=%s.",
-                    n_stations,
-                )
-                break
-        os.write(
-            self.father_slave_fd,
-            (
-                (
-                        "HOSTP2PD_ACTIVE_SESSIONS" + "\t" + str(n_stations) + "\n"
-                ).encode()
-            ),
+        n_stations = len(self.parse_stations(await self.request("list_sta")))
+        self.log.debug(
+            "Terminating count_active_sessions. n_stations=%s.", n_stations
         )
+        self.send_to_core(
+            "HOSTP2PD_ACTIVE_SESSIONS" + "\t" + str(n_stations))
         if not self.is_enroller:
             self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_DEVICE)
         return n_stations
 
-    def configure_wpa(self):
-        if len(self.config_parms) == 0:
+    async def reconfigure_wpa(self):
+        """ reload the wpa_supplicant configuration file and apply
+            config_parms
+        """
+        config_logger.debug('Reloading "wpa_supplicant" configuration file...')
+        if self.is_ok(await self.request("reconfigure")):
+            config_logger.debug('"wpa_supplicant" configuration reloaded.')
+            await self.configure_wpa()
+        else:
+            config_logger.error('Cannot reload "wpa_supplicant" configuration.')
+
+    async def configure_wpa(self, config_parms=None):
+        """ set config_parms (default: all the configured ones) and save
+            the wpa_supplicant configuration
+        """
+        if config_parms is None:
+            config_parms = self.config_parms
+        if len(config_parms) == 0:
             return None
-        logging.debug("Starting configure_wpa procedure")
-        network_id = None
-        error = 0
-        cmd_timeout = time.time()
+        config_logger.debug("Starting configure_wpa procedure")
         success = None
-        for parm in self.config_parms:
-            self.write_wpa("set " + parm + " " + str(self.config_parms[parm]))
-            while True:
-                input_line = self.read_wpa()
-                if input_line is None:
-                    if error > self.max_num_failures:
-                        logging.critical(
-                            "Internal Error (configure_wpa): "
-                            "read_wpa() abnormally terminated"
-                        )
-                        self.terminate_enrol()
-                        self.terminate()
-                    logging.error("no data (configure_wpa)")
-                    time.sleep(0.5)
-                    error += 1
-                    continue
-                error = 0
-                logging.debug("(configure_wpa) Read '%s'", input_line)
-                if self.warn_on_input_errors(input_line):
-                    continue
-                if time.time() > cmd_timeout + self.min_conn_delay:
-                    logging.error(
-                        "Terminating configure_wpa procedure "
-                        "after timeout of %s seconds.",
-                        self.min_conn_delay,
-                    )
-                    return False
-                if "FAIL" in input_line:
-                    logging.error(
-                        'Cannot set parameter "%s" to "%s".',
-                        parm,
-                        self.config_parms[parm],
-                    )
-                    success = False
-                    break
-                if "OK" in input_line:
-                    if success is None:
-                        success = True
-                    break
-                logging.debug("(configure_wpa) PUSH '%s'", input_line)
-                self.stack.append(input_line)
-        if success is None:
-            logging.debug(
-                "configure_wpa procedure terminated without updating config."
-            )
+        replies = await self.request_all([
+            "set " + parm + " " + str(config_parms[parm])
+            for parm in config_parms
+        ])
+        for parm, lines in zip(config_parms, replies):
+            if lines is None:
+                config_logger.error(
+                    "Terminating configure_wpa procedure without reply.")
+                return False
+            if not self.is_ok(lines):
+                config_logger.error(
+                    'Cannot set parameter "%s" to "%s".',
+                    parm,
+                    config_parms[parm],
+                )
+                success = False
+            elif success is None:
+                success = True
         if not success:
-            logging.error(
+            config_logger.error(
                 "configure_wpa procedure terminated without saving config."
             )
-        if success:
-            if self.save_config_enabled:
-                self.flush_wpa()
-                self.write_wpa("save_config")
-                if not self.ok_fail_wpa():
-                    logging.error(
-                        'Save configuration not allowed by wpa_supplicant. '
-                        'Missing configuration file.')
-            logging.debug("configure_wpa procedure completed.")
+            return success
+        if self.save_config_enabled:
+            if not self.is_ok(await self.request("save_config")):
+                config_logger.error(
+                    'Save configuration not allowed by wpa_supplicant. '
+                    'Missing configuration file.')
+        config_logger.debug("configure_wpa procedure completed.")
         return success
 
-    def flush_wpa(self):
-        """Flush read data from wpa_cli
-        """
-        logging.debug("Starting flush_wpa procedure")
-        self.write_wpa("ping")
-        cmd_timeout = time.time()
-        error = 0
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (flush_wpa): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (flush_wpa)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("reading '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
-                    "Terminating flush_wpa procedure "
-                    "after timeout of %s seconds.",
-                    self.min_conn_delay,
-                )
-                break
-            if "PONG" in input_line:
-                logging.debug(
-                    "Terminating flush_wpa.")
-                break
-            logging.debug("(flush_wpa) PUSH '%s'", input_line)
-            self.stack.append(input_line)
-        return
-
-    def ok_fail_wpa(self):
-        """Read OK or FAIL from wpa_cli
-        """
-        logging.debug("Starting ok_fail_wpa procedure")
-        cmd_timeout = time.time()
-        error = 0
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (ok_fail_wpa): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (ok_fail_wpa)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("reading '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
-                    "Terminating ok_fail_wpa procedure "
-                    "after timeout of %s seconds.",
-                    self.min_conn_delay,
-                )
-                break
-            if "OK" in input_line:
-                logging.debug(
-                    "OK Received. Terminating ok_fail_wpa.")
-                return True
-            if "FAIL" in input_line:
-                logging.debug(
-                    "FAIL Received. Terminating ok_fail_wpa.")
-                return False
-            logging.debug("(ok_fail_wpa) PUSH '%s'", input_line)
-            self.stack.append(input_line)
-        return False
-
-    def add_network(self, cmd_timeout):
+    async def add_network(self):
         if len(self.network_parms) == 0:
             return False
-        logging.debug("Starting add_network procedure")
-        network_id = None
-        listn = None
-        self.write_wpa("add_network")
-        can_append = False
-        error = 0
-        last_command = "(Unknown command)"
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (add_network): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (add_network)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("(add_network) Read '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.error(
-                    "Terminating add_network procedure "
-                    "after timeout of %s seconds.",
-                    self.min_conn_delay,
-                )
-                break
-            tokens = input_line.split()
-            if tokens and tokens[0] == ">":  # remove prompt
-                tokens.pop(0)
-                if tokens and tokens[0].isnumeric():
-                    network_id = tokens[0]
-                    listn = 0
-                    input_line = "OK"
-                    can_append = True
-            if "FAIL" in input_line:
-                logging.error(
+        self.log.debug("Starting add_network procedure")
+        network_id = self.parse_network_id(await self.request("add_network"))
+        if network_id is None:
+            self.log.error("Cannot add network.")
+            return False
+        for parm in self.network_parms:
+            if not self.is_ok(await self.request(
+                    "set_network " + network_id + " " + parm)):
+                self.log.error(
                     'Cannot add network. '
                     'Check configuration and password length: "%s"',
-                    last_command)
-                listn = None
-                break
-            if "OK" in input_line:
-                if (
-                        listn is None
-                        or network_id is None
-                        or listn >= len(self.network_parms)
-                ):
-                    break
-                last_command = self.network_parms[listn]
-                self.write_wpa(
-                    "set_network "
-                    + network_id
-                    + " "
-                    + last_command
+                    parm)
+                return False
+        if not self.is_ok(await self.request(
+                "set_network " + network_id + " mode 3")):
+            self.log.error(
+                'cannot set "mode 3" to network "%s".', network_id)
+        if not self.is_ok(await self.request(
+                "set_network " + network_id + " disabled 2")):
+            self.log.error(
+                'cannot set "disabled 2" to network "%s".', network_id)
+        if self.save_config_enabled:
+            if not self.is_ok(await self.request("save_config")):
+                self.log.error(
+                    'Save configuration not supported by wpa_supplicant.')
+        self.persistent_network_id = None
+        self.log.debug("add_network procedure completed.")
+        return True
+
+    async def start_pers_group(self, cmd, ssid):
+        """ start a persistent group, waiting for P2P-GROUP-STARTED;
+            ssid (or None) is returned
+        """
+        started = self.expect("P2P-GROUP-STARTED", consume=True)
+        self.metrics.start("group_start_seconds")
+        if not self.is_ok(await self.request(
+                cmd
+                + (
+                    " " + self.p2p_group_add_opts
+                    if self.p2p_group_add_opts
+                    else ""
                 )
-                listn += 1
-                continue
-            if can_append:
-                logging.debug("(add_network) PUSH '%s'", input_line)
-                self.stack.append(input_line)
-        if listn and network_id:
-            self.flush_wpa()
-            self.write_wpa("set_network " + network_id + " mode 3")
-            if not self.ok_fail_wpa():
-                logging.error(
-                    'cannot set "mode 3" to network "%s".', network_id)
-            self.write_wpa("set_network " + network_id + " disabled 2")
-            if not self.ok_fail_wpa():
-                logging.error(
-                    'cannot set "disabled 2" to network "%s".', network_id)
-            if self.save_config_enabled:
-                self.write_wpa("save_config")
-                if not self.ok_fail_wpa():
-                    logging.error(
-                        'Save configuration not supported by wpa_supplicant.')
-            self.persistent_network_id = None
-            logging.debug("add_network procedure completed.")
-            return True
-        return False
+        )):
+            self.waiters = [w for w in self.waiters if w[1] is not started]
+            self.log.error("Cannot start persistent group.")
+            return None
+        input_line = await self.wait_event(started, self.min_conn_delay)
+        if input_line is None:
+            self.log.debug(
+                "Terminating persistent group start procedure "
+                "after timeout of %s seconds.",
+                self.min_conn_delay,
+            )
+            if self.monitor_group:
+                self.ssid_group = await self.analyze_existing_group(
+                    self.monitor_group
+                )
+                self.log.info(
+                    'Active group interface "%s"', self.monitor_group
+                )
+            return ssid
+        self.metrics.stop("group_start_seconds")
+        self.monitor_group, ssid_arg = self.parse_group_started(input_line)
+        if not ssid:
+            ssid = ssid_arg
+        self.log.info("Persistent group started %s", self.monitor_group)
+        self.log.debug(
+            'Persistent group activation procedure completed. ssid="%s"',
+            ssid,
+        )
+        return ssid
 
-    def list_start_pers_group(self, start_group=False):
+    async def list_start_pers_group(self, start_group=False):
         """ list or start p2p persistent group; ssid (or None) is returned """
-        logging.debug(
+        self.log.debug(
             'Starting list_start_pers_group procedure. start_group="%s"',
             start_group,
         )
         ssid = None
         if start_group and self.monitor_group:
-            logging.error("Group '%s' already active", self.monitor_group)
+            self.log.error("Group '%s' already active", self.monitor_group)
             return None
-        self.write_wpa("list_networks")
-        self.write_wpa("ping")
-        wait_cmd = 0
-        cmd_timeout = time.time()
-        error = 0
         test_add_network = False
         while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (list_start_pers_group): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (list_start_pers_group)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("(list_start_pers_group) Read '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
-                    "Terminating persistent group start procedure "
-                    "after timeout of %s seconds.",
-                    self.min_conn_delay,
-                )
-                if self.monitor_group:
-                    self.ssid_group = self.analyze_existing_group(
-                        self.monitor_group
-                    )
-                if self.monitor_group:
-                    logging.info(
-                        'Active group interface "%s"', self.monitor_group
-                    )
-                break
-            tokens = input_line.split("\t")
-            if "P2P-GROUP-STARTED" in tokens[0]:
-                tokens = input_line.split()
-                if tokens[0] == ">":  # remove prompt
-                    tokens.pop(0)
-                wait_cmd = 0
-                self.monitor_group = tokens[1]
-                ssid_arg = re.sub(
-                    r'.*ssid="([^"]*).*', r"\1", input_line, 1
-                )  # read ssid="<name>"
-                if not ssid:
-                    ssid = ssid_arg
-                logging.info(
-                    "Persistent group started %s", self.monitor_group)
-                logging.debug(
-                    "Persistent group activation procedure completed. "
-                    'ssid="%s"',
-                    ssid,
-                )
-                return ssid
-            if "OK" in input_line:
-                continue
-            if "FAIL" in input_line:
-                logging.error("Cannot start persistent group.")
-                ssid = None
-                break
-            if "PONG" in input_line and not wait_cmd:
-                logging.debug(
-                    "Terminating list_start_pers_group "
-                    'without finding any group. ssid="%s"',
-                    ssid,
-                )
-                if test_add_network:
-                    logging.error("Could not add network")
-                else:
-                    test_add_network = True
-                    if start_group and self.add_network(cmd_timeout):
-                        self.write_wpa("list_networks")
-                        self.write_wpa("ping")
-                        wait_cmd = 0
-                        error = 0
-                        continue
-                if (
-                        start_group
-                        and self.activate_persistent_group
-                        and not self.dynamic_group
-                        and not ssid
-                ):
-                    self.write_wpa(
-                        "p2p_group_add persistent"
-                        + (
-                            " " + self.p2p_group_add_opts
-                            if self.p2p_group_add_opts
-                            else ""
-                        )
-                    )
-                    wait_cmd = time.time()
-                    logging.warning("Starting generic persistent group")
-                    self.group_type = "Generic persistent"
-                    time.sleep(1)
-                else:
-                    self.write_wpa("p2p_find")
-                    break
-            if len(tokens) == 0:  # remove null line
-                continue
-            if tokens[0] == "network":
-                continue
-            if (
-                    len(tokens) == 4
-                    and "[P2P-PERSISTENT]" in tokens[3]
-                    and tokens[0].isnumeric()
-            ):
-                ssid = tokens[1]
+            for network_id, ssid in self.parse_persistent_groups(
+                    await self.request("list_networks")):
                 if (
                         self.persistent_network_id is not None
-                        and str(self.persistent_network_id) != tokens[0]
+                        and str(self.persistent_network_id) != network_id
                 ):
-                    logging.debug(
+                    self.log.debug(
                         "Skipping persistent group "
                         '"%s" with network ID %s, different from %s"',
-                        tokens[1],
-                        tokens[0],
+                        ssid,
+                        network_id,
                         self.persistent_network_id,
                     )
                     continue
-                self.persistent_network_id = tokens[0]
+                self.persistent_network_id = network_id
                 if not start_group:
                     continue
-                self.write_wpa(
-                    "p2p_group_add persistent="
-                    + self.persistent_network_id
-                    + (
-                        " " + self.p2p_group_add_opts
-                        if self.p2p_group_add_opts
-                        else ""
-                    )
-                )
                 self.group_type = "Persistent"
-                wait_cmd = time.time()
-                logging.warning(
+                self.log.warning(
                     'Starting persistent group "%s", n. %s '
                     "in the wpa_supplicant conf file.",
                     ssid,
@@ -1614,139 +3674,184 @@ config_parms: <class 'open_dict'>
                 )
                 self.external_program(
                     self.EXTERNAL_PROG_ACTION.START_GROUP, ssid)
-                time.sleep(1)
+                return await self.start_pers_group(
+                    "p2p_group_add persistent=" + self.persistent_network_id,
+                    ssid)
+            self.log.debug(
+                "Terminating list_start_pers_group "
+                'without finding any group. ssid="%s"',
+                ssid,
+            )
+            if test_add_network:
+                self.log.error("Could not add network")
+            else:
+                test_add_network = True
+                if start_group and await self.add_network():
+                    continue
+            break
+        if (
+                start_group
+                and self.activate_persistent_group
+                and not self.dynamic_group
+                and not ssid
+        ):
+            self.log.warning("Starting generic persistent group")
+            self.group_type = "Generic persistent"
+            return await self.start_pers_group(
+                "p2p_group_add persistent", ssid)
+        self.write_wpa("p2p_find")
         return ssid
 
-    def analyze_existing_group(self, group):
+    async def analyze_existing_group(self, group):
         """ ssid is returned if a persistent group is active, otherwise None """
-        logging.debug(
+        self.log.debug(
             'Starting analyze_existing_group procedure. group="%s"', group
         )
         if not group:
-            logging.error("No group available.")
+            self.log.error("No group available.")
             return None
         ssid = None
-        ssid_pg = self.list_start_pers_group(start_group=False)
+        ssid_pg = await self.list_start_pers_group(start_group=False)
         if not ssid_pg:
-            logging.info(
+            self.log.info(
                 'No persistent group available for interface "%s".', group
             )
             return None
-        self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_GO)
-        self.write_wpa("status")
-        self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_DEVICE)
-        self.write_wpa("ping")
-        cmd_timeout = time.time()
-        logging.debug(
+        self.log.debug(
             'List status of persistent group "%s", '
             'checking existence of ssid "%s"',
             group,
             ssid_pg,
         )
-        error = 0
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (analyze_existing_group): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (analyze_existing_group)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("(analyze_existing_group) Read '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
-                    'Terminating status retrieve of persistent group "%s" '
-                    'with ssid "%s" after timeout of %s seconds.',
-                    group,
-                    ssid_pg,
-                    self.min_conn_delay,
-                )
-                break
-            tokens = input_line.split("=", 1)
-            if tokens[0] == ">":  # remove prompt
-                tokens.pop(0)
-            if "ssid" in tokens[0]:
-                if tokens[1] == ssid_pg:
-                    ssid = tokens[1]
-                logging.debug(
-                    'Persistent group "%s" with ssid "%s" reports '
-                    'status ssid "%s".',
-                    group,
-                    ssid_pg,
-                    tokens[1],
-                )
-                continue
-            if "PONG" in input_line:
-                logging.debug('Terminating analysis; ssid="%s".', ssid)
-                break
+        self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_GO)
+        lines = await self.request("status")
+        self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_DEVICE)
+        for status_ssid in self.parse_status_ssid(lines):
+            if status_ssid == ssid_pg:
+                ssid = status_ssid
+            self.log.debug(
+                'Persistent group "%s" with ssid "%s" reports '
+                'status ssid "%s".',
+                group,
+                ssid_pg,
+                status_ssid,
+            )
+        self.log.debug('Terminating analysis; ssid="%s".', ssid)
         return ssid
 
-    def get_config_methods(self, pbc_in_use=None):
-        logging.debug(
+    async def get_config_methods(self, pbc_in_use=None):
+        self.log.debug(
             "Starting 'get config_methods' procedure. pbc_in_use=%s",
             pbc_in_use
         )
-        self.write_wpa("get config_methods")
-        self.write_wpa("ping")
-        wait_cmd = 0
-        cmd_timeout = time.time()
+        pbc_in_use = self.parse_config_methods(
+            await self.request("get config_methods"), pbc_in_use)
+        self.log.debug(
+            "Terminating get config_methods procedure; pbc_in_use=%s",
+            pbc_in_use,
+        )
+        return pbc_in_use
+
+    # Reply parsers ___________________________________________________________
+
+    @staticmethod
+    def is_ok(lines):
+        """ True if the reply lines include OK and not FAIL """
+        if not lines:
+            return False
+        if any("FAIL" in line for line in lines):
+            return False
+        return any("OK" in line for line in lines)
+
+    @staticmethod
+    def parse_p2p_interfaces(lines):
+        """ list of (name, tokens) of the p2p interfaces included in the
+            reply of "interface"; tokens are "p2p", the name of the
+            related interface (or "dev") and the group number
+        """
+        interfaces = []
+        for input_line in lines or []:
+            tokens = input_line.split("-")
+            if len(tokens) == 3 and tokens[0] == "p2p":
+                interfaces.append((input_line, tokens))
+        return interfaces
+
+    @staticmethod
+    def parse_stations(lines):
+        """ list of the station addresses in the reply of "list_sta" """
+        stations = []
+        for input_line in lines or []:
+            if re.match(
+                    "^[0-9a-f]{2}([-:]?)[0-9a-f]{2}(\\1[0-9a-f]{2}){4}$",
+                    input_line.lower(),
+            ):
+                transport_logger.debug('Active station "%s".', input_line)
+                stations.append(input_line)
+        return stations
+
+    @staticmethod
+    def parse_network_id(lines):
+        """ network number in the reply of "add_network" (or None) """
+        for input_line in lines or []:
+            tokens = input_line.split()
+            if len(tokens) == 1 and tokens[0].isnumeric():
+                return tokens[0]
+        return None
+
+    @staticmethod
+    def parse_persistent_groups(lines):
+        """ list of (network_id, ssid) of the persistent groups included
+            in the reply of "list_networks"
+        """
+        groups = []
+        for input_line in lines or []:
+            tokens = input_line.split("\t")
+            if (
+                    len(tokens) == 4
+                    and "[P2P-PERSISTENT]" in tokens[3]
+                    and tokens[0].isnumeric()
+            ):
+                groups.append((tokens[0], tokens[1]))
+        return groups
+
+    @staticmethod
+    def parse_status_ssid(lines):
+        """ list of the ssid values in the reply of "status" """
+        return [
+            tokens[1] for tokens in (
+                input_line.split("=", 1) for input_line in lines or []
+            ) if len(tokens) == 2 and "ssid" in tokens[0]
+        ]
+
+    @staticmethod
+    def parse_config_methods(lines, pbc_in_use=None):
+        """ pbc_in_use according to the reply of "get config_methods" """
         found = False
-        error = 0
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (get_config_methods): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (get_config_methods)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("(get_config_methods) Read '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.min_conn_delay:
-                logging.debug(
-                    "Terminating get_config_methods procedure after timeout "
-                    "of %s seconds; pbc_in_use=%s",
-                    self.min_conn_delay,
-                    pbc_in_use,
-                )
-                break
+        for input_line in lines or []:
             if "virtual_push_button" in input_line and not found:
                 pbc_in_use = True
-                logging.debug('Use "pbc" for config_methods, without pin.')
+                transport_logger.debug('Use "pbc" for config_methods, without pin.')
                 continue
             if "keypad" in input_line and not found:
                 pbc_in_use = False
                 found = True  # keypad has priority to virtual_push_button if both are included
-                logging.debug(
+                transport_logger.debug(
                     'Use "keypad" for config_methods, '
                     'with pin (do not use pbc).'
                 )
-                continue
-            if "PONG" in input_line:
-                logging.debug(
-                    "Terminating get config_methods procedure; pbc_in_use=%s",
-                    pbc_in_use,
-                )
-                break
         return pbc_in_use
 
+    @staticmethod
+    def parse_group_started(input_line):
+        """ group name and ssid of a P2P-GROUP-STARTED event """
+        tokens = input_line.split()
+        if tokens[0] == ">":  # remove prompt
+            tokens.pop(0)
+        ssid = re.sub(
+            r'.*ssid="([^"]*).*', r"\1", input_line, 1
+        )  # read ssid="<name>"
+        return tokens[1], ssid
+
     class EXTERNAL_PROG_ACTION:
         STARTED = "started"  # executed at hostp2pd startup
         TERMINATED = "terminated"  # executed at hostp2pd termination
@@ -1755,12 +3860,47 @@ config_parms: <class 'open_dict'>
         CONNECT = "connect"  # executed after a station connects a group
         DISCONNECT = "disconnect"  # executed after a station disconnects a group
 
+    def load_hook_module(self):
+        """ load the on_<action> functions of hook_module, called instead
+            of spawning a process for each action
+        """
+        self.hook_callbacks = {}
+        self.loaded_hook_module = self.hook_module
+        if not self.hook_module:
+            return
+        spec = importlib.util.spec_from_file_location(
+            "hostp2pd_hooks", self.hook_module
+        )
+        try:
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        except Exception as e:
+            hooks_logger.error(
+                'Cannot load hook module "%s": %s', self.hook_module, e)
+            return
+        for name, action in vars(self.EXTERNAL_PROG_ACTION).items():
+            if name.startswith("_"):
+                continue
+            callback = getattr(module, "on_" + action, None)
+            if callable(callback):
+                self.hook_callbacks[action] = callback
+        if not self.hook_callbacks:
+            hooks_logger.error(
+                'No "on_<action>" function in hook module "%s".',
+                self.hook_module)
+            return
+        hooks_logger.debug(
+            'Using hook module "%s": %s.', self.hook_module,
+            ", ".join(sorted(self.hook_callbacks)))
+
     def external_program(self, action, *args):
-        if (
+        callback = self.hook_callbacks.get(action)
+        run_program = not (
                 not self.run_program
                 or self.run_program.isspace()
                 or self.run_program == "-"
-        ):
+        )
+        if not run_program and not self.hook_callbacks:
             return
 
         if action == self.EXTERNAL_PROG_ACTION.START_GROUP:
@@ -1775,23 +3915,66 @@ config_parms: <class 'open_dict'>
             else:
                 self.run_prog_stopped = False
 
-        arguments = " ".join(args)
-        if arguments:
-            arguments = " " + arguments
-        logging.debug(
-            "Running %s %s %s", self.run_program, action, arguments)
-        ret = os.system(self.run_program + " " + action + arguments)
-        logging.debug(
-            "%s completed with exit code %s",
-            self.run_program,
-            os.WEXITSTATUS(ret))
+        group = None  # started, terminated, start_group, stop_group
+        station = None
+        cancels = None
+        if action in (
+                self.EXTERNAL_PROG_ACTION.CONNECT,
+                self.EXTERNAL_PROG_ACTION.DISCONNECT
+        ):  # arguments: station address, name, group
+            station = args[0] if args else None
+            group = args[2] if len(args) > 2 else self.monitor_group
+            if action == self.EXTERNAL_PROG_ACTION.DISCONNECT:
+                cancels = self.EXTERNAL_PROG_ACTION.CONNECT
+        if callback is not None:  # hook_module
+            self.run_external_command(
+                group,
+                functools.partial(callback, *args),
+                ("on_" + action, station),
+                cancels and ("on_" + cancels, station))
+        if run_program:
+            self.run_external_command(
+                group,
+                shlex.split(self.run_program) + [action] + list(args),
+                (action, station),
+                cancels and (cancels, station))
+
+    def start_exporter(self):
+        """ start, restart or stop the MetricsExporter of the Core
+            according to metrics_address
+        """
+        address = str(self.metrics_address or "")
+        if self.exporter is not None:
+            if self.exporter.address == address:
+                return
+            self.exporter.stop()
+            self.exporter = None
+        if not address:
+            return
+        try:
+            self.exporter = MetricsExporter(self, address).start()
+        except (OSError, ValueError) as e:
+            self.log.error(
+                'Cannot export the metrics to "%s": %s', address, e)
+
+    def run_external_command(self, key, command, tag, cancels=None):
+        """ queue the command (list of arguments or callable) to the
+            HookExecutor: the commands with the same key (the group of the
+            station, or None for the events of hostp2pd and of the groups)
+            are run in sequence
+        """
+        if self.hook_executor is None:
+            self.hook_executor = HookExecutor(
+                self.hook_workers, self.hook_timeout, self.coalesce_hooks,
+                self.metrics)
+        self.hook_executor.submit(key, command, tag, cancels)
 
     def default_workflow(self, event_stat_name):
         if "CTRL-EVENT-TERMINATING" in event_stat_name:
-            logging.warning("Service terminated")
+            self.log.warning("Service terminated")
             self.external_program(self.EXTERNAL_PROG_ACTION.TERMINATED)
             # self.terminate() # uncomment if you wan to terminate on CTRL-EVENT-TERMINATING
-            logging.error("wpa_supplicant disconnected")
+            self.log.error("wpa_supplicant disconnected")
             return True
 
         # Update statistics with unknown messages
@@ -1800,21 +3983,9 @@ config_parms: <class 'open_dict'>
         ):  # and [c for c in event_stat_name if c.islower()] == []: # uncomment to remove lower case commands from statistics
             unmanaged_event = "unmanaged_" + event_stat_name
             if self.is_enroller and not self.is_daemon:
-                os.write(
-                    self.father_slave_fd,
-                    (
-                        (
-                                "HOSTP2PD_STATISTICS"
-                                + "\t"
-                                + unmanaged_event
-                                + "\n"
-                        ).encode()
-                    ),
-                )
+                self.count_statistics(unmanaged_event)
                 return True
-            if unmanaged_event not in self.statistics:
-                self.statistics[unmanaged_event] = 0
-            self.statistics[unmanaged_event] += 1
+            self.metrics.inc("events", unmanaged_event)
         return True
 
     class ENROL_TYPE:
@@ -1822,20 +3993,20 @@ config_parms: <class 'open_dict'>
         PBC = 1
         DISPLAY = 2
 
-    def in_process_enrol(self, dev_name, mac_addr, type):
+    async def in_process_enrol(self, dev_name, mac_addr, type):
         """ Obsolete basic in-process function to perform the enrolling in the
             Core thread; using the Enroller process is suggested instead of
             this function (use_enroller).
         """
         if self.use_enroller:
-            logging.debug("Using enroller subprocess to connect.")
+            self.log.debug("Using enroller subprocess to connect.")
             return
-        if time.time() < self.p2p_connect_time + self.min_conn_delay:
-            logging.debug(
+        if not self.conn_delay_expired():
+            self.log.debug(
                 "Will not enroll due to unsufficient p2p_connect_time")
             return
         self.find_timing_level = "connect"
-        logging.debug(
+        self.log.debug(
             'Enrol dev_name="%s", mac_addr="%s", '
             'type="%s" to monitor_group="%s"',
             dev_name,
@@ -1843,41 +4014,15 @@ config_parms: <class 'open_dict'>
             type,
             self.monitor_group,
         )
-        cmd_timeout = time.time()
+        seen = self.expect("WPS-ENROLLEE-SEEN " + mac_addr, consume=True)
         self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_GO)
-        error = 0
-        while True:
-            input_line = self.read_wpa()
-            if input_line is None:
-                if error > self.max_num_failures:
-                    logging.critical(
-                        "Internal Error (in_process_enrol): "
-                        "read_wpa() abnormally terminated"
-                    )
-                    self.terminate_enrol()
-                    self.terminate()
-                logging.error("no data (in_process_enrol)")
-                time.sleep(0.5)
-                error += 1
-                continue
-            error = 0
-            logging.debug("(in_process_enrol) Read '%s'", input_line)
-            if self.warn_on_input_errors(input_line):
-                continue
-            if time.time() > cmd_timeout + self.max_negotiation_time:
-                logging.error(
-                    "Missing received enrolment request within %s seconds",
-                    self.max_negotiation_time,
-                )
-                type = None  # comment this if you want to try the enrolment anyway
-                break
-            # > <3>WPS-ENROLLEE-SEEN ee:54:44:24:70:df 811e2280-33d1-5ce8-97e5-6fcf1598c173 10-0050F204-5 0x4388 0 1 [test]
-            if "WPS-ENROLLEE-SEEN " in input_line:
-                tokens = input_line.split()
-                if tokens[0] == ">":  # remove prompt
-                    tokens.pop(0)
-                if tokens[1] == mac_addr:
-                    break
+        # > <3>WPS-ENROLLEE-SEEN ee:54:44:24:70:df 811e2280-33d1-5ce8-97e5-6fcf1598c173 10-0050F204-5 0x4388 0 1 [test]
+        if await self.wait_event(seen, self.max_negotiation_time) is None:
+            self.log.error(
+                "Missing received enrolment request within %s seconds",
+                self.max_negotiation_time,
+            )
+            type = None  # comment this if you want to try the enrolment anyway
         if type == self.ENROL_TYPE.PIN:
             self.last_pwd = self.get_pin(self.pin)
             hide_from_logging([self.last_pwd], "********")
@@ -1885,7 +4030,7 @@ config_parms: <class 'open_dict'>
         if type == self.ENROL_TYPE.PBC:
             self.write_wpa("wps_pbc " + mac_addr)
         self.p2p_command(self.P2P_COMMAND.SET_INTERFACE_P2P_DEVICE)
-        logging.debug("Enrol procedure terminated")
+        self.log.debug("Enrol procedure terminated")
         return
 
     def warn_on_input_errors(self, input_msg):
@@ -1895,10 +4040,13 @@ config_parms: <class 'open_dict'>
                 or "Connection established" in input_msg
         ):  # startup activator
             if input_msg != "Interactive mode":
-                logging.error(input_msg)
-            self.do_activation = True
+                transport_logger.error(input_msg)
             self.find_timing_level = "normal"
             self.max_scan_polling = 0
+            if not self.is_enroller and self.synced_state is not None:
+                self.do_resync = True  # already activated: see resync()
+                return True
+            self.do_activation = True
             self.terminate_enrol()
             return True
         if "Connected to interface" in input_msg:
@@ -1914,7 +4062,7 @@ config_parms: <class 'open_dict'>
             if (self.wpa_supplicant_min_err_warn is None or
                     self.wpa_supplicant_errors >
                         self.wpa_supplicant_min_err_warn):
-                logging.error(
+                transport_logger.error(
                     "%s - %s of %s",
                     input_msg,
                     self.wpa_supplicant_errors,
@@ -1925,27 +4073,53 @@ config_parms: <class 'open_dict'>
             self.ssid_group = None
             return True
         if "wpa_supplicant" in input_msg:
-            logging.warning(input_msg)
+            transport_logger.warning(input_msg)
             return True
         if "'SAVE_CONFIG' command timed out." in input_msg:
-            logging.critical("wpa_supplicant crashed due to missing configuration file.")
+            transport_logger.critical("wpa_supplicant crashed due to missing configuration file.")
             return True
         if "'PING' command failed." in input_msg:
-            logging.critical("wpa_supplicant connection error.")
+            transport_logger.critical("wpa_supplicant connection error.")
             return True
         return False
 
-    def register_statistics(self, event_stat_name):
-        self.statistics["last_response_message"] = event_stat_name
-        if "response_messages" not in self.statistics:
-            self.statistics["response_messages"] = 0
-        self.statistics["response_messages"] += 1
-        if event_stat_name not in self.statistics:
-            self.statistics[event_stat_name] = 0
-        self.statistics[event_stat_name] += 1
+    def register_statistics(self, event_stat_name, count=1):
+        self.metrics.info["last_response_message"] = event_stat_name
+        self.metrics.inc("response_messages", None, count)
+        self.metrics.inc("events", event_stat_name, count)
 
-    class P2P_COMMAND:
-        """ P2P commands to be used with p2p_command(). """
+    @property
+    def statistics(self):
+        """ flat statistics of the events (see metrics): counter of each
+            event, response_messages (total), last_response_message and
+            n_stations
+        """
+        snapshot = self.metrics.snapshot()
+        statistics = dict(snapshot["counters"].get("events", {}))
+        for name in "response_messages", "n_stations":
+            for family in snapshot["counters"], snapshot["gauges"]:
+                if name in family:
+                    statistics[name] = family[name][None]
+        statistics.update(snapshot["info"])
+        return statistics
+
+    def register_latency(self, name):
+        """ Core accounts the time elapsed since the start of the
+            Enroller (once per group, see run_enrol())
+        """
+        start_time = self.group_start_times.pop(name, None)
+        if start_time is None:
+            return
+        latency = time.monotonic() - start_time
+        self.metrics.observe("enroller_" + name + "_seconds", latency)
+        self.log.debug(
+            "Group start to %s: %.3f seconds.",
+            "Enroller ready" if name == "ready" else "first WPS response",
+            latency,
+        )
+
+    class P2P_COMMAND:
+        """ P2P commands to be used with p2p_command(). """
         SET_INTERFACE_P2P_GO = 0
         SET_INTERFACE_P2P_DEVICE = 1
         P2P_INVITE_PERSISTENT = 2
@@ -1980,7 +4154,7 @@ config_parms: <class 'open_dict'>
                    if self.p2p_connect_opts
                    else "")
             )
-            logging.debug('Invite %s to "%s" with %s',
+            self.log.debug('Invite %s to "%s" with %s',
                           mac_addr, self.monitor_group, persistent_postfix)
             return True
 
@@ -1993,7 +4167,7 @@ config_parms: <class 'open_dict'>
                    if self.p2p_connect_opts
                    else "")
             )
-            logging.debug('Invite %s to "%s"', mac_addr, self.monitor_group)
+            self.log.debug('Invite %s to "%s"', mac_addr, self.monitor_group)
             return True
 
         if command == self.P2P_COMMAND.P2P_CONNECT:
@@ -2011,12 +4185,212 @@ config_parms: <class 'open_dict'>
                    if self.p2p_connect_opts
                    else "")
             )
-            logging.warning("Connection request " +
+            self.log.warning("Connection request " +
                             ("(pbc method)" if self.pbc_in_use else "(PIN method)") +
                             ": %s", mac_addr)
             return True
         return None
 
+    async def activate(self):
+        """ Startup procedure: configure wpa_supplicant, initialize the
+            config method, announce the device and manage groups
+        """
+        if not self.is_enroller:
+            await self.configure_wpa()
+        # Initialize self.pbc_in_use
+        if self.pbc_in_use is None:
+            self.pbc_in_use = await self.get_config_methods(self.pbc_in_use)
+
+        # Initialize config method
+        await self.stop_find()
+        config_method = "virtual_push_button" if self.pbc_in_use else "keypad"
+        if not (self.is_warm and config_method == self.config_method_in_use):
+            await self.set_config_method(config_method)
+
+        # Announce
+        await self.request("p2p_find")
+
+        # Manage groups
+        if self.is_enroller:
+            self.log.debug(
+                '(enroller) Started on group "%s"', self.monitor_group
+            )
+            self.find_timing_level = "enroller"
+            self.send_to_core("HOSTP2PD_ENROLLER_READY")
+        else:  # Core startup
+            if self.ssid_postfix:
+                self.write_wpa("p2p_set ssid_postfix " + self.ssid_postfix)
+            self.monitor_group = await self.list_or_remove_group(remove=False)
+            if self.activate_autonomous_group and not self.monitor_group:
+                started = self.expect("P2P-GROUP-STARTED")
+                self.metrics.start("group_start_seconds")
+                await self.request(
+                    "p2p_group_add"
+                    + (
+                        " " + self.p2p_group_add_opts
+                        if self.p2p_group_add_opts
+                        else ""
+                    )
+                )
+                self.group_type = "Autonomous"
+                await self.wait_event(started, self.min_conn_delay)
+                self.monitor_group = await self.list_or_remove_group(
+                    remove=False)
+            if self.monitor_group:
+                self.ssid_group = await self.analyze_existing_group(
+                    self.monitor_group
+                )
+            else:
+                self.ssid_group = await self.list_start_pers_group(
+                    start_group=(
+                            self.activate_persistent_group
+                            and not self.dynamic_group
+                    )
+                )
+            if self.ssid_group:
+                self.log.info(
+                    'Configured autonomous/persistent group "%s"',
+                    self.ssid_group,
+                )
+            if self.monitor_group:
+                self.log.info(
+                    'Active group interface "%s"', self.monitor_group
+                )
+                self.run_enrol()
+                if not self.group_type:
+                    self.group_type = "Existing autonomous/persistent"
+
+            # Announce again
+            await self.stop_find()
+            self.write_wpa("p2p_find")
+            self.save_synced_state()
+            self.start_standby()
+
+        # Start processing commands
+        self.can_register_cmds = True
+
+    def save_synced_state(self):
+        """ cache the state applied to wpa_supplicant by the Core, which is
+            compared by resync() after a reconnection
+        """
+        self.synced_state = {
+            "interface": self.interface,
+            "config_method": self.config_method_in_use,
+            "persistent_network_id": self.persistent_network_id,
+            "monitor_group": self.monitor_group,
+            "ssid_group": self.ssid_group,
+            "group_type": self.group_type,
+        }
+
+    def resync_queries(self):
+        """ commands of the single query round of resync() """
+        return [
+            "interface", "get config_methods", "list_networks"
+        ] + ["get " + parm for parm in self.config_parms]
+
+    def resync_differences(self, replies):
+        """ compare the replies of resync_queries() with synced_state;
+            returns a dictionary with the config_parms and the config
+            method to re-apply, the active group and the command starting
+            the group which was lost (None if a full activation is needed)
+        """
+        state = self.synced_state
+        if state is None or None in replies:
+            return None
+        interfaces, config_methods, networks = replies[:3]
+        differences = {
+            "config_parms": {},
+            "config_method": None,
+            "group": None,
+            "start_group": None,
+        }
+        if state["interface"] not in [line.strip() for line in interfaces]:
+            self.log.warning(
+                'Interface "%s" not available.', state["interface"])
+            return None
+        for name, tokens in self.parse_p2p_interfaces(interfaces):
+            if tokens[2].isnumeric():
+                differences["group"] = name
+        for parm, lines in zip(self.config_parms, replies[3:]):
+            values = [line.strip() for line in lines if line.strip()]
+            if values != [str(self.config_parms[parm])]:
+                differences["config_parms"][parm] = self.config_parms[parm]
+        method = state["config_method"]
+        if method and [
+                line.strip() for line in config_methods if line.strip()
+        ] != [method]:
+            differences["config_method"] = method
+        network_id = state["persistent_network_id"]
+        if network_id is not None and str(network_id) not in (
+                network for network, ssid in
+                self.parse_persistent_groups(networks)):
+            self.log.warning(
+                "Persistent group with network ID %s not available.",
+                network_id)
+            return None
+        if state["monitor_group"] and not differences["group"]:
+            if state["group_type"] == "Autonomous":
+                differences["start_group"] = "p2p_group_add"
+            elif network_id is not None:
+                differences["start_group"] = (
+                    "p2p_group_add persistent=" + str(network_id))
+            else:
+                return None
+        return differences
+
+    async def resync(self):
+        """ Core procedure run when the connection to wpa_supplicant is
+            re-established (wpa_supplicant or wpa_cli restarted) after the
+            activation: only the differences between the cached state and
+            the one reported by wpa_supplicant are re-applied, otherwise
+            (state not comparable) the full activation is performed
+        """
+        self.log.debug("Starting resync procedure")
+        start = time.monotonic()
+        differences = self.resync_differences(
+            await self.request_all(self.resync_queries()))
+        if differences is None:
+            self.log.warning("Cannot resync wpa_supplicant: activating.")
+            self.terminate_enrol()
+            await self.activate()
+            return
+        state = self.synced_state
+        if differences["config_parms"]:
+            await self.configure_wpa(differences["config_parms"])
+        if differences["config_method"]:
+            await self.stop_find()
+            await self.set_config_method(differences["config_method"])
+        self.monitor_group = differences["group"]
+        self.ssid_group = state["ssid_group"]
+        if self.monitor_group and self.monitor_group != state["monitor_group"]:
+            self.terminate_enrol()
+            self.ssid_group = await self.analyze_existing_group(
+                self.monitor_group)
+        if differences["start_group"]:
+            self.terminate_enrol()
+            if self.ssid_postfix:
+                self.write_wpa("p2p_set ssid_postfix " + self.ssid_postfix)
+            self.log.warning(
+                'Restarting group "%s".', state["ssid_group"] or "")
+            self.external_program(
+                self.EXTERNAL_PROG_ACTION.START_GROUP, state["ssid_group"])
+            self.ssid_group = await self.start_pers_group(
+                differences["start_group"], state["ssid_group"])
+        if self.monitor_group:
+            self.run_enrol()
+        else:
+            self.terminate_enrol()
+        await self.request("p2p_find")
+        self.save_synced_state()
+        self.log.info(
+            "wpa_supplicant state resynchronized in %.3f seconds "
+            "(%s parameters, config method %s, group %s).",
+            time.monotonic() - start,
+            len(differences["config_parms"]),
+            differences["config_method"] or "unchanged",
+            differences["start_group"] and "restarted" or "unchanged",
+        )
+
     def handle(self, wpa_cli):
         """ handles all events """
         # https://w1.fi/wpa_supplicant/devel/ctrl_iface_page.html
@@ -2029,66 +4403,29 @@ config_parms: <class 'open_dict'>
             wpa_cli_word.pop(0)
         if len(wpa_cli_word) == 0:  # remove prompt only line
             return True
-        event_name = re.sub(
-            r"<[0-9]*>", r"", wpa_cli_word[0], 1
-        )  # first word is the event_name
+        event = Event(wpa_cli, wpa_cli_word, self)
+        event_key = wpa_cli_word[0]  # first word is the event_name
+        if event_key[:1] == "<" and ">" in event_key:  # remove "<n>" level
+            event_key = event_key.partition(">")[2]
+        event_name = event_key
         if event_name == "P2P:":
             event_name = wpa_cli_word[0]
-        if len(wpa_cli_word) > 1:
-            mac_addr = wpa_cli_word[1]  # second word is generally the mac_addr
-        else:
-            mac_addr = ""
-        dev_name = re.sub(
-            r".*name='([^']*).*", r"\1", wpa_cli, 1
-        )  # some event have "name="
-        p2p_dev_addr = re.sub(
-            r".*p2p_dev_addr=([^ ]*).*", r"\1", wpa_cli, 1
-        )  # some events have "p2p_dev_addr="
-        sa_addr = re.sub(
-            r".*sa=([^ ]*).*", r"\1", wpa_cli, 1
-        )  # some events have "sa="
-        sa_name = "[unknown]"
-        if sa_addr and sa_addr in self.addr_register:
-            sa_name = self.addr_register[sa_addr]
-        device_name_mac_addr = "[unknown]"
-        if mac_addr and mac_addr in self.addr_register:
-            device_name_mac_addr = self.addr_register[mac_addr]
-        device_name = "[unknown]"
-        if p2p_dev_addr and p2p_dev_addr in self.addr_register:
-            device_name = self.addr_register[p2p_dev_addr]
-        pri_dev_type = re.sub(
-            r".*pri_dev_type=([^ ]*).*", r"\1", wpa_cli, 1
-        )  # some events have "pri_dev_type="
-        device_type = self.p2p_primary_device_type['255-0050F204-1']
-        if pri_dev_type in self.p2p_primary_device_type:
-            device_type = self.p2p_primary_device_type[pri_dev_type]
-        dev_passwd_id = re.sub(
-            r".*dev_passwd_id=([^ ]*).*", r"\1", wpa_cli, 1
-        )  # some events have "dev_passwd_id="
-        password_id = 'Unknown'
-        if dev_passwd_id.isnumeric():
-            password_id = 'Random'
-            if int(dev_passwd_id) in self.p2p_password_id:
-                password_id = self.p2p_password_id[int(dev_passwd_id)]
-        go_intent = re.sub(
-            r".*go_intent=([^ ]*).*", r"\1", wpa_cli, 1
-        )  # some events have "go_intent="
-        ssid_arg = re.sub(
-            r'.*ssid="([^"]*).*', r"\1", wpa_cli, 1
-        )  # read ssid="<name>"
-        persistent_arg = re.sub(
-            r".*persistent=([0-9]*).*", r"\1", wpa_cli, 1
-        )  # read persistent=number
+        event.name = event_name
 
         if self.warn_on_input_errors(wpa_cli):
             # if ((self.is_enroller and self.wpa_supplicant_errors) or
             #        self.wpa_supplicant_errors > self.max_num_wpa_cli_failures):
             if self.wpa_supplicant_errors > self.max_num_wpa_cli_failures:
                 if self.is_enroller:
-                    os.write(self.father_slave_fd,
-                             "HOSTP2PD_TERMINATE_ENROLLER".encode())
+                    self.send_to_core("HOSTP2PD_TERMINATE_ENROLLER")
                 self.terminate()
                 return False
+            if self.do_resync:  # without waiting for the next event
+                self.do_resync = False
+                self.schedule(self.resync())
+            if self.do_activation:  # without waiting for the next event
+                self.do_activation = False
+                self.schedule(self.activate())
             return True
         self.wpa_supplicant_errors = 0
 
@@ -2099,10 +4436,20 @@ config_parms: <class 'open_dict'>
                 self.addr_register[stat_tokens[1]] = stat_tokens[2]
                 self.dev_type_register[stat_tokens[1]] = stat_tokens[3]
             return True
+        if event_name == "HOSTP2PD_HISTOGRAM":
+            stat_tokens = wpa_cli.split("\t")
+            for i in range(1, len(stat_tokens) - 4, 5):
+                name, label, total, maximum, counts = stat_tokens[i:i + 5]
+                self.metrics.merge(
+                    name, label or None,
+                    [int(count) for count in counts.split(",")],
+                    float(total), float(maximum))
+            return True
         if event_name == "HOSTP2PD_STATISTICS":
             stat_tokens = wpa_cli.split("\t")
-            if stat_tokens[1]:
-                self.register_statistics("E>" + stat_tokens[1])
+            for name, count in zip(stat_tokens[1::2], stat_tokens[2::2]):
+                self.register_statistics("E>" + name, int(count))
+            self.statistics_received.set()
             return True
         if (
                 wpa_cli == self.last_pwd or event_name == self.last_pwd
@@ -2111,18 +4458,11 @@ config_parms: <class 'open_dict'>
         event_stat_name = ""
         if event_name:
             event_stat_name = "<P2P>" if event_name in "P2P:" else event_name
+        event.stat_name = event_stat_name
         if self.is_enroller:
             if self.can_register_cmds:
                 if not self.is_daemon:
-                    os.write(
-                        self.father_slave_fd,
-                        (
-                                "HOSTP2PD_STATISTICS"
-                                + "\t"
-                                + event_stat_name
-                                + "\n"
-                        ).encode()
-                    )
+                    self.count_statistics(event_stat_name)
         else:
             if event_stat_name and self.can_register_cmds:
                 self.register_statistics(event_stat_name)
@@ -2130,648 +4470,645 @@ config_parms: <class 'open_dict'>
         # Startup procedure
         if self.do_activation:
             self.do_activation = False
-            if not self.is_enroller:
-                self.configure_wpa()
-            # Initialize self.pbc_in_use
-            if self.pbc_in_use is None:
-                self.pbc_in_use = self.get_config_methods(self.pbc_in_use)
-
-            # Initialize config method
-            self.write_wpa("p2p_stop_find")
-            time.sleep(1)
-            if self.pbc_in_use:
-                self.write_wpa("set config_methods virtual_push_button")
-                self.config_method_in_use = "virtual_push_button"
-            else:
-                self.write_wpa("set config_methods keypad")
-                self.config_method_in_use = "keypad"
-
-            # Announce
-            self.write_wpa("p2p_find")
-            time.sleep(1)
-
-            # Manage groups
-            if self.is_enroller:
-                logging.debug(
-                    '(enroller) Started on group "%s"', self.monitor_group
-                )
-                self.find_timing_level = "enroller"
-            else:  # Core startup
-                if self.ssid_postfix:
-                    self.write_wpa("p2p_set ssid_postfix " + self.ssid_postfix)
-                self.monitor_group = self.list_or_remove_group(remove=False)
-                if self.activate_autonomous_group and not self.monitor_group:
-                    self.write_wpa(
-                        "p2p_group_add"
-                        + (
-                            " " + self.p2p_group_add_opts
-                            if self.p2p_group_add_opts
-                            else ""
-                        )
-                    )
-                    self.group_type = "Autonomous"
-                    self.monitor_group = self.list_or_remove_group(
-                        remove=False)
-                if self.monitor_group:
-                    self.ssid_group = self.analyze_existing_group(
-                        self.monitor_group
-                    )
-                else:
-                    self.ssid_group = self.list_start_pers_group(
-                        start_group=(
-                                self.activate_persistent_group
-                                and not self.dynamic_group
-                        )
-                    )
-                if self.ssid_group:
-                    logging.info(
-                        'Configured autonomous/persistent group "%s"',
-                        self.ssid_group,
-                    )
-                if self.monitor_group:
-                    logging.info(
-                        'Active group interface "%s"', self.monitor_group
-                    )
-                    self.run_enrol()
-                    if not self.group_type:
-                        self.group_type = "Existing autonomous/persistent"
-
-                # Announce again
-                self.write_wpa("p2p_stop_find")
-                time.sleep(1)
-                self.write_wpa("p2p_find")
-
-            # Start processing commands
-            self.can_register_cmds = True
+            self.schedule(self.activate())
 
         # Discard some unrelevant commands or messages
         if event_name == "OK":
-            logging.debug("OK received")
+            self.log.debug("OK received")
             return True
         self.scan_polling = 0  # scan polling is reset by any message different than 'OK' and 'p2p_find'
 
-        if not any(skip in event_name for skip in self.do_not_debug):
-            logging.debug(
+        if self.log_event(wpa_cli):
+            self.log.debug(
                 "(enroller) event_name: %s" if self.is_enroller
                 else "event_name: %s", repr(event_name),
             )
 
-        # <3>CTRL-EVENT-SCAN-STARTED
-        if event_name == "CTRL-EVENT-SCAN-STARTED":
-            return True
+        # Dispatch the event to its handler (processing Enroller events
+        # terminates here in any case)
+        handler = (
+            self.enroller_handlers if self.is_enroller
+            else self.core_handlers
+        ).get(event_key)
+        if handler is None:
+            return self.default_workflow(event_stat_name)
+        return handler(self, event)
 
-        # <3>CTRL-EVENT-EAP-RETRANSMIT 02:87:01:8c:ce:f6
-        if event_name == "CTRL-EVENT-EAP-RETRANSMIT":
-            return True
+    def register_handler(self, event_name, handler, enroller=False):
+        """
+        Register a handler of a wpa_supplicant event (or HOSTP2PD_ message)
+        for the Core (default) or for the Enroller (enroller=True),
+        replacing any handler already registered for the same event.
+        event_name = first word of the event, without the "<n>" level
+        handler = function(hostp2pd, event), returning True to go on
+            processing events or False to stop; "event" is an Event object
+            (see Event class)
+        If handler is None, the event is unregistered (and then processed
+        by default_workflow).
+        """
+        table = self.enroller_handlers if enroller else self.core_handlers
+        if handler is None:
+            table.pop(event_name, None)
+        else:
+            table[event_name] = handler
 
-        # <3>CTRL-EVENT-SCAN-RESULTS
-        if event_name == "CTRL-EVENT-SCAN-RESULTS":
-            return True
+    # Event handlers of Core and Enroller __________________________________
 
-        # FAIL-CHANNEL-UNSUPPORTED
-        if event_name == "FAIL-CHANNEL-UNSUPPORTED":
-            logging.error("The requested channel is not available for P2P. "
-                          "(Possibly already in use)")
-            return True
+    # FAIL-CHANNEL-UNSUPPORTED
+    def handle_fail_channel_unsupported(self, event):
+        self.log.error("The requested channel is not available for P2P. "
+                      "(Possibly already in use)")
+        return True
 
-        # <3>CTRL-EVENT-DISCONNECTED bssid=de:a6:32:01:82:03 reason=3 locally_generated=1
-        if self.is_enroller and event_name == "CTRL-EVENT-DISCONNECTED":
-            logging.debug(
-                "CTRL-EVENT-DISCONNECTED received: terminating enroller"
-            )
-            self.count_active_sessions()
-            os.write(self.father_slave_fd,
-                     "HOSTP2PD_TERMINATE_ENROLLER".encode())
-            self.terminate()
-            return False
+    # <3>CTRL-EVENT-EAP-PROPOSED-METHOD vendor=0 method=1
+    def handle_eap_proposed_method(self, event):  # only on the GO (Enroller)
+        self.log.debug(
+            "(enroller) Proposed method %s %s",
+            event.words[1],
+            event.words[2],
+        )
+        return True
+
+    def ignore_event(self, event):
+        return True
+
+    # Event handlers of Enroller ___________________________________________
 
-        # <3>RX-PROBE-REQUEST sa=b6:3b:9b:7a:08:96 signal=0
-        if self.is_enroller and event_name == "RX-PROBE-REQUEST":
-            logging.debug(
+    # <3>CTRL-EVENT-DISCONNECTED bssid=de:a6:32:01:82:03 reason=3 locally_generated=1
+    def handle_enroller_disconnected(self, event):
+        self.log.debug(
+            "CTRL-EVENT-DISCONNECTED received: terminating enroller"
+        )
+        self.schedule(self.close_enroller())
+        return False
+
+    # <3>RX-PROBE-REQUEST sa=b6:3b:9b:7a:08:96 signal=0
+    def handle_enroller_rx_probe_request(self, event):
+        if self.log_event(event.line):
+            self.log.debug(
                 "(enroller) Received RX-PROBE-REQUEST from '%s' (%s)",
-                sa_addr,
-                sa_name,
+                event.sa_addr,
+                event.sa_name,
             )
-            return True
+        return True
 
-        # <3>CTRL-EVENT-SUBNET-STATUS-UPDATE status=0
-        if event_name == "CTRL-EVENT-SUBNET-STATUS-UPDATE":
-            return True
+    # <3>AP-STA-CONNECTED 56:3b:c6:4a:4a:b3 p2p_dev_addr=56:3b:c6:4a:4a:b3
+    def handle_enroller_sta_connected(self, event):
+        self.metrics.stop("wps_enrolment_seconds", event.mac_addr)
+        self.log.debug(
+            "(enroller) Station '%s' (%s) CONNECTED to group '%s'",
+            event.p2p_dev_addr,
+            event.device_name,
+            self.monitor_group,
+        )
+        self.schedule(self.count_active_sessions())
+        return True
 
-        # <3>CTRL-EVENT-EAP-STARTED 56:3b:c6:4a:4a:b3
-        if event_name == "CTRL-EVENT-EAP-STARTED":  # only on the GO (Enroller)
-            return True
+    # <3>AP-STA-DISCONNECTED 56:3b:c6:4a:4a:b3 p2p_dev_addr=56:3b:c6:4a:4a:b3
+    def handle_enroller_sta_disconnected(self, event):
+        self.log.debug(
+            "(enroller) Station '%s' (%s) DISCONNECTED from group '%s'",
+            event.p2p_dev_addr,
+            event.device_name,
+            self.monitor_group,
+        )
+        self.schedule(self.count_active_sessions())
+        return True
 
-        # <3>CTRL-EVENT-EAP-PROPOSED-METHOD vendor=0 method=1
-        if (
-                event_name == "CTRL-EVENT-EAP-PROPOSED-METHOD"
-        ):  # only on the GO (Enroller)
-            logging.debug(
-                "(enroller) Proposed method %s %s",
-                wpa_cli_word[1],
-                wpa_cli_word[2],
-            )
-            return True
+    # <3>AP-DISABLED
+    def handle_enroller_ap_disabled(self, event):
+        self.log.debug(
+            "(enroller) AP-DISABLED: terminating Enroller on group '%s'",
+            self.monitor_group,
+        )
+        self.schedule(self.close_enroller())
+        return False
 
-        # <3>WPS-REG-SUCCESS 72:dd:a8:c9:97:0e 811e2280-33d1-5ce8-97e5-6fcf1598c173
-        if event_name == "WPS-REG-SUCCESS":
-            return True
+    # <3>WPS-ENROLLEE-SEEN 56:3b:c6:4a:4a:b3 811e2280-33d1-5ce8-97e5-6fcf1598c173 10-0050F204-5 0x4388 0 1 [test]
+    def handle_enroller_enrollee_seen(self, event):  # only on the GO (Enroller)
+        mac_addr = event.mac_addr
+        e_device_name = re.sub(
+            r"^\[(.*)\]$", r"\1", " ".join(event.words[7:]), 1
+        )
+        device_type = self.p2p_primary_device_type['255-0050F204-1']
+        if event.words[3] in self.p2p_primary_device_type:
+            device_type = self.p2p_primary_device_type[event.words[3]]
+        self.addr_register[mac_addr] = e_device_name
+        self.dev_type_register[mac_addr] = device_type
+        self.send_to_core("HOSTP2PD_ADD_REGISTER" + "\t" + mac_addr + "\t"
+                          + e_device_name + "\t" + device_type)
+        self.metrics.start("wps_enrolment_seconds", mac_addr, restart=False)
+        self.log.debug(
+            'Enrolling %s "%s" with address "%s".',
+            device_type,
+            e_device_name,
+            mac_addr,
+        )
+        if self.pbc_in_use and (
+                self.pbc_white_list == [] or event.dev_name in self.pbc_white_list
+        ):
+            self.write_wpa("wps_pbc " + mac_addr)
+        else:
+            self.last_pwd = self.get_pin(self.pin)
+            hide_from_logging([self.last_pwd], "********")
+            self.write_wpa("wps_pin " + mac_addr + " " + self.last_pwd)
+        if not self.wps_responded:  # group start latency (see run_enrol())
+            self.wps_responded = True
+            self.send_to_core("HOSTP2PD_WPS_RESPONSE")
+        return True
 
-        # <3>WPS-SUCCESS
-        if event_name == "WPS-SUCCESS":
-            return True
+    # Event handlers of Core _______________________________________________
 
-        # <3>CTRL-EVENT-EAP-FAILURE 56:3b:c6:4a:4a:b3
-        if event_name == "CTRL-EVENT-EAP-FAILURE":  # only on the GO (Enroller)
+    def handle_terminate_enroller(self, event):
+        self.terminate_enrol()
+        self.find_timing_level = "normal"
+        self.monitor_group = None
+        return True
+
+    def handle_enroller_ready(self, event):
+        self.register_latency("ready")
+        return True
+
+    def handle_wps_response(self, event):
+        self.register_latency("wps")
+        return True
+
+    def handle_active_sessions(self, event):
+        stat_tokens = event.line.split("\t")
+        if stat_tokens[1]:
+            n_stations = stat_tokens[1]
+            if n_stations.isnumeric():
+                self.metrics.set("n_stations", int(n_stations))
+            self.schedule(self.restart_find(
+                remove_group=(
+                    n_stations == 0
+                    and self.dynamic_group
+                    and not self.activate_persistent_group
+                )
+            ))
+        return True
+
+    # <3>P2P: Reject scan trigger since one is already pending
+    def handle_p2p_message(self, event):
+        if "P2P: Reject scan trigger since one is already pending" in event.line:
+            self.scan_polling += 1
+            self.scan_governor.scan_rejected()
+            if self.find_timing_level in ("normal", "long"):
+                self.schedule_find()
             return True
+        return self.default_workflow(event.stat_name)
 
-        # <3>AP-STA-CONNECTED 56:3b:c6:4a:4a:b3 p2p_dev_addr=56:3b:c6:4a:4a:b3
-        if self.is_enroller and event_name == "AP-STA-CONNECTED":
-            logging.debug(
-                "(enroller) Station '%s' (%s) CONNECTED to group '%s'",
-                p2p_dev_addr,
-                device_name,
-                self.monitor_group,
+    # <3>P2P-GROUP-FORMATION-SUCCESS
+    def handle_group_formation_success(self, event):
+        self.find_timing_level = "connect"
+        return True
+
+    # <3>P2P-DEVICE-FOUND ae:e2:d3:41:27:14 p2p_dev_addr=ae:e2:d3:41:a7:14 pri_dev_type=3-0050F204-1 name='test' config_methods=0x0 dev_capab=0x25 group_capab=0x81 vendor_elems=1 new=1
+    def handle_device_found(self, event):
+        mac_addr = event.mac_addr
+        if not mac_addr:
+            return self.default_workflow(event.stat_name)
+        if mac_addr not in self.addr_register:
+            self.scan_governor.device_found()
+        self.addr_register[mac_addr] = event.dev_name
+        self.dev_type_register[mac_addr] = event.device_type
+        if self.log_event(event.line):
+            self.log.debug(
+                'Found %s with name "%s" and address "%s".',
+                event.device_type,
+                event.dev_name,
+                mac_addr,
             )
-            self.count_active_sessions()
-            return True
+        return True
 
-        # <3>AP-STA-DISCONNECTED 56:3b:c6:4a:4a:b3 p2p_dev_addr=56:3b:c6:4a:4a:b3
-        if self.is_enroller and event_name == "AP-STA-DISCONNECTED":
-            logging.debug(
-                "(enroller) Station '%s' (%s) DISCONNECTED from group '%s'",
-                p2p_dev_addr,
-                device_name,
+    # <3>P2P-GO-NEG-REQUEST ee:54:44:24:70:df dev_passwd_id=1 go_intent=6
+    # dev_passwd_id=<value> parameter indicates which config method is being requested.
+    def handle_go_neg_request(self, event):  # This does not provide "dev_name"
+        mac_addr = event.mac_addr
+        if not mac_addr:
+            return self.default_workflow(event.stat_name)
+        dev_passwd_id = event.dev_passwd_id
+        self.metrics.start("connection_seconds", mac_addr, restart=False)
+        self.find_timing_level = "connect"
+        self.log.debug(
+            "P2P-GO-NEG-REQUEST received, password ID=%s, go_intent=%s",
+            event.password_id, event.go_intent)
+        if self.pbc_in_use and not self.monitor_group:
+            if not mac_addr in self.addr_register:
+                self.log.error(
+                    'While pbc is in use, cannot find name '
+                    'related to address "%s".',
+                    mac_addr,
+                )
+                return True
+            if (
+                    self.pbc_white_list != []
+                    and not self.addr_register[mac_addr] in self.pbc_white_list
+            ):
+                self.schedule(self.rotate_config_method())
+                return True
+        if self.monitor_group:
+            self.log.debug(
+                'Connecting station with address "%s" '
+                'to existing group "%s".',
+                mac_addr,
                 self.monitor_group,
             )
-            self.count_active_sessions()
+            persistent_postfix = ""
+            if not self.pbc_in_use and dev_passwd_id != '1':
+                self.log.error(
+                    'Wrong dev_passwd_id received by address "%s": %s',
+                    mac_addr,
+                    dev_passwd_id
+                )
+                return True
+            if self.pbc_in_use and dev_passwd_id != '4':
+                self.log.error(
+                    'Wrong dev_passwd_id received by address "%s": %s',
+                    mac_addr,
+                    dev_passwd_id
+                )
+                return True
+            self.log.error(
+                'Invalid negotiation request from station with address '
+                '"%s".', mac_addr)
+            # self.write_wpa("p2p_group_remove " + self.monitor_group)
+            # self.monitor_group = ""
+            # self.p2p_command(
+            #    self.P2P_COMMAND.P2P_CONNECT, mac_addr)
+            return True
+        else:
+            self.log.debug(
+                'Connecting station with address "%s".', mac_addr)
+            self.start_session(mac_addr)
             return True
 
-        # <3>AP-DISABLED
-        if self.is_enroller and event_name == "AP-DISABLED":
-            logging.debug(
-                "(enroller) AP-DISABLED: terminating Enroller on group '%s'",
-                self.monitor_group,
-            )
-            self.count_active_sessions()
-            os.write(self.father_slave_fd,
-                     "HOSTP2PD_TERMINATE_ENROLLER".encode())
-            self.terminate()
-            return False
+    # P2P-PROV-DISC-PBC-REQ, P2P-PROV-DISC-ENTER-PIN, P2P-PROV-DISC-SHOW-PIN
+    def handle_prov_disc_request(self, event):
+        event_name = event.name
+        mac_addr = event.mac_addr
+        dev_name = event.dev_name
+        device_type = event.device_type
+        if not mac_addr or (
+                event_name == "P2P-PROV-DISC-SHOW-PIN"
+                and len(event.words) <= 2
+        ):
+            return self.default_workflow(event.stat_name)
+        self.scan_governor.prov_disc()
+        self.metrics.start("connection_seconds", mac_addr, restart=False)
+        self.find_timing_level = "connect"
+        self.p2p_connect_time = 0
 
-        # <3>WPS-ENROLLEE-SEEN 56:3b:c6:4a:4a:b3 811e2280-33d1-5ce8-97e5-6fcf1598c173 10-0050F204-5 0x4388 0 1 [test]
-        if event_name == "WPS-ENROLLEE-SEEN" and self.is_enroller:  # only on the GO (Enroller)
-            e_device_name = re.sub(
-                r"^\[(.*)\]$", r"\1", " ".join(wpa_cli_word[7:]), 1
+        # <3>P2P-PROV-DISC-ENTER-PIN 02:5e:6d:3d:99:8b p2p_dev_addr=02:5e:6d:3d:99:8b pri_dev_type=10-0050F204-5 name='test' config_methods=0x188 dev_capab=0x25 group_capab=0x0
+        if event_name == "P2P-PROV-DISC-ENTER-PIN":
+            self.log.error(
+                "%s '%s' with name '%s' asked "
+                "to enter its PIN to connect",
+                device_type,
+                mac_addr,
+                dev_name,
             )
-            device_type = self.p2p_primary_device_type['255-0050F204-1']
-            if wpa_cli_word[3] in self.p2p_primary_device_type:
-                device_type = self.p2p_primary_device_type[wpa_cli_word[3]]
-            self.addr_register[mac_addr] = e_device_name
             self.dev_type_register[mac_addr] = device_type
-            os.write(self.father_slave_fd, ("HOSTP2PD_ADD_REGISTER" + "\t"
-                                            + mac_addr + "\t" + e_device_name + "\t" + device_type
-                                            + "\n").encode())
-            logging.debug(
-                'Enrolling %s "%s" with address "%s".',
+            # self.write_wpa("p2p_reject " + mac_addr)
+
+        # <3>P2P-PROV-DISC-PBC-REQ ca:d5:d5:38:d6:69 p2p_dev_addr=ca:d5:d5:38:d6:69 pri_dev_type=10-0050F204-5 name='test' config_methods=0x88 dev_capab=0x25 group_capab=0x0
+        if event_name == "P2P-PROV-DISC-PBC-REQ" and not self.pbc_in_use:
+            self.log.error(
+                "%s '%s' with name '%s' asked to connect with PBC",
                 device_type,
-                e_device_name,
                 mac_addr,
+                dev_name,
             )
-            if self.pbc_in_use and (
-                    self.pbc_white_list == [] or dev_name in self.pbc_white_list
-            ):
-                self.write_wpa("wps_pbc " + mac_addr)
-            else:
-                self.last_pwd = self.get_pin(self.pin)
-                hide_from_logging([self.last_pwd], "********")
-                self.write_wpa("wps_pin " + mac_addr + " " + self.last_pwd)
-            return True
-
-        if self.is_enroller:  # processing enroller commands terminates here
-            return self.default_workflow(event_stat_name)
-
-        # ___________________________________________________________________________________________
-        if event_name == "HOSTP2PD_TERMINATE_ENROLLER":
-            self.terminate_enrol()
-            self.find_timing_level = "normal"
-            self.monitor_group = None
-            return True
-
-        if event_name == "HOSTP2PD_ACTIVE_SESSIONS":
-            stat_tokens = wpa_cli.split("\t")
-            if stat_tokens[1]:
-                n_stations = stat_tokens[1]
-                self.statistics["n_stations"] = n_stations
-                if (
-                        n_stations == 0
-                        and self.dynamic_group
-                        and not self.activate_persistent_group
-                ):
-                    if self.monitor_group:
-                        self.write_wpa(
-                            "p2p_group_remove " + self.monitor_group)
-                        self.external_program(
-                            self.EXTERNAL_PROG_ACTION.STOP_GROUP,
-                            self.monitor_group)
-                        self.monitor_group = ""
-                    else:
-                        self.monitor_group = self.list_or_remove_group(True)
-                        self.external_program(
-                            self.EXTERNAL_PROG_ACTION.STOP_GROUP)
-                    time.sleep(3)
-                self.write_wpa("p2p_find")
-            return True
-
-        # <3>P2P: Reject scan trigger since one is already pending
-        if "P2P: Reject scan trigger since one is already pending" in wpa_cli:
-            self.scan_polling += 1
-            self.find_timing_level = "long"
-            return True
-
-        # <3>P2P-GROUP-FORMATION-SUCCESS
-        if event_name == "P2P-GROUP-FORMATION-SUCCESS":
-            self.find_timing_level = "connect"
-            return True
-
-        # <3>P2P-DEVICE-FOUND ae:e2:d3:41:27:14 p2p_dev_addr=ae:e2:d3:41:a7:14 pri_dev_type=3-0050F204-1 name='test' config_methods=0x0 dev_capab=0x25 group_capab=0x81 vendor_elems=1 new=1
-        if event_name == "P2P-DEVICE-FOUND" and mac_addr:
-            self.addr_register[mac_addr] = dev_name
             self.dev_type_register[mac_addr] = device_type
-            if self.is_enroller:
-                os.write(self.father_slave_fd, ("HOSTP2PD_ADD_REGISTER" + "\t"
-                                                + mac_addr + "\t" + dev_name + "\t" + device_type
-                                                + "\n").encode())
-            logging.debug(
-                'Found %s with name "%s" and address "%s".',
+            # self.write_wpa("p2p_reject " + mac_addr)
+
+        # <3>P2P-PROV-DISC-SHOW-PIN ee:54:44:24:70:df 93430999 p2p_dev_addr=ee:54:44:24:70:df pri_dev_type=10-0050F204-5 name='test' config_methods=0x188 dev_capab=0x25 group_capab=0x0
+        if event_name == "P2P-PROV-DISC-SHOW-PIN" and self.pbc_in_use:
+            self.log.error(
+                "%s '%s' with name '%s' asked to connect with PIN",
                 device_type,
-                dev_name,
                 mac_addr,
+                dev_name,
             )
-            return True
+            self.dev_type_register[mac_addr] = device_type
+            # self.write_wpa("p2p_reject " + mac_addr)
 
-        # <3>P2P-GO-NEG-REQUEST ee:54:44:24:70:df dev_passwd_id=1 go_intent=6
-        # dev_passwd_id=<value> parameter indicates which config method is being requested.
-        if event_name == "P2P-GO-NEG-REQUEST" and mac_addr:  # This does not provide "dev_name"
-            self.find_timing_level = "connect"
-            logging.debug(
-                "P2P-GO-NEG-REQUEST received, password ID=%s, go_intent=%s",
-                password_id, go_intent)
-            if self.pbc_in_use and not self.monitor_group:
-                if not mac_addr in self.addr_register:
-                    logging.error(
-                        'While pbc is in use, cannot find name '
-                        'related to address "%s".',
-                        mac_addr,
-                    )
-                    return True
-                if (
-                        self.pbc_white_list != []
-                        and not self.addr_register[mac_addr] in self.pbc_white_list
-                ):
-                    self.rotate_config_method()
-                    return True
+        if event_name == "P2P-PROV-DISC-SHOW-PIN" and not self.pbc_in_use:
             if self.monitor_group:
-                logging.debug(
-                    'Connecting station with address "%s" '
-                    'to existing group "%s".',
+                self.log.debug(
+                    'Connecting station with name "%s" and address "%s" '
+                    "using PIN to existing group.",
+                    dev_name,
                     mac_addr,
-                    self.monitor_group,
                 )
-                persistent_postfix = ""
-                if not self.pbc_in_use and dev_passwd_id != '1':
-                    logging.error(
-                        'Wrong dev_passwd_id received by address "%s": %s',
-                        mac_addr,
-                        dev_passwd_id
-                    )
-                    return True
-                if self.pbc_in_use and dev_passwd_id != '4':
-                    logging.error(
-                        'Wrong dev_passwd_id received by address "%s": %s',
-                        mac_addr,
-                        dev_passwd_id
-                    )
-                    return True
-                logging.error(
-                    'Invalid negotiation request from station with address '
-                    '"%s".', mac_addr)
-                # self.write_wpa("p2p_group_remove " + self.monitor_group)
-                # self.monitor_group = ""
-                # self.p2p_command(
-                #    self.P2P_COMMAND.P2P_CONNECT, mac_addr)
+                self.schedule(self.in_process_enrol(
+                    dev_name, mac_addr, self.ENROL_TYPE.PIN
+                ))
                 return True
             else:
-                logging.debug(
-                    'Connecting station with address "%s".', mac_addr)
                 self.start_session(mac_addr)
                 return True
 
         if (
                 event_name == "P2P-PROV-DISC-PBC-REQ"
-                or event_name == "P2P-PROV-DISC-ENTER-PIN"
-                or (event_name == "P2P-PROV-DISC-SHOW-PIN"
-                    and len(wpa_cli_word) > 2)
-        ) and mac_addr:
-            self.find_timing_level = "connect"
-            self.p2p_connect_time = 0
-
-            # <3>P2P-PROV-DISC-ENTER-PIN 02:5e:6d:3d:99:8b p2p_dev_addr=02:5e:6d:3d:99:8b pri_dev_type=10-0050F204-5 name='test' config_methods=0x188 dev_capab=0x25 group_capab=0x0
-            if event_name == "P2P-PROV-DISC-ENTER-PIN":
-                logging.error(
-                    "%s '%s' with name '%s' asked "
-                    "to enter its PIN to connect",
-                    device_type,
-                    mac_addr,
-                    dev_name,
-                )
-                self.dev_type_register[mac_addr] = device_type
-                # self.write_wpa("p2p_reject " + mac_addr)
-
-            # <3>P2P-PROV-DISC-PBC-REQ ca:d5:d5:38:d6:69 p2p_dev_addr=ca:d5:d5:38:d6:69 pri_dev_type=10-0050F204-5 name='test' config_methods=0x88 dev_capab=0x25 group_capab=0x0
-            if event_name == "P2P-PROV-DISC-PBC-REQ" and not self.pbc_in_use:
-                logging.error(
-                    "%s '%s' with name '%s' asked to connect with PBC",
-                    device_type,
-                    mac_addr,
+                and self.pbc_in_use
+                and dev_name
+        ):
+            if (
+                    self.pbc_white_list != []
+                    and not dev_name in self.pbc_white_list
+            ):
+                self.schedule(self.rotate_config_method())
+                return True
+            if self.monitor_group:
+                self.log.debug(
+                    'Connecting station with name "%s" and address "%s" '
+                    "using PBC to existing group.",
                     dev_name,
-                )
-                self.dev_type_register[mac_addr] = device_type
-                # self.write_wpa("p2p_reject " + mac_addr)
-
-            # <3>P2P-PROV-DISC-SHOW-PIN ee:54:44:24:70:df 93430999 p2p_dev_addr=ee:54:44:24:70:df pri_dev_type=10-0050F204-5 name='test' config_methods=0x188 dev_capab=0x25 group_capab=0x0
-            if event_name == "P2P-PROV-DISC-SHOW-PIN" and self.pbc_in_use:
-                logging.error(
-                    "%s '%s' with name '%s' asked to connect with PIN",
-                    device_type,
                     mac_addr,
-                    dev_name,
                 )
-                self.dev_type_register[mac_addr] = device_type
-                # self.write_wpa("p2p_reject " + mac_addr)
-
-            if event_name == "P2P-PROV-DISC-SHOW-PIN" and not self.pbc_in_use:
-                if self.monitor_group:
-                    logging.debug(
-                        'Connecting station with name "%s" and address "%s" '
-                        "using PIN to existing group.",
-                        dev_name,
-                        mac_addr,
-                    )
-                    self.in_process_enrol(
-                        dev_name, mac_addr, self.ENROL_TYPE.PIN
-                    )
-                    return True
-                else:
-                    self.start_session(mac_addr)
-                    return True
-
-            if (
-                    event_name == "P2P-PROV-DISC-PBC-REQ"
-                    and self.pbc_in_use
-                    and dev_name
-            ):
-                if (
-                        self.pbc_white_list != []
-                        and not dev_name in self.pbc_white_list
-                ):
-                    self.rotate_config_method()
-                    return True
-                if self.monitor_group:
-                    logging.debug(
-                        'Connecting station with name "%s" and address "%s" '
-                        "using PBC to existing group.",
-                        dev_name,
-                        mac_addr,
-                    )
-                    self.in_process_enrol(
-                        dev_name, mac_addr, self.ENROL_TYPE.PBC
-                    )
-                    return True
-                else:
-                    self.start_session(mac_addr)
-                    return True
-
-            logging.debug(
-                'Invalid connection request. Event="%s", station name="%s", '
-                'address="%s", group="%s", persistent group="%s".',
-                event_name,
-                dev_name,
-                mac_addr,
-                self.monitor_group,
-                self.ssid_group,
-            )
-            if self.pbc_in_use:
-                # self.write_wpa("p2p_remove_client " + mac_addr)
-                self.write_wpa("p2p_prov_disc " + mac_addr + " pbc")
+                self.schedule(self.in_process_enrol(
+                    dev_name, mac_addr, self.ENROL_TYPE.PBC
+                ))
+                return True
             else:
-                # self.write_wpa("p2p_remove_client " + mac_addr)
-                self.write_wpa("p2p_prov_disc " + mac_addr + " keypad")
-            self.in_process_enrol(
-                dev_name, mac_addr, self.ENROL_TYPE.PIN
-            )  # this has the effect to remove the invitation at the end of the failure
-            return True
+                self.start_session(mac_addr)
+                return True
 
-        # <3>AP-STA-CONNECTED ee:54:44:24:70:df p2p_dev_addr=ee:54:44:24:70:df
-        if event_name == "AP-STA-CONNECTED":
-            self.p2p_connect_time = 0
-            self.find_timing_level = "normal"
-            logging.warning(
-                "Station '%s' (%s) CONNECTED to group '%s'",
-                p2p_dev_addr,
-                device_name,
-                self.monitor_group,
-            )
-            self.external_program(
-                self.EXTERNAL_PROG_ACTION.CONNECT,
-                p2p_dev_addr, device_name, self.monitor_group)
-            return True
+        self.log.debug(
+            'Invalid connection request. Event="%s", station name="%s", '
+            'address="%s", group="%s", persistent group="%s".',
+            event_name,
+            dev_name,
+            mac_addr,
+            self.monitor_group,
+            self.ssid_group,
+        )
+        if self.pbc_in_use:
+            # self.write_wpa("p2p_remove_client " + mac_addr)
+            self.write_wpa("p2p_prov_disc " + mac_addr + " pbc")
+        else:
+            # self.write_wpa("p2p_remove_client " + mac_addr)
+            self.write_wpa("p2p_prov_disc " + mac_addr + " keypad")
+        self.schedule(self.in_process_enrol(
+            dev_name, mac_addr, self.ENROL_TYPE.PIN
+        ))  # this has the effect to remove the invitation at the end of the failure
+        return True
 
-        # <3>AP-STA-DISCONNECTED ee:54:44:24:70:df p2p_dev_addr=ee:54:44:24:70:df
-        if event_name == "AP-STA-DISCONNECTED":
-            logging.warning(
-                'Station "%s" (%s) disconnected.', p2p_dev_addr, device_name
-            )
-            self.external_program(
-                self.EXTERNAL_PROG_ACTION.DISCONNECT,
-                p2p_dev_addr, device_name, self.monitor_group)
-            self.p2p_connect_time = 0
-            self.find_timing_level = "normal"
-            return True
+    # <3>AP-STA-CONNECTED ee:54:44:24:70:df p2p_dev_addr=ee:54:44:24:70:df
+    def handle_sta_connected(self, event):
+        self.metrics.stop("connection_seconds", event.p2p_dev_addr)
+        self.p2p_connect_time = 0
+        self.find_timing_level = "normal"
+        self.log.warning(
+            "Station '%s' (%s) CONNECTED to group '%s'",
+            event.p2p_dev_addr,
+            event.device_name,
+            self.monitor_group,
+        )
+        self.external_program(
+            self.EXTERNAL_PROG_ACTION.CONNECT,
+            event.p2p_dev_addr, event.device_name, self.monitor_group)
+        return True
 
-        # <3>P2P-PROV-DISC-FAILURE p2p_dev_addr=b6:3b:9b:7a:08:96 status=1
-        if event_name == "P2P-PROV-DISC-FAILURE":
-            logging.warning(
-                'Provision discovery failed for station "%s" (%s).',
-                p2p_dev_addr,
-                device_name,
-            )
-            self.p2p_connect_time = 0
-            self.find_timing_level = "normal"
-            if self.dynamic_group and not self.activate_persistent_group:
-                if self.monitor_group:
-                    self.write_wpa("p2p_group_remove " + self.monitor_group)
-                    self.external_program(
-                        self.EXTERNAL_PROG_ACTION.STOP_GROUP,
-                        self.monitor_group)
-                    self.monitor_group = ""
-                else:
-                    self.monitor_group = self.list_or_remove_group(True)
-                    self.external_program(
-                        self.EXTERNAL_PROG_ACTION.STOP_GROUP)
-                time.sleep(3)
-            self.write_wpa("p2p_find")
-            return True
+    # <3>AP-STA-DISCONNECTED ee:54:44:24:70:df p2p_dev_addr=ee:54:44:24:70:df
+    def handle_sta_disconnected(self, event):
+        self.log.warning(
+            'Station "%s" (%s) disconnected.',
+            event.p2p_dev_addr, event.device_name
+        )
+        self.external_program(
+            self.EXTERNAL_PROG_ACTION.DISCONNECT,
+            event.p2p_dev_addr, event.device_name, self.monitor_group)
+        self.p2p_connect_time = 0
+        self.find_timing_level = "normal"
+        return True
 
-        # <3>P2P-INVITATION-ACCEPTED sa=5a:5f:0a:96:ee:5e persistent=4 freq=5220
-        if event_name == "P2P-INVITATION-ACCEPTED":
-            logging.warning(
-                "Accepted invitation to persistent group %s.", persistent_arg
+    # <3>P2P-PROV-DISC-FAILURE p2p_dev_addr=b6:3b:9b:7a:08:96 status=1
+    def handle_prov_disc_failure(self, event):
+        self.log.warning(
+            'Provision discovery failed for station "%s" (%s).',
+            event.p2p_dev_addr,
+            event.device_name,
+        )
+        self.metrics.cancel("connection_seconds", event.p2p_dev_addr)
+        self.p2p_connect_time = 0
+        self.find_timing_level = "normal"
+        self.schedule(self.restart_find(
+            remove_group=(
+                self.dynamic_group and not self.activate_persistent_group
             )
-            self.find_timing_level = "connect"
-            self.external_program(
-                self.EXTERNAL_PROG_ACTION.START_GROUP, persistent_arg)
-            return True
+        ))
+        return True
 
-        if event_name == "P2P-FIND-STOPPED":
-            if time.time() > self.p2p_connect_time + self.min_conn_delay:
-                self.write_wpa("p2p_find")
-            return True
+    # <3>P2P-INVITATION-ACCEPTED sa=5a:5f:0a:96:ee:5e persistent=4 freq=5220
+    def handle_invitation_accepted(self, event):
+        self.log.warning(
+            "Accepted invitation to persistent group %s.",
+            event.persistent_arg
+        )
+        self.find_timing_level = "connect"
+        self.external_program(
+            self.EXTERNAL_PROG_ACTION.START_GROUP, event.persistent_arg)
+        return True
 
-        # <3>P2P-DEVICE-LOST p2p_dev_addr=02:87:01:8c:ce:f6
-        if event_name == "P2P-DEVICE-LOST":
-            logging.info(
-                'Received P2P-DEVICE-LOST, station "%s" (%s)',
-                p2p_dev_addr,
-                device_name,
-            )
-            return True
+    def handle_find_stopped(self, event):
+        self.restart_find_after_conn_delay()
+        return True
 
-        if event_name == "WPS-TIMEOUT":
-            logging.error("Received WPS-TIMEOUT")
-            self.find_timing_level = "normal"
-            self.p2p_connect_time = 0
-            return True
+    # <3>P2P-DEVICE-LOST p2p_dev_addr=02:87:01:8c:ce:f6
+    def handle_device_lost(self, event):
+        self.log.info(
+            'Received P2P-DEVICE-LOST, station "%s" (%s)',
+            event.p2p_dev_addr,
+            event.device_name,
+        )
+        return True
 
-        #  <3>P2P-GO-NEG-SUCCESS role=GO freq=5200 ht40=1 peer_dev=ea:cb:a8:16:a5:d9 peer_iface=ea:cb:a8:16:a5:d9 wps_method=PBC, event_name=P2P-GO-NEG-SUCCESS
-        if event_name == "P2P-GO-NEG-SUCCESS":
-            logging.debug("P2P-GO-NEG-SUCCESS")
-            self.find_timing_level = "connect"
-            return True
+    def handle_wps_timeout(self, event):
+        self.log.error("Received WPS-TIMEOUT")
+        self.find_timing_level = "normal"
+        self.p2p_connect_time = 0
+        return True
 
-        if event_name == "P2P-GROUP-STARTED" and wpa_cli_word[1]:
-            self.find_timing_level = "connect"
-            self.monitor_group = wpa_cli_word[1]
-            if ssid_arg:
-                self.ssid_group = ssid_arg
-            logging.warning(
-                "Autonomous group started: %s", self.monitor_group)
-            self.run_enrol()
-            return True
+    #  <3>P2P-GO-NEG-SUCCESS role=GO freq=5200 ht40=1 peer_dev=ea:cb:a8:16:a5:d9 peer_iface=ea:cb:a8:16:a5:d9 wps_method=PBC, event_name=P2P-GO-NEG-SUCCESS
+    def handle_go_neg_success(self, event):
+        self.log.debug("P2P-GO-NEG-SUCCESS")
+        self.metrics.stop(
+            "go_negotiation_seconds", event.fields.get("peer_dev"))
+        self.find_timing_level = "connect"
+        return True
 
-        # <3>P2P-GROUP-REMOVED p2p-wlan0-0 GO reason=REQUESTED
-        # <3>P2P-GROUP-REMOVED p2p-wlan0-22 GO reason=FORMATION_FAILED
-        if event_name == "P2P-GROUP-REMOVED":
-            self.terminate_enrol()
-            self.find_timing_level = "normal"
-            if self.monitor_group:
-                if self.monitor_group == wpa_cli_word[1]:
-                    logging.info(
-                        'Removed group "%s" of type "%s", %s',
-                        self.monitor_group,
-                        wpa_cli_word[2],
-                        wpa_cli_word[3],
-                    )
-                else:
-                    logging.error(
-                        'Even if active group was "%s", '
-                        'removed group "%s" of type "%s", %s',
-                        self.monitor_group,
-                        wpa_cli_word[1],
-                        wpa_cli_word[2],
-                        wpa_cli_word[3],
-                    )
+    def handle_group_started(self, event):
+        if len(event.words) < 2 or not event.words[1]:
+            return self.default_workflow(event.stat_name)
+        self.find_timing_level = "connect"
+        self.monitor_group = event.words[1]
+        if event.ssid_arg:
+            self.ssid_group = event.ssid_arg
+        self.metrics.stop("group_start_seconds")
+        self.log.warning(
+            "Autonomous group started: %s", self.monitor_group)
+        self.run_enrol()
+        return True
+
+    # <3>P2P-GROUP-REMOVED p2p-wlan0-0 GO reason=REQUESTED
+    # <3>P2P-GROUP-REMOVED p2p-wlan0-22 GO reason=FORMATION_FAILED
+    def handle_group_removed(self, event):
+        wpa_cli_word = event.words
+        self.terminate_enrol()
+        self.find_timing_level = "normal"
+        if self.monitor_group:
+            if self.monitor_group == wpa_cli_word[1]:
+                self.log.info(
+                    'Removed group "%s" of type "%s", %s',
+                    self.monitor_group,
+                    wpa_cli_word[2],
+                    wpa_cli_word[3],
+                )
             else:
-                logging.info(
-                    'Could not create group "%s" of type "%s", %s',
+                self.log.error(
+                    'Even if active group was "%s", '
+                    'removed group "%s" of type "%s", %s',
+                    self.monitor_group,
                     wpa_cli_word[1],
                     wpa_cli_word[2],
                     wpa_cli_word[3],
                 )
-            self.monitor_group = None
-            if time.time() > self.p2p_connect_time + self.min_conn_delay:
+        else:
+            self.log.info(
+                'Could not create group "%s" of type "%s", %s',
+                wpa_cli_word[1],
+                wpa_cli_word[2],
+                wpa_cli_word[3],
+            )
+        self.monitor_group = None
+        self.restart_find_after_conn_delay()
+        return True
+
+    # <3>P2P-GROUP-FORMATION-FAILURE
+    def handle_group_formation_failure(self, event):
+        self.metrics.cancel("group_start_seconds")
+        self.monitor_group = None
+        self.p2p_connect_time = 0
+        self.find_timing_level = "normal"
+        if self.dynamic_group and not self.activate_persistent_group:
+            self.num_failures += 1
+            if self.num_failures < self.max_num_failures:
+                self.log.warning(
+                    "Retrying group formation: %s of %s",
+                    self.num_failures,
+                    self.max_num_failures,
+                )
+                self.schedule(self.retry_session())  # use the last value of self.station
+            else:
+                self.log.error("Group formation failed.")
+                self.num_failures = 0
+                self.external_program(
+                    self.EXTERNAL_PROG_ACTION.STOP_GROUP)
                 self.write_wpa("p2p_find")
             return True
+        else:
+            self.log.critical(
+                "Group formation failed (P2P-GROUP-FORMATION-FAILURE)."
+            )
+            return True
+            # self.terminate()
+            # return False
 
-        # <3>P2P-GROUP-FORMATION-FAILURE
-        if event_name == "P2P-GROUP-FORMATION-FAILURE":
-            self.monitor_group = None
-            self.p2p_connect_time = 0
-            self.find_timing_level = "normal"
-            if self.dynamic_group and not self.activate_persistent_group:
-                self.num_failures += 1
-                if self.num_failures < self.max_num_failures:
-                    logging.warning(
-                        "Retrying group formation: %s of %s",
-                        self.num_failures,
-                        self.max_num_failures,
-                    )
-                    if self.num_failures > 1:
-                        time.sleep(2)
-                    self.start_session()  # use the last value of self.station
-                else:
-                    logging.error("Group formation failed.")
-                    self.num_failures = 0
-                    self.external_program(
-                        self.EXTERNAL_PROG_ACTION.STOP_GROUP)
-                    self.write_wpa("p2p_find")
-                return True
-            else:
-                logging.critical(
-                    "Group formation failed (P2P-GROUP-FORMATION-FAILURE)."
+    def handle_go_neg_failure(self, event):
+        self.metrics.cancel("go_negotiation_seconds", self.station)
+        self.metrics.cancel("group_start_seconds")
+        self.find_timing_level = "normal"
+        self.p2p_connect_time = 0
+        if self.dynamic_group and not self.activate_persistent_group:
+            self.num_failures += 1
+            if self.num_failures < self.max_num_failures:
+                self.log.warning(
+                    "Retrying negotiation: %s of %s",
+                    self.num_failures,
+                    self.max_num_failures,
                 )
-                return True
-                # self.terminate()
-                # return False
-
-        if event_name == "P2P-GO-NEG-FAILURE":
-            self.find_timing_level = "normal"
-            self.p2p_connect_time = 0
-            if self.dynamic_group and not self.activate_persistent_group:
-                self.num_failures += 1
-                if self.num_failures < self.max_num_failures:
-                    logging.warning(
-                        "Retrying negotiation: %s of %s",
-                        self.num_failures,
-                        self.max_num_failures,
-                    )
-                    if self.num_failures > 1:
-                        time.sleep(2)
-                    self.start_session()  # use the last value of self.station
-                else:
-                    logging.error("Cannot negotiate P2P Group Owner.")
-                    self.num_failures = 0
-                    self.external_program(
-                        self.EXTERNAL_PROG_ACTION.STOP_GROUP)
-                    self.write_wpa("p2p_find")
-                return True
+                self.schedule(self.retry_session())  # use the last value of self.station
+            else:
+                self.log.error("Cannot negotiate P2P Group Owner.")
+                self.num_failures = 0
+                self.external_program(
+                    self.EXTERNAL_PROG_ACTION.STOP_GROUP)
+                self.write_wpa("p2p_find")
+            return True
+        return self.default_workflow(event.stat_name)
 
-        if event_name == "FAIL":
-            self.find_timing_level = "normal"
-            self.p2p_connect_time = 0
-            if self.dynamic_group and not self.activate_persistent_group:
-                logging.info("Connection failed")
-                self.monitor_group = self.list_or_remove_group(True)
-                self.num_failures += 1
-                if self.num_failures < self.max_num_failures:
-                    if self.num_failures > 1:
-                        time.sleep(2)
-                    self.start_session()  # use the last value of self.station
-                else:
-                    self.num_failures = 0
-                    self.external_program(
-                        self.EXTERNAL_PROG_ACTION.STOP_GROUP)
-                    self.write_wpa("p2p_find")
-                return True
+    def handle_fail(self, event):
+        self.metrics.cancel("group_start_seconds")
+        self.find_timing_level = "normal"
+        self.p2p_connect_time = 0
+        if self.dynamic_group and not self.activate_persistent_group:
+            self.log.info("Connection failed")
+            self.schedule(self.remove_groups())
+            self.num_failures += 1
+            if self.num_failures < self.max_num_failures:
+                self.schedule(self.retry_session())  # use the last value of self.station
+            else:
+                self.num_failures = 0
+                self.external_program(
+                    self.EXTERNAL_PROG_ACTION.STOP_GROUP)
+                self.schedule(self.restart_find())
+            return True
+        return self.default_workflow(event.stat_name)
+
+    # Event tables: event name (without "<n>" level) -> handler ____________
+    # handle() looks up the event in the table of the Core or in the one of
+    # the Enroller; unregistered events are processed by default_workflow().
+    # Use register_handler() to add or replace handlers of an instance.
+
+    common_handlers = {
+        "CTRL-EVENT-SCAN-STARTED": ignore_event,
+        "CTRL-EVENT-EAP-RETRANSMIT": ignore_event,
+        "CTRL-EVENT-SCAN-RESULTS": ignore_event,
+        "FAIL-CHANNEL-UNSUPPORTED": handle_fail_channel_unsupported,
+        "CTRL-EVENT-SUBNET-STATUS-UPDATE": ignore_event,
+        "CTRL-EVENT-EAP-STARTED": ignore_event,  # only on the GO (Enroller)
+        "CTRL-EVENT-EAP-PROPOSED-METHOD": handle_eap_proposed_method,
+        "WPS-REG-SUCCESS": ignore_event,
+        "WPS-SUCCESS": ignore_event,
+        "CTRL-EVENT-EAP-FAILURE": ignore_event,  # only on the GO (Enroller)
+    }
 
-        return self.default_workflow(event_stat_name)
+    enroller_handlers = dict(common_handlers)
+    enroller_handlers.update({
+        "CTRL-EVENT-DISCONNECTED": handle_enroller_disconnected,
+        "RX-PROBE-REQUEST": handle_enroller_rx_probe_request,
+        "AP-STA-CONNECTED": handle_enroller_sta_connected,
+        "AP-STA-DISCONNECTED": handle_enroller_sta_disconnected,
+        "AP-DISABLED": handle_enroller_ap_disabled,
+        "WPS-ENROLLEE-SEEN": handle_enroller_enrollee_seen,
+    })
+
+    core_handlers = dict(common_handlers)
+    core_handlers.update({
+        "HOSTP2PD_TERMINATE_ENROLLER": handle_terminate_enroller,
+        "HOSTP2PD_ACTIVE_SESSIONS": handle_active_sessions,
+        "HOSTP2PD_ENROLLER_READY": handle_enroller_ready,
+        "HOSTP2PD_WPS_RESPONSE": handle_wps_response,
+        "P2P:": handle_p2p_message,
+        "P2P-GROUP-FORMATION-SUCCESS": handle_group_formation_success,
+        "P2P-DEVICE-FOUND": handle_device_found,
+        "P2P-GO-NEG-REQUEST": handle_go_neg_request,
+        "P2P-PROV-DISC-PBC-REQ": handle_prov_disc_request,
+        "P2P-PROV-DISC-ENTER-PIN": handle_prov_disc_request,
+        "P2P-PROV-DISC-SHOW-PIN": handle_prov_disc_request,
+        "AP-STA-CONNECTED": handle_sta_connected,
+        "AP-STA-DISCONNECTED": handle_sta_disconnected,
+        "P2P-PROV-DISC-FAILURE": handle_prov_disc_failure,
+        "P2P-INVITATION-ACCEPTED": handle_invitation_accepted,
+        "P2P-FIND-STOPPED": handle_find_stopped,
+        "P2P-DEVICE-LOST": handle_device_lost,
+        "WPS-TIMEOUT": handle_wps_timeout,
+        "P2P-GO-NEG-SUCCESS": handle_go_neg_success,
+        "P2P-GROUP-STARTED": handle_group_started,
+        "P2P-GROUP-REMOVED": handle_group_removed,
+        "P2P-GROUP-FORMATION-FAILURE": handle_group_formation_failure,
+        "P2P-GO-NEG-FAILURE": handle_go_neg_failure,
+        "FAIL": handle_fail,
+    })
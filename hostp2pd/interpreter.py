@@ -173,17 +173,31 @@ class Interpreter(Cmd):
 
     def do_loglevel(self, arg):
         "If an argument is given, set the logging level,\n"
-        "otherwise show the current one.\n"
+        "otherwise show the current one and the ones of the components.\n"
+        "Use 'loglevel <component> <level>' to set the level of a component\n"
+        "(core, enroller, transport, hooks, config); 0 = level of hostp2pd.\n"
         "CRITICAL=50, ERROR=40, WARNING=30, INFO=20, DEBUG=10."
-        conf_file = self.hostp2pd.config_file
-        if arg and arg.isnumeric():
-            self.hostp2pd.logger.setLevel(int(arg))
+        from .hostp2pd import LOGGERS
+        args = arg.split()
+        if len(args) == 1 and args[0].isnumeric():
+            self.hostp2pd.logger.setLevel(int(args[0]))
             print("Logging level set to",
                 self.hostp2pd.logger.getEffectiveLevel())
+        elif len(args) == 2:
+            if self.hostp2pd.set_log_levels({args[0]: args[1]}):
+                print("Logging level of", args[0], "set to",
+                    LOGGERS[args[0]].getEffectiveLevel())
+            else:
+                print("Invalid component or level")
+        elif args:
+            print("Invalid format")
         else:
             print(
                 "Current logging level:",
                     self.hostp2pd.logger.getEffectiveLevel())
+            for component, logger in LOGGERS.items():
+                print("  {:10s} = {}".format(
+                    component, logger.getEffectiveLevel()))
 
     def do_reload(self, arg):
         "Reload configuration from the latest valid configuration file.\n"
@@ -239,10 +253,12 @@ class Interpreter(Cmd):
             print("Invalid format")
             return
         format_string = "  {:35s} = {}"
-        if self.hostp2pd.statistics:
+        self.hostp2pd.statistics_update()  # events accounted by the Enroller
+        statistics = self.hostp2pd.statistics
+        if statistics:
             print("Statistics:")
-            for i in sorted(self.hostp2pd.statistics):
-                print(format_string.format(i, self.hostp2pd.statistics[i]))
+            for i in sorted(statistics):
+                print(format_string.format(i, statistics[i]))
         else:
             print("No statistics available.")
         print("Internal parameters:")
@@ -292,9 +308,12 @@ class Interpreter(Cmd):
                 self.hostp2pd.config_method_in_use
             )
         )
+        p2p_connect_time = self.hostp2pd.p2p_connect_time  # monotonic clock
         print(
             format_string.format(
-                "p2p_connect_time", self.hostp2pd.p2p_connect_time
+                "p2p_connect_time (seconds ago)",
+                "{:.1f}".format(time.monotonic() - p2p_connect_time)
+                if p2p_connect_time else None
             )
         )
         print(
@@ -302,6 +321,31 @@ class Interpreter(Cmd):
                 "find_timing_level", self.hostp2pd.find_timing_level
             )
         )
+        scan_governor = self.hostp2pd.scan_governor
+        print(
+            format_string.format(
+                "p2p_find refresh period (seconds)",
+                "{:.1f}".format(self.hostp2pd.find_interval())
+            )
+        )
+        print(
+            format_string.format(
+                "Adaptive period (min, max)", "{:.1f} ({}, {})".format(
+                    scan_governor.interval,
+                    scan_governor.min_interval,
+                    scan_governor.max_interval)
+            )
+        )
+        print(
+            format_string.format(
+                "New stations per minute", "{:.2f}".format(scan_governor.rate)
+            )
+        )
+        print(
+            format_string.format(
+                "Rejected scan triggers", scan_governor.rejected
+            )
+        )
         print(format_string.format("Logging level",
             self.hostp2pd.logger.level))
         print(
@@ -321,14 +365,74 @@ class Interpreter(Cmd):
                 "Number of scan pollings", self.hostp2pd.scan_polling
             )
         )
-        try:
+        event_queue = self.hostp2pd.event_queue
+        print(
+            format_string.format(
+                "Queued events (max, limit)", "{} ({}, {})".format(
+                    len(event_queue),
+                    event_queue.max_depth,
+                    event_queue.max_size)
+            )
+        )
+        print(
+            format_string.format(
+                "Dropped discovery events", event_queue.dropped
+            )
+        )
+        print(
+            format_string.format(
+                "Suppressed debug logs",
+                self.hostp2pd.log_limiter.suppressed
+            )
+        )
+        from .hostp2pd import log_queue  # current value
+        if log_queue is not None:
             print(
                 format_string.format(
-                    "wpa_cli process Pid", self.hostp2pd.process.pid
+                    "Queued log records (size, dropped)", "{} ({}, {})".format(
+                        log_queue.handler.queue.qsize(),
+                        log_queue.size,
+                        log_queue.handler.dropped)
+                )
+            )
+        if self.hostp2pd.exporter is not None:
+            print(
+                format_string.format(
+                    "Metrics exporter", self.hostp2pd.exporter.address
+                )
+            )
+        if self.hostp2pd.wpa_ctrl is not None:
+            print(
+                format_string.format(
+                    "Control interface",
+                    os.path.join(
+                        self.hostp2pd.wpa_ctrl.ctrl_interface,
+                        self.hostp2pd.wpa_ctrl.interface,
+                    ),
+                )
+            )
+            print(
+                format_string.format(
+                    "Control interface connected",
+                    self.hostp2pd.wpa_ctrl.connected,
+                )
+            )
+        else:
+            try:
+                print(
+                    format_string.format(
+                        "wpa_cli process Pid", self.hostp2pd.process.pid
+                    )
+                )
+            except:
+                print("  Error: wpa_cli process ID not existing!")
+            print(
+                format_string.format(
+                    "wpa_cli restarts (downtime)", "{} ({:.1f} s)".format(
+                        self.hostp2pd.process_supervisor.restarts,
+                        self.hostp2pd.process_supervisor.downtime)
                 )
             )
-        except:
-            print("  Error: wpa_cli process ID not existing!")
         try:
             print(
                 format_string.format(
@@ -337,6 +441,72 @@ class Interpreter(Cmd):
             )
         except:
             print("  Enroller wpa_cli process ID is not existing.")
+        print(
+            format_string.format(
+                "Enroller restarts (downtime)", "{} ({:.1f} s)".format(
+                    self.hostp2pd.enroller_supervisor.restarts,
+                    self.hostp2pd.enroller_supervisor.downtime)
+            )
+        )
+        print(
+            format_string.format(
+                "Enroller starts (warm/cold/thread)",
+                "{} ({}/{}/{})".format(
+                    sum(self.hostp2pd.enroller_starts.values()),
+                    self.hostp2pd.enroller_starts["warm"],
+                    self.hostp2pd.enroller_starts["cold"],
+                    self.hostp2pd.enroller_starts["thread"])
+            )
+        )
+        metrics = self.hostp2pd.metrics.snapshot()
+        histograms = metrics["histograms"]
+        counters = metrics["counters"]
+
+        def percentiles(histogram):
+            return (
+                "p50 {:.3f} s, p90 {:.3f} s, p99 {:.3f} s, max {:.3f} s"
+            ).format(
+                histogram.percentile(50),
+                histogram.percentile(90),
+                histogram.percentile(99),
+                histogram.max)
+
+        hook_executor = self.hostp2pd.hook_executor
+        if hook_executor is not None:
+            print(
+                format_string.format(
+                    "Queued hooks (coalesced)", "{} ({})".format(
+                        hook_executor.pending, hook_executor.coalesced)
+                )
+            )
+            for action, histogram in sorted(
+                    histograms.get("hook_seconds", {}).items()):
+                print(
+                    format_string.format(
+                        "Hook " + action,
+                        "{} runs, {} failed, {} timed out, last exit code {}"
+                        .format(
+                            histogram.count,
+                            counters.get("hook_failures", {}).get(action, 0),
+                            counters.get("hook_timeouts", {}).get(action, 0),
+                            hook_executor.exit_codes.get(action))
+                    )
+                )
+                print(format_string.format("", percentiles(histogram)))
+        print("Latencies:")
+        for name, (description, label_name) in (
+                self.hostp2pd.metrics.descriptions.items()):
+            if name not in histograms or name == "hook_seconds":
+                continue
+            for label, histogram in sorted(histograms[name].items()):
+                print(
+                    format_string.format(
+                        description if label is None
+                        else name.split("_")[0].capitalize() + " " + label,
+                        "{} samples, {}".format(
+                            histogram.count, percentiles(histogram))
+                    )
+                )
 
     def do_pause(self, arg):
         "Pause the execution."
@@ -730,7 +900,7 @@ def main():
         w_p2p_interpreter = None
         try:
             with hostp2pd as session:
-                if hostp2pd.process == None or hostp2pd.process.pid == None:
+                if session is None:
                     print("\nCannot start hostp2pd.\n")
                     os._exit(1)  # does not raise SystemExit
                 while hostp2pd.threadState == hostp2pd.THREAD.STARTING:
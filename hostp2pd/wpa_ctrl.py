@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+import os
+import time
+import socket
+import logging
+import threading
+import itertools
+from collections import deque
+from select import select
+
+transport_logger = logging.getLogger("hostp2pd.transport")
+
+
+class WpaCtrl:
+    """
+    Native client of the wpa_supplicant control interface, alternative to
+    the wpa_cli subprocess (ref. wpa_transport).
+    Commands are sent through a request socket; unsolicited events are
+    received through a separate event socket registered with ATTACH.
+    Replies, events and connection messages are queued to "lines" with
+    the same text used by wpa_cli, so that they can be read like the
+    wpa_cli output (without prompts and echo).
+    The sockets are opened and closed under "lock", as the commands can
+    be processed by a thread (e.g., "interface" switching the sockets)
+    while another one reads the events.
+    ctrl_interface = wpa_supplicant control interface directory
+    interface = interface name ("auto" selects the first available one)
+    """
+
+    local_dir = "/tmp"       # directory of the local (client) sockets
+    request_timeout = 10     # seconds. Same timeout used by wpa_cli
+    reconnect_secs = 5       # seconds. Retry period when not connected
+    max_msg_size = 8192      # maximum size of a datagram
+    counter = itertools.count()
+
+    def __init__(self, ctrl_interface, interface):
+        self.ctrl_interface = ctrl_interface
+        self.interface = interface
+        self.ctrl_sock = None
+        self.event_sock = None
+        self.connected = False
+        self.lines = deque()
+        self.lock = threading.RLock()
+
+    def list_interfaces(self):
+        """ list the interfaces exposed in the control interface directory """
+        try:
+            return sorted(
+                f for f in os.listdir(self.ctrl_interface)
+                if not f.startswith(".")
+            )
+        except OSError:
+            return []
+
+    def _socket(self):
+        """ return a socket bound to a local path and connected to the
+            control interface of the selected interface
+        """
+        local_path = os.path.join(
+            self.local_dir,
+            "hostp2pd_ctrl_%s-%s" % (os.getpid(), next(self.counter))
+        )
+        if os.path.exists(local_path):
+            os.unlink(local_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sock.bind(local_path)
+            sock.connect(os.path.join(self.ctrl_interface, self.interface))
+        except OSError:
+            self._close_socket(sock)
+            raise
+        return sock
+
+    def _close_socket(self, sock, release=True):
+        try:
+            local_path = sock.getsockname()
+        except OSError:
+            local_path = None
+        sock.close()
+        if release and local_path:
+            try:
+                os.unlink(local_path)
+            except OSError:
+                pass
+
+    def open(self):
+        """ connect the request and event sockets;
+            returns True if connected to wpa_supplicant
+        """
+        with self.lock:
+            return self._open()
+
+    def _open(self):
+        if self.interface == "auto":
+            interfaces = self.list_interfaces()
+            if not interfaces:
+                self.lines.append(
+                    "Could not connect to wpa_supplicant: (nil) - re-trying")
+                return False
+            self.interface = interfaces[0]
+        try:
+            self.ctrl_sock = self._socket()
+            self.event_sock = self._socket()
+        except OSError as e:
+            transport_logger.debug(
+                'Cannot connect control interface "%s": %s',
+                os.path.join(self.ctrl_interface, self.interface), e
+            )
+            self.close()
+            self.lines.append(
+                "Could not connect to wpa_supplicant: "
+                + self.interface + " - re-trying"
+            )
+            return False
+        self.connected = True
+        if self._request(self.event_sock, "ATTACH") != "OK\n":
+            self.close()
+            return False
+        return True
+
+    def close(self, release=True):
+        """ close the sockets; with release=False (e.g., in a forked
+            process sharing the sockets) no DETACH is sent and the local
+            socket files are not removed.
+        """
+        with self.lock:
+            if self.event_sock is not None:
+                if release and self.connected:
+                    try:
+                        self.event_sock.send(b"DETACH")
+                    except OSError:
+                        pass
+                self._close_socket(self.event_sock, release)
+            if self.ctrl_sock is not None:
+                self._close_socket(self.ctrl_sock, release)
+            self.event_sock = None
+            self.ctrl_sock = None
+            self.connected = False
+
+    def reconnect(self):
+        """ try reconnecting wpa_supplicant after the connection is lost """
+        with self.lock:
+            self.close()
+            lines = len(self.lines)
+            if self.open():
+                self.lines.append(
+                    "Connection to wpa_supplicant re-established")
+                return True
+            while len(self.lines) > lines:  # do not repeat the warning
+                self.lines.pop()
+            return False
+
+    def connection_lost(self):
+        self.close()
+        self.lines.append(
+            "Connection to wpa_supplicant lost - trying to reconnect")
+
+    def fileno(self):
+        """ file descriptor of the event socket (None if not connected) """
+        with self.lock:
+            if self.event_sock is None:
+                return None
+            return self.event_sock.fileno()
+
+    def _request(self, sock, cmd, timeout=None):
+        """ send a command and wait for its reply (timeout defaults to
+            request_timeout); returns the reply string or None (error or
+            timeout)
+        """
+        if timeout is None:
+            timeout = self.request_timeout
+        try:
+            while select([sock], [], [], 0)[0]:  # discard late replies
+                sock.recv(self.max_msg_size)
+            sock.send(cmd.encode())
+            while True:
+                reads, _, _ = select([sock], [], [], timeout)
+                if not reads:
+                    self.lines.append(
+                        "'%s' command timed out." % cmd.split()[0])
+                    return None
+                reply = sock.recv(self.max_msg_size).decode(
+                    "utf8", "ignore")
+                if sock is self.event_sock and reply.startswith("<"):
+                    self.lines.append(reply)  # event received while attaching
+                    continue
+                return reply
+        except OSError as e:
+            transport_logger.debug("Control interface error: %s", e)
+            self.connection_lost()
+            return None
+
+    def request(self, cmd, timeout=None):
+        """ send a wpa_cli command to wpa_supplicant and return the reply """
+        return self.request_all([cmd], timeout)[0]
+
+    def request_all(self, cmds, timeout=None):
+        """ send a list of wpa_cli commands at once (without waiting for
+            each reply) and return the list of the replies, in the same
+            order (None for a command without reply); wpa_supplicant
+            processes the requests of a socket in sequence.
+        """
+        if not cmds:
+            return []
+        if not self.connected and not self.reconnect():
+            self.lines.append(
+                "Not connected to wpa_supplicant - command dropped.")
+            return [None] * len(cmds)
+        if timeout is None:
+            timeout = self.request_timeout
+        sock = self.ctrl_sock
+        replies = []
+        try:
+            while select([sock], [], [], 0)[0]:  # discard late replies
+                sock.recv(self.max_msg_size)
+            for cmd in cmds:
+                tokens = cmd.split(None, 1)
+                tokens[0] = tokens[0].upper()
+                sock.send(" ".join(tokens).encode())
+            deadline = time.monotonic() + timeout
+            while len(replies) < len(cmds):
+                reads, _, _ = select(
+                    [sock], [], [], max(deadline - time.monotonic(), 0))
+                if not reads:
+                    self.lines.append(
+                        "'%s' command timed out."
+                        % cmds[len(replies)].split()[0])
+                    break
+                replies.append(
+                    sock.recv(self.max_msg_size).decode("utf8", "ignore"))
+        except (OSError, ValueError) as e:  # ValueError: socket closed
+            transport_logger.debug("Control interface error: %s", e)
+            self.connection_lost()
+        return replies + [None] * (len(cmds) - len(replies))
+
+    def list_sta(self, timeout=None):
+        """ emulate the wpa_cli list_sta command """
+        stations = []
+        reply = self.request("sta-first", timeout)
+        while reply and not reply.startswith("FAIL"):
+            station = reply.split("\n", 1)[0]
+            stations.append(station)
+            reply = self.request("sta-next " + station, timeout)
+        return stations
+
+    def execute(self, cmd, timeout=None):
+        """ process a wpa_cli command and return the list of output lines
+            (None if the command could not be sent or timed out)
+        """
+        tokens = cmd.split()
+        if not tokens:
+            return []
+        if tokens[0] == "interface":  # wpa_cli internal command
+            if len(tokens) == 1:
+                return ["Available interfaces:"] + self.list_interfaces()
+            with self.lock:
+                self.close()
+                self.interface = tokens[1]
+                self.open()
+            return []
+        if tokens[0] == "list_sta":  # wpa_cli internal command
+            return self.list_sta(timeout)
+        reply = self.request(cmd, timeout)
+        if reply is None:
+            return None
+        return reply.splitlines()
+
+    def execute_all(self, cmds, timeout=None):
+        """ process a list of wpa_cli commands, pipelining the requests
+            to wpa_supplicant; return the list of the results of
+            execute(), in the same order
+        """
+        results = []
+        batch = []
+        for cmd in cmds + [None]:
+            tokens = cmd.split() if cmd else []
+            if tokens and tokens[0] not in ("interface", "list_sta"):
+                batch.append(cmd)
+                continue
+            results.extend(
+                None if reply is None else reply.splitlines()
+                for reply in self.request_all(batch, timeout)
+            )
+            batch = []
+            if cmd is not None:
+                results.append(self.execute(cmd, timeout))
+        return results
+
+    def write_all(self, cmds):
+        """ process a list of wpa_cli commands, queueing their output to
+            "lines"; returns the number of processed commands
+        """
+        written = 0
+        for lines in self.execute_all(cmds):
+            if lines is not None:
+                self.lines.extend(lines)
+                written += 1
+        return written
+
+    def write(self, cmd):
+        """ process a wpa_cli command, queueing its output to "lines" """
+        lines = self.execute(cmd)
+        if lines is None:
+            return None
+        self.lines.extend(lines)
+        return len(cmd)
+
+    def receive(self):
+        """ read the available events from the event socket """
+        with self.lock:
+            try:
+                while self.event_sock is not None and select(
+                        [self.event_sock], [], [], 0)[0]:
+                    event = self.event_sock.recv(self.max_msg_size).decode(
+                        "utf8", "ignore")
+                    self.lines.append(event.rstrip("\n"))
+                    if "CTRL-EVENT-TERMINATING" in event:
+                        self.connection_lost()
+            except OSError as e:
+                transport_logger.debug("Control interface error: %s", e)
+                self.connection_lost()
+
+
+class WpaCtrlStub:
+    """
+    Local stand-in of the wpa_supplicant control interface, answering on
+    an AF_UNIX datagram socket; it allows testing hostp2pd (configured
+    with wpa_transport: "socket") without wireless hardware.
+    ctrl_interface = directory where the socket is created
+    interface = interface name (name of the socket)
+    replies = dictionary of command: reply, where the command is the
+        first word of the request (e.g., "LIST_NETWORKS") and the reply
+        is a string or a function receiving the request and returning
+        a string; unlisted commands reply "OK"
+    All received requests are stored in the "requests" list.
+    """
+
+    def __init__(self, ctrl_interface, interface, replies=None):
+        self.ctrl_interface = ctrl_interface
+        self.interface = interface
+        self.replies = replies if replies is not None else {}
+        self.requests = []
+        self.monitors = []
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        os.makedirs(self.ctrl_interface, exist_ok=True)
+        path = os.path.join(self.ctrl_interface, self.interface)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(path)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.sock is None:
+            return
+        self.send_event("CTRL-EVENT-TERMINATING", level=2)
+        path = self.sock.getsockname()
+        self.sock.close()
+        self.sock = None
+        self.thread.join(1)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def send_event(self, event, level=3):
+        """ send an unsolicited event to all the attached clients """
+        for addr in list(self.monitors):
+            try:
+                self.sock.sendto(("<%s>%s" % (level, event)).encode(), addr)
+            except OSError:  # client gone
+                if addr in self.monitors:
+                    self.monitors.remove(addr)
+
+    def reply(self, request):
+        command = request.split(None, 1)[0] if request else ""
+        if command == "PING":
+            return "PONG\n"
+        reply = self.replies.get(command, "OK\n")
+        if callable(reply):
+            reply = reply(request)
+        return reply
+
+    def run(self):
+        sock = self.sock
+        while self.sock is not None:
+            try:
+                data, addr = sock.recvfrom(WpaCtrl.max_msg_size)
+            except OSError:
+                return
+            request = data.decode("utf8", "ignore")
+            self.requests.append(request)
+            if request == "ATTACH":
+                self.monitors.append(addr)
+                reply = "OK\n"
+            elif request == "DETACH":
+                if addr in self.monitors:
+                    self.monitors.remove(addr)
+                reply = "OK\n"
+            else:
+                reply = self.reply(request)
+            try:
+                sock.sendto(reply.encode(), addr)
+            except OSError:
+                pass
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Framed channel of the messages sent by the Enroller to the Core.
+"""
+
+import os
+
+import pytest
+
+from hostp2pd.hostp2pd import Channel
+
+
+@pytest.fixture
+def channel():
+    channel = Channel()
+    yield channel
+    channel.close()
+
+
+def frame(message):
+    data = message.encode()
+    return Channel.header.pack(len(data)) + data
+
+
+def test_messages(channel):
+    channel.send("HOSTP2PD_ENROLLER_READY")
+    channel.send("HOSTP2PD_ACTIVE_SESSIONS\t2")
+    channel.send("")
+    assert channel.receive() == [
+        "HOSTP2PD_ENROLLER_READY", "HOSTP2PD_ACTIVE_SESSIONS\t2", ""]
+    assert not channel.pending
+
+
+def test_partial_reads(channel):
+    first = frame("HOSTP2PD_STATISTICS\tevents 3")
+    data = first + frame("héllo")
+    start = 0
+    for end, messages in (
+            (2, []),  # partial header
+            (len(first) - 4, []),  # partial payload
+            (len(first) + 3, ["HOSTP2PD_STATISTICS\tevents 3"]),
+            (len(data), ["héllo"]),
+    ):
+        os.write(channel.write_fd, data[start:end])
+        start = end
+        assert channel.receive() == messages
+    assert not channel.pending
+
+
+def test_byte_by_byte(channel):
+    data = frame("first") + frame("second")
+    received = []
+    for n in range(len(data)):
+        os.write(channel.write_fd, data[n:n + 1])
+        received += [(n, message) for message in channel.receive()]
+    assert received == [
+        (len(frame("first")) - 1, "first"), (len(data) - 1, "second")]
+
+
+def test_reads_larger_than_chunk(channel):
+    messages = ["message %04d " % n + "x" * 100 for n in range(100)]
+    for message in messages:
+        channel.send(message)
+    received = []
+    while len(received) < len(messages):
+        received += channel.receive()
+    assert received == messages
+
+
+def test_max_size(channel):
+    channel.send("x" * (Channel.max_size + 10))
+    message, = channel.receive()
+    assert len(message) == Channel.max_size
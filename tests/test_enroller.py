@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Start of the Enroller process on a new group, warm (standby Enroller
+attached to the group) and cold (Enroller forked at the group start),
+against the local stand-ins of the wpa_supplicant control interface.
+"""
+
+import time
+import logging
+
+import pytest
+
+from hostp2pd import HostP2pD
+from hostp2pd.wpa_ctrl import WpaCtrlStub
+
+INTERFACE = "p2p-dev-wlan0"
+GROUP = "p2p-wlan0-0"
+GROUP_STARTED = (
+    "P2P-GROUP-STARTED " + GROUP + ' GO ssid="DIRECT-PP-group" '
+    "freq=2412 go_dev_addr=aa persistent=0")
+EVENT = (
+    "WPS-ENROLLEE-SEEN 56:3b:c6:4a:4a:b3 "
+    "811e2280-33d1-5ce8-97e5-6fcf1598c173 10-0050F204-5 0x4388 0 1 [test]"
+)
+
+
+def wait(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def root():
+    root = logging.getLogger()
+    level = root.level
+    yield root
+    root.setLevel(level)  # set by force_logging
+
+
+@pytest.fixture
+def device(tmp_path):
+    device = WpaCtrlStub(str(tmp_path), INTERFACE, {
+        "LIST_NETWORKS": "network id / ssid / bssid / flags\n"
+        "0\tDIRECT-PP-group\t00:00:00:00:00:00\t[DISABLED][P2P-PERSISTENT]\n",
+        "GET": "keypad\n",
+    }).start()
+    device.replies["P2P_GROUP_ADD"] = lambda request: (
+        device.send_event(GROUP_STARTED), "OK\n")[1]
+    yield device
+    device.stop()
+
+
+@pytest.fixture
+def group(tmp_path):
+    group = WpaCtrlStub(str(tmp_path), GROUP, {
+        "STATUS": "bssid=x\nssid=DIRECT-PP-group\n",
+        "STA-FIRST": "FAIL\n",
+    }).start()
+    yield group
+    group.stop()
+
+
+def first_response(device, group):
+    """ restart the group; return the time elapsed until the Enroller
+        answers the first WPS-ENROLLEE-SEEN
+    """
+    del group.requests[:]
+    start = time.monotonic()
+    device.send_event(GROUP_STARTED)
+    while not any(r.startswith("WPS_PIN") for r in list(group.requests)):
+        assert time.monotonic() < start + 10, "no WPS response"
+        group.send_event(EVENT)  # lost until the Enroller is connected
+        time.sleep(0.002)
+    return time.monotonic() - start
+
+
+def group_start_latency(device, group, monkeypatch, warm):
+    """ best time from the group start to the first WPS response """
+    monkeypatch.setattr(HostP2pD, "wpa_transport", "socket")
+    monkeypatch.setattr(HostP2pD, "ctrl_interface", device.ctrl_interface)
+    monkeypatch.setattr(HostP2pD, "warm_enroller", warm)
+    hostp2pd = HostP2pD(interface=INTERFACE, force_logging=logging.CRITICAL)
+    latencies = []
+    del group.requests[:]  # of the previous run
+    with hostp2pd:
+        assert wait(lambda: "P2P_FIND" in group.requests)  # first Enroller
+        for n in range(3):
+            device.send_event(
+                "P2P-GROUP-REMOVED " + GROUP + " GO reason=REQUESTED")
+            assert wait(lambda: hostp2pd.enroller is None)
+            if warm:
+                assert wait(lambda: hostp2pd.standby is not None)
+            time.sleep(0.5)  # standby Enroller connected
+            latencies.append(first_response(device, group))
+            if warm:  # config method inherited from the Core
+                assert not any(
+                    r.startswith(("GET", "SET")) for r in group.requests)
+        assert hostp2pd.enroller_starts["warm" if warm else "cold"] >= 3
+    return min(latencies)
+
+
+def test_warm_enroller_is_faster(device, group, monkeypatch, root):
+    cold = group_start_latency(device, group, monkeypatch, warm=False)
+    warm = group_start_latency(device, group, monkeypatch, warm=True)
+    assert warm < cold
+    assert warm < HostP2pD.confirm_timeout  # no wait for P2P-FIND-STOPPED
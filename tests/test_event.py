@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Fields of the wpa_supplicant events passed to the event handlers.
+"""
+
+import pytest
+
+from hostp2pd import HostP2pD
+from hostp2pd.hostp2pd import Event
+
+
+@pytest.fixture
+def hostp2pd():
+    return HostP2pD()
+
+
+def event(line, hostp2pd):
+    return Event(line, line.split(), hostp2pd)
+
+
+def test_device_found(hostp2pd):
+    found = event(
+        "<3>P2P-DEVICE-FOUND ae:e2:d3:41:27:14 p2p_dev_addr=ae:e2:d3:41:a7:14"
+        " pri_dev_type=3-0050F204-1 name='test x' config_methods=0x0"
+        " dev_capab=0x25 group_capab=0x0", hostp2pd)
+    assert found.mac_addr == "ae:e2:d3:41:27:14"
+    assert found.p2p_dev_addr == "ae:e2:d3:41:a7:14"
+    assert found.dev_name == "test x"  # quoted, with spaces
+    assert found.device_type == "Printer"
+    assert found.fields["config_methods"] == "0x0"
+    assert found.sa_addr == ""  # not present
+
+
+def test_quoted_values(hostp2pd):
+    started = event(
+        '<3>P2P-GROUP-STARTED p2p-wlan0-0 GO ssid="DIRECT-PP group"'
+        ' freq=2412 passphrase="a b=c" go_dev_addr=02:00:00:00:01:00'
+        ' persistent=4', hostp2pd)
+    assert started.ssid_arg == "DIRECT-PP group"
+    assert started.fields["passphrase"] == "a b=c"
+    assert started.fields["go_dev_addr"] == "02:00:00:00:01:00"
+    assert started.persistent_arg == "4"
+
+
+def test_fields_parsed_once(hostp2pd):
+    found = event("<3>P2P-DEVICE-LOST p2p_dev_addr=ae:e2:d3:41:a7:14",
+                  hostp2pd)
+    assert found._fields is None  # lazily tokenized
+    fields = found.fields
+    assert found.fields is fields
+    assert event("<3>P2P-FIND-STOPPED", hostp2pd).fields == {}
+
+
+def test_registers(hostp2pd):
+    hostp2pd.addr_register["ae:e2:d3:41:a7:14"] = "test x"
+    request = event(
+        "<3>P2P-GO-NEG-REQUEST ae:e2:d3:41:a7:14 dev_passwd_id=4"
+        " go_intent=6", hostp2pd)
+    assert request.go_intent == "6"
+    assert request.password_id == "PushButton"
+    probe = event("<3>RX-PROBE-REQUEST sa=ae:e2:d3:41:a7:14 signal=0",
+                  hostp2pd)
+    assert probe.sa_name == "test x"
+    assert event("<3>AP-STA-CONNECTED 56:3b:c6:4a:4a:b3"
+                 " p2p_dev_addr=56:3b:c6:4a:4a:b3",
+                 hostp2pd).device_name == "[unknown]"
+
+
+def test_unknown_values(hostp2pd):
+    found = event(
+        "<3>P2P-PROV-DISC-SHOW-PIN ae:e2:d3:41:27:14 12345670"
+        " p2p_dev_addr=ae:e2:d3:41:a7:14 pri_dev_type=99-0050F204-1"
+        " dev_passwd_id=x", hostp2pd)
+    assert found.device_type == "generic device"
+    assert found.password_id == "Unknown"
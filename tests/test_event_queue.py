@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Prioritized queue of the events processed by handle().
+"""
+
+from hostp2pd.hostp2pd import EventQueue
+
+
+def drain(queue):
+    lines = []
+    while len(queue):
+        lines.append(queue.get())
+    return lines
+
+
+def test_priorities():
+    queue = EventQueue(max_size=100)
+    assert queue.priority("<3>P2P-DEVICE-FOUND aa") == queue.LOW
+    assert queue.priority("<3>P2P-PROV-DISC-PBC-REQ aa") == queue.HIGH
+    assert queue.priority("HOSTP2PD_ACTIVE_SESSIONS\t1") == queue.HIGH
+    assert queue.priority("OK") == queue.NORMAL
+    assert queue.priority(None) == queue.END
+    queue.extend([
+        "<3>CTRL-EVENT-SCAN-STARTED",
+        "OK",
+        "<3>P2P-DEVICE-FOUND aa",
+        "<3>AP-STA-CONNECTED aa",
+        None,
+        "FAIL",
+        "<3>P2P-GO-NEG-REQUEST aa",
+    ])
+    assert drain(queue) == [
+        "<3>AP-STA-CONNECTED aa",  # high, by order of arrival
+        "<3>P2P-GO-NEG-REQUEST aa",
+        "OK",
+        "FAIL",
+        "<3>CTRL-EVENT-SCAN-STARTED",
+        "<3>P2P-DEVICE-FOUND aa",
+        None,  # end of data mark, after all lines
+    ]
+    assert queue.get() is None
+    assert len(queue) == 0
+
+
+def test_void_lines_discarded():
+    queue = EventQueue(max_size=100)
+    assert queue.put("")
+    assert len(queue) == 0
+
+
+def test_only_discovery_dropped():
+    queue = EventQueue(max_size=3)
+    for n in range(3):
+        assert queue.put("<3>P2P-DEVICE-FOUND %s" % n)
+    assert not queue.put("<3>P2P-DEVICE-LOST 3")
+    assert not queue.put("<3>RX-PROBE-REQUEST sa=4")
+    assert queue.put("<3>P2P-GROUP-STARTED p2p-wlan0-0")
+    assert queue.put("OK")
+    assert queue.dropped == 2
+    assert len(queue) == 5
+    assert queue.max_depth == 5
+    assert drain(queue)[:2] == ["<3>P2P-GROUP-STARTED p2p-wlan0-0", "OK"]
+    assert queue.put("<3>P2P-DEVICE-FOUND 5")  # room again
+    assert queue.max_depth == 5
+
+
+def test_clear():
+    queue = EventQueue(max_size=100)
+    queue.extend(["OK", "<3>WPS-ENROLLEE-SEEN aa", None])
+    queue.clear()
+    assert len(queue) == 0
+    assert queue.get() is None
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+OpenMetrics (and Prometheus) exporter of the metrics.
+"""
+
+import socket
+import http.client
+
+import pytest
+
+from hostp2pd import HostP2pD
+from hostp2pd.__version__ import __version__
+from hostp2pd.hostp2pd import MetricsExporter
+
+
+@pytest.fixture
+def hostp2pd():
+    hostp2pd = HostP2pD()
+    hostp2pd.metrics.inc("events", "P2P-DEVICE-FOUND", 3)
+    hostp2pd.metrics.inc("events", "AP-STA-CONNECTED")
+    hostp2pd.metrics.set("n_stations", 2)
+    hostp2pd.metrics.observe("command_seconds", 0.004, "get")
+    hostp2pd.metrics.observe("command_seconds", 0.3, "get")
+    hostp2pd.metrics.observe("command_seconds", 200, "get")
+    return hostp2pd
+
+
+@pytest.fixture
+def exporter(hostp2pd, tmp_path):
+    exporter = MetricsExporter(hostp2pd, str(tmp_path / "metrics.sock"))
+    yield exporter
+    exporter.stop()
+
+
+def family(text, name):
+    """ lines of the metric family "name" (TYPE and HELP included) """
+    lines = text.split("\n")
+    start = lines.index(next(
+        line for line in lines if line.startswith("# TYPE " + name + " ")))
+    end = start + 1
+    while end < len(lines) and not lines[end].startswith("# TYPE "):
+        end += 1
+    return [line for line in lines[start:end] if line != "# EOF"]
+
+
+def test_openmetrics(exporter):
+    text = exporter.render(openmetrics=True)
+    assert text.endswith("\n# EOF\n")
+    assert family(text, "hostp2pd_build") == [
+        "# TYPE hostp2pd_build info",
+        "# HELP hostp2pd_build Version of hostp2pd",
+        'hostp2pd_build_info{version="%s"} 1' % __version__,
+    ]
+    assert family(text, "hostp2pd_events") == [
+        "# TYPE hostp2pd_events counter",
+        "# HELP hostp2pd_events Events and replies of wpa_supplicant",
+        'hostp2pd_events_total{event="AP-STA-CONNECTED"} 1',
+        'hostp2pd_events_total{event="P2P-DEVICE-FOUND"} 3',
+    ]
+    assert family(text, "hostp2pd_n_stations") == [
+        "# TYPE hostp2pd_n_stations gauge",
+        "# HELP hostp2pd_n_stations Stations connected to the group",
+        "hostp2pd_n_stations 2",
+    ]
+    assert "hostp2pd_group_active 0" in text
+    assert "# TYPE hostp2pd_group info" not in text  # no active group
+
+
+def test_prometheus(exporter):
+    text = exporter.render(openmetrics=False)
+    assert "# EOF" not in text
+    assert family(text, "hostp2pd_build_info")[:1] == [
+        "# TYPE hostp2pd_build_info gauge"]
+    assert family(text, "hostp2pd_events_total")[:2] == [
+        "# TYPE hostp2pd_events_total counter",
+        "# HELP hostp2pd_events_total Events and replies of wpa_supplicant",
+    ]
+
+
+def test_histogram(exporter):
+    lines = family(exporter.render(), "hostp2pd_command_seconds")
+    assert lines[0] == "# TYPE hostp2pd_command_seconds histogram"
+    buckets = [line for line in lines if "_bucket" in line]
+    assert buckets[0] == (
+        'hostp2pd_command_seconds_bucket{command="get",le="0.005"} 1')
+    assert (
+        'hostp2pd_command_seconds_bucket{command="get",le="0.25"} 1'
+        in buckets)
+    assert (  # cumulative counts
+        'hostp2pd_command_seconds_bucket{command="get",le="0.5"} 2'
+        in buckets)
+    assert buckets[-2] == (
+        'hostp2pd_command_seconds_bucket{command="get",le="120.0"} 2')
+    assert buckets[-1] == (
+        'hostp2pd_command_seconds_bucket{command="get",le="+Inf"} 3')
+    assert lines[-2:] == [
+        'hostp2pd_command_seconds_count{command="get"} 3',
+        'hostp2pd_command_seconds_sum{command="get"} %r' % (
+            0.004 + 0.3 + 200),
+    ]
+
+
+def test_group(hostp2pd, exporter):
+    hostp2pd.monitor_group = "p2p-wlan0-0"
+    hostp2pd.ssid_group = 'DIRECT-"x"'
+    hostp2pd.group_type = "Autonomous"
+    text = exporter.render()
+    assert "hostp2pd_group_active 1" in text
+    assert family(text, "hostp2pd_group")[2:] == [
+        'hostp2pd_group_info{group="p2p-wlan0-0",ssid="DIRECT-\\"x\\"",'
+        'type="Autonomous"} 1']
+
+
+def test_format():
+    assert MetricsExporter.format_labels([]) == ""
+    assert MetricsExporter.format_labels(
+        [("name", 'a"b\\c\nd'), ("le", "+Inf")]
+    ) == '{name="a\\"b\\\\c\\nd",le="+Inf"}'
+    assert MetricsExporter.format_value(3) == "3"
+    assert MetricsExporter.format_value(True) == "1"
+    assert MetricsExporter.format_value(0.5) == "0.5"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__("localhost", timeout=5)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def get(exporter, path, accept=None):
+    connection = UnixHTTPConnection(exporter.path)
+    try:
+        connection.request(
+            "GET", path, headers={"Accept": accept} if accept else {})
+        response = connection.getresponse()
+        return response.status, response.getheader(
+            "Content-Type"), response.read().decode()
+    finally:
+        connection.close()
+
+
+def test_unix_socket(exporter):
+    exporter.start()
+    status, content_type, body = get(
+        exporter, "/metrics", "application/openmetrics-text")
+    assert status == 200
+    assert content_type == MetricsExporter.openmetrics_type
+    assert body.endswith("# EOF\n")
+    status, content_type, body = get(exporter, "/")
+    assert status == 200
+    assert content_type == MetricsExporter.text_type
+    assert "# TYPE hostp2pd_events_total counter" in body
+    assert get(exporter, "/other")[0] == 404
+
+
+def test_tcp(hostp2pd):
+    exporter = MetricsExporter(hostp2pd, "127.0.0.1:0").start()
+    try:
+        connection = http.client.HTTPConnection(
+            "127.0.0.1", exporter.server.server_address[1], timeout=5)
+        connection.request("GET", "/metrics")
+        response = connection.getresponse()
+        assert response.status == 200
+        assert b"hostp2pd_n_stations 2\n" in response.read()
+        connection.close()
+    finally:
+        exporter.stop()
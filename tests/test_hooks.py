@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Execution of the external program and of the hook_module callbacks.
+"""
+
+import sys
+import time
+import threading
+import functools
+
+import pytest
+
+from hostp2pd import HostP2pD
+from hostp2pd.hostp2pd import HookExecutor
+
+HOOK_MODULE = """
+calls = []
+on_started = "not callable"
+
+
+def on_connect(station, name, group):
+    calls.append(("connect", station, name, group))
+
+
+def on_stop_group(*args):
+    raise ValueError("test")
+
+
+def on_start_group(*args):
+    calls.append(("start_group",) + args)
+"""
+
+
+@pytest.fixture
+def executor():
+    executor = HookExecutor(workers=2, timeout=0.5)
+    yield executor
+    executor.shutdown()
+
+
+def callback(calls, name, delay=0):
+    time.sleep(delay)
+    calls.append(name)
+
+
+def wait_idle(executor, timeout=5):
+    deadline = time.monotonic() + timeout
+    while executor.pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return executor.pending
+
+
+def test_same_key_in_order(executor):
+    calls = []
+    for n in range(5):
+        executor.submit("group", functools.partial(
+            callback, calls, n, 0.05 if n == 0 else 0), ("on_connect",))
+    assert wait_idle(executor) == 0
+    assert calls == [0, 1, 2, 3, 4]
+    assert executor.exit_codes["on_connect"] == 0
+
+
+def test_program(executor):
+    executor.submit(
+        "core", [sys.executable, "-c", "raise SystemExit(3)"], ("started",))
+    assert wait_idle(executor) == 0
+    assert executor.exit_codes["started"] == 3
+    assert executor.metrics.counters["hook_failures"]["started"] == 1
+
+
+def test_program_killed(executor):
+    executor.submit(
+        "core", [sys.executable, "-c", "import time; time.sleep(10)"],
+        ("started",))
+    assert wait_idle(executor) == 0
+    assert executor.exit_codes["started"] is None
+    assert executor.metrics.counters["hook_timeouts"]["started"] == 1
+
+
+def test_callback_failure(executor):
+    def fail():
+        raise ValueError("test")
+    calls = []
+    executor.submit("group", functools.partial(fail), ("on_connect",))
+    executor.submit(
+        "group", functools.partial(callback, calls, "next"),
+        ("on_disconnect",))
+    assert wait_idle(executor) == 0
+    assert calls == ["next"]
+    assert executor.exit_codes == {"on_connect": None, "on_disconnect": 0}
+
+
+def test_callback_abandoned(executor):
+    release = threading.Event()
+    calls = []
+    executor.submit(
+        "group", functools.partial(release.wait), ("on_connect",))
+    executor.submit(
+        "group", functools.partial(callback, calls, "next"),
+        ("on_disconnect",))
+    assert wait_idle(executor) == 0  # not blocked by the hanging callback
+    assert calls == ["next"]
+    assert executor.exit_codes["on_connect"] is None
+    assert executor.metrics.counters["hook_timeouts"]["on_connect"] == 1
+    release.set()
+
+
+def test_internal_error_does_not_stall(executor, monkeypatch):
+    run = executor.run
+    calls = []
+
+    def failing_run(tag, command):
+        if tag[0] == "on_connect":
+            raise RuntimeError("test")
+        run(tag, command)
+
+    monkeypatch.setattr(executor, "run", failing_run)
+    executor.submit("group", functools.partial(
+        callback, calls, "first"), ("on_connect",))
+    executor.submit("group", functools.partial(
+        callback, calls, "second"), ("on_disconnect",))
+    assert wait_idle(executor) == 0
+    assert calls == ["second"]
+    assert "group" not in executor.queues
+    executor.submit("group", functools.partial(
+        callback, calls, "third"), ("on_disconnect",))
+    assert wait_idle(executor) == 0
+    assert calls == ["second", "third"]
+
+
+def test_coalesce():
+    executor = HookExecutor(workers=1, timeout=5, coalesce=True)
+    release = threading.Event()
+    calls = []
+    try:
+        executor.submit("group", functools.partial(release.wait), ("busy",))
+        executor.submit("group", functools.partial(
+            callback, calls, "connect"), ("connect", "aa"))
+        executor.submit("group", functools.partial(
+            callback, calls, "disconnect"), ("disconnect", "aa"),
+            cancels=("connect", "aa"))
+        assert executor.coalesced == 2
+        release.set()
+        assert wait_idle(executor) == 0
+        assert calls == []
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+@pytest.fixture
+def hooks(tmp_path):
+    """ HostP2pD loading the hook module written by the test """
+    hostp2pd = HostP2pD()
+    hostp2pd.hook_module = str(tmp_path / "hooks.py")
+
+    def load(source):
+        with open(hostp2pd.hook_module, "w") as f:
+            f.write(source)
+        hostp2pd.load_hook_module()
+        return hostp2pd
+
+    yield load
+    if hostp2pd.hook_executor is not None:
+        hostp2pd.hook_executor.shutdown()
+
+
+def test_load_hook_module(hooks):
+    hostp2pd = hooks(HOOK_MODULE)
+    assert sorted(hostp2pd.hook_callbacks) == [
+        "connect", "start_group", "stop_group"]
+    assert hostp2pd.loaded_hook_module == hostp2pd.hook_module
+    calls = hostp2pd.hook_callbacks["connect"].__globals__["calls"]
+    hostp2pd.external_program(
+        HostP2pD.EXTERNAL_PROG_ACTION.CONNECT, "aa", "phone", "p2p-wlan0-0")
+    assert wait_idle(hostp2pd.hook_executor) == 0
+    assert calls == [("connect", "aa", "phone", "p2p-wlan0-0")]
+    assert hostp2pd.hook_executor.exit_codes == {"on_connect": 0}
+
+
+def test_missing_callback(hooks):
+    hostp2pd = hooks(HOOK_MODULE)
+    for action in (
+            HostP2pD.EXTERNAL_PROG_ACTION.STARTED,  # not callable
+            HostP2pD.EXTERNAL_PROG_ACTION.DISCONNECT):
+        hostp2pd.external_program(action, "aa", "phone", "p2p-wlan0-0")
+    assert hostp2pd.hook_executor is None  # nothing to run
+
+
+def test_callback_raising(hooks):
+    hostp2pd = hooks(HOOK_MODULE)
+    calls = hostp2pd.hook_callbacks["connect"].__globals__["calls"]
+    hostp2pd.run_prog_stopped = True
+    hostp2pd.external_program(HostP2pD.EXTERNAL_PROG_ACTION.STOP_GROUP)
+    hostp2pd.external_program(
+        HostP2pD.EXTERNAL_PROG_ACTION.START_GROUP, "DIRECT-PP-group")
+    executor = hostp2pd.hook_executor
+    assert wait_idle(executor) == 0
+    assert executor.exit_codes == {"on_stop_group": None, "on_start_group": 0}
+    assert executor.metrics.counters["hook_failures"]["on_stop_group"] == 1
+    assert calls == [("start_group", "DIRECT-PP-group")]  # not stalled
+
+
+@pytest.mark.parametrize("source, error", [
+    ("import missing_module_of_hostp2pd\n", "Cannot load hook module"),
+    ("def on_connect(:\n", "Cannot load hook module"),
+    ("raise RuntimeError('test')\n", "Cannot load hook module"),
+    ("def connect(*args):\n    pass\n", 'No "on_<action>" function'),
+], ids=["import error", "syntax error", "exception", "no callbacks"])
+def test_module_not_loaded(hooks, caplog, source, error):
+    hostp2pd = hooks(source)
+    assert hostp2pd.hook_callbacks == {}
+    assert hostp2pd.loaded_hook_module == hostp2pd.hook_module  # no retry
+    assert error in caplog.text
+    hostp2pd.external_program(
+        HostP2pD.EXTERNAL_PROG_ACTION.CONNECT, "aa", "phone", "p2p-wlan0-0")
+    assert hostp2pd.hook_executor is None
+
+
+def test_missing_module(hooks, caplog):
+    hostp2pd = hooks(HOOK_MODULE)
+    hostp2pd.hook_module += ".missing"
+    hostp2pd.load_hook_module()
+    assert hostp2pd.hook_callbacks == {}
+    assert "Cannot load hook module" in caplog.text
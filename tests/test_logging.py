@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Asynchronous logging and limits of the debug logs.
+"""
+
+import logging
+import threading
+
+import pytest
+
+import hostp2pd.hostp2pd
+from hostp2pd.hostp2pd import (
+    LogQueue, LogQueueHandler, LogRateLimiter, queue_logging)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class BlockingHandler(ListHandler):
+    """ handler waiting for "unblocked" before writing """
+
+    def __init__(self):
+        super().__init__()
+        self.unblocked = threading.Event()
+
+    def emit(self, record):
+        self.unblocked.wait(5)
+        super().emit(record)
+
+
+@pytest.fixture
+def root():
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    level = root.level
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.setLevel(logging.DEBUG)
+    yield root
+    queue_logging(0)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(hostp2pd.hostp2pd.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("test.limiter")
+    handler = ListHandler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.messages = handler.messages
+    yield logger
+    logger.removeHandler(handler)
+
+
+def test_queue_handler_drops_when_full():
+    handler = LogQueueHandler(hostp2pd.hostp2pd.Queue(2))
+    logger = logging.getLogger("test.queue")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for n in range(5):
+            logger.warning("record %s", n)
+    finally:
+        logger.removeHandler(handler)
+    assert handler.dropped == 3
+    record = handler.queue.get_nowait()
+    assert record.msg == "record 0"  # arguments merged
+    assert record.args is None
+
+
+def test_log_queue(root):
+    handler = BlockingHandler()
+    root.addHandler(handler)
+    log_queue = LogQueue(3)
+    assert log_queue.handler in root.handlers
+    assert handler not in root.handlers
+    logger = logging.getLogger("test.log_queue")
+    logger.warning("first")  # taken by the listener, which is blocked
+    for n in range(10):
+        logger.warning("queued %s", n)
+    handler.unblocked.set()
+    log_queue.stop()
+    assert handler in root.handlers
+    assert log_queue.handler not in root.handlers
+    assert log_queue.handler.dropped >= 10 - 3 - 1
+    assert len(handler.messages) == 11 - log_queue.handler.dropped
+    assert handler.messages[0] == "first"
+    assert handler.messages[-1] == "queued %s" % (
+        len(handler.messages) - 2)
+
+
+def test_queue_logging(root):
+    handler = ListHandler()
+    root.addHandler(handler)
+    queue_logging(10)
+    log_queue = hostp2pd.hostp2pd.log_queue
+    assert log_queue is not None
+    queue_logging(10)  # same size: kept
+    assert hostp2pd.hostp2pd.log_queue is log_queue
+    logging.getLogger("test.queue_logging").warning("message")
+    queue_logging(0)
+    assert hostp2pd.hostp2pd.log_queue is None
+    assert handler in root.handlers
+    assert handler.messages == ["message"]
+
+
+def test_rate_limiter(clock, logger):
+    limiter = LogRateLimiter({"P2P-DEVICE-FOUND": 2}, interval=10)
+    allowed = [limiter.allow("P2P-DEVICE-FOUND", logger) for n in range(5)]
+    assert allowed == [True, True, False, False, False]
+    assert limiter.allow("P2P-FIND-STOPPED", logger)  # not limited
+    assert limiter.suppressed == 3
+    clock.now += 5
+    limiter.flush(logger)  # period not ended
+    assert logger.messages == []
+    clock.now += 5
+    limiter.flush(logger)
+    assert logger.messages == [
+        "P2P-DEVICE-FOUND: suppressed 3 similar messages"]
+    assert limiter.allow("P2P-DEVICE-FOUND", logger)  # new period
+    assert limiter.suppressed == 3  # total
+
+
+def test_rate_limiter_new_period(clock, logger):
+    limiter = LogRateLimiter({"RX-PROBE-REQUEST": 1}, interval=10)
+    assert limiter.allow("RX-PROBE-REQUEST", logger)
+    assert not limiter.allow("RX-PROBE-REQUEST", logger)
+    clock.now += 10
+    assert limiter.allow("RX-PROBE-REQUEST", logger)  # summarized
+    assert logger.messages == [
+        "RX-PROBE-REQUEST: suppressed 1 similar messages"]
+    clock.now += 10
+    limiter.flush(logger)  # nothing suppressed: no summary
+    assert len(logger.messages) == 1
+    assert limiter.periods == {}
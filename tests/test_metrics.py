@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Metrics registry and latency histograms.
+"""
+
+import pytest
+
+import hostp2pd.hostp2pd
+from hostp2pd.hostp2pd import Histogram, Metrics
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(hostp2pd.hostp2pd.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_bounds():
+    histogram = Histogram()
+    for value in (0, 0.005, 0.0051, 0.01, 120, 120.1, 1000):
+        histogram.observe(value)
+    assert histogram.counts[0] == 2  # bounds are inclusive
+    assert histogram.counts[1] == 2
+    assert histogram.counts[len(Histogram.buckets) - 1] == 1  # 120
+    assert histogram.counts[len(Histogram.buckets)] == 2  # above 120
+    assert histogram.count == 7
+    assert histogram.max == 1000
+    assert histogram.sum == pytest.approx(1240.1201)
+
+
+def test_percentiles_within_bucket():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    assert histogram.mean is None
+    for n in range(10):
+        histogram.observe(0.02)  # bucket (0.01, 0.025]
+    assert histogram.percentile(50) == pytest.approx(0.015)
+    assert histogram.percentile(100) == pytest.approx(0.02)  # max
+    assert histogram.mean == pytest.approx(0.02)
+
+
+def test_percentiles_between_buckets():
+    histogram = Histogram()
+    for n in range(5):
+        histogram.observe(0.004)
+    for n in range(5):
+        histogram.observe(0.3)  # bucket (0.25, 0.5]
+    assert histogram.percentile(0) == 0
+    assert histogram.percentile(50) == pytest.approx(0.005)  # upper bound
+    assert histogram.percentile(90) == pytest.approx(0.29)
+    assert histogram.percentile(99) == pytest.approx(0.299)
+    assert histogram.percentile(100) == pytest.approx(0.3)
+
+
+def test_percentile_above_last_bucket():
+    histogram = Histogram()
+    histogram.observe(200)
+    histogram.observe(300)
+    assert histogram.percentile(50) == pytest.approx(210)
+    assert histogram.percentile(100) == 300
+
+
+def test_merge_and_copy():
+    histogram = Histogram()
+    histogram.observe(0.02)
+    other = Histogram()
+    other.observe(0.3)
+    other.observe(2)
+    histogram.merge(other.counts, other.sum, other.max)
+    assert histogram.count == 3
+    assert histogram.sum == pytest.approx(2.32)
+    assert histogram.max == 2
+    copy = histogram.copy()
+    histogram.observe(5)
+    assert copy.count == 3
+    assert copy.counts == other.counts[:2] + [1] + other.counts[3:]
+
+
+def test_counters_and_gauges():
+    metrics = Metrics()
+    metrics.inc("events", "P2P-DEVICE-FOUND")
+    metrics.inc("events", "P2P-DEVICE-FOUND", 2)
+    metrics.inc("response_messages")
+    metrics.set("n_stations", 3)
+    metrics.set("n_stations", 1)
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"] == {
+        "events": {"P2P-DEVICE-FOUND": 3}, "response_messages": {None: 1}}
+    assert snapshot["gauges"] == {"n_stations": {None: 1}}
+    metrics.inc("response_messages")
+    assert snapshot["counters"]["response_messages"] == {None: 1}  # a copy
+    metrics.reset()
+    assert metrics.snapshot()["counters"] == {}
+
+
+def test_durations(clock):
+    metrics = Metrics()
+    metrics.start("connection_seconds", "aa")
+    metrics.start("connection_seconds", "bb")
+    clock.now += 2
+    metrics.start("connection_seconds", "bb", restart=False)  # kept
+    clock.now += 1
+    assert metrics.stop("connection_seconds", "aa") == 3
+    assert metrics.stop("connection_seconds", "bb") == 3
+    assert metrics.stop("connection_seconds", "aa") is None  # not started
+    histogram = metrics.snapshot()["histograms"]["connection_seconds"][None]
+    assert histogram.count == 2
+    assert histogram.sum == 6
+
+
+def test_stale_durations(clock):
+    metrics = Metrics()
+    metrics.start("group_start_seconds")
+    clock.now += Metrics.max_duration
+    metrics.start("group_start_seconds", restart=False)  # stale: restarted
+    clock.now += 1
+    assert metrics.stop("group_start_seconds") == 1
+    metrics.start("group_start_seconds")
+    clock.now += Metrics.max_duration
+    assert metrics.stop("group_start_seconds") is None
+    metrics.start("group_start_seconds")
+    metrics.cancel("group_start_seconds")
+    assert metrics.stop("group_start_seconds") is None
+    assert metrics.snapshot()["histograms"][
+        "group_start_seconds"][None].count == 1
+
+
+def test_max_timers(clock):
+    metrics = Metrics()
+    for n in range(Metrics.max_timers + 1):
+        metrics.start("connection_seconds", n)
+    assert len(metrics.timers) == Metrics.max_timers
+    assert metrics.stop("connection_seconds", 0) is None  # evicted
+    assert metrics.stop("connection_seconds", 1) == 0
+
+
+def test_take_histograms():
+    metrics = Metrics()
+    metrics.observe("command_seconds", 0.01, "get")
+    metrics.merge("command_seconds", "get", [1], 0.004, 0.004)
+    histograms = metrics.take_histograms()
+    assert histograms["command_seconds"]["get"].count == 2
+    assert histograms["command_seconds"]["get"].counts[0] == 1
+    assert metrics.snapshot()["histograms"] == {}
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Masking of the secrets in the logs.
+"""
+
+from hostp2pd.hostp2pd import Redactor
+
+
+def test_redact():
+    redactor = Redactor(mask="***")
+    assert redactor.redact("p2p_connect 12345670 display") == (
+        "p2p_connect 12345670 display")
+    redactor.add(["12345670", "", None])
+    assert redactor.redact("p2p_connect 12345670 display") == (
+        "p2p_connect *** display")
+
+
+def test_longest_secret_first():
+    redactor = Redactor(mask="***")
+    redactor.add(["1234", "12345678"])
+    assert redactor.redact("wps_pin any 12345678") == "wps_pin any ***"
+
+
+def test_passwords_found_in_logs():
+    redactor = Redactor(mask="***")
+    assert redactor.redact('set_network 0 psk "secret-psk"') == (
+        "set_network 0 psk ***")
+    assert redactor.redact('network passphrase="secret"') == (
+        "network passphrase=***")
+    assert redactor.redact('again "secret-psk" and "secret"') == (
+        "again *** and ***")
+
+
+def test_rotating_secrets_evicted():
+    redactor = Redactor(mask="***")
+    redactor.max_secrets = 3
+    redactor.add(["pin-1", "pin-2", "pin-3"])
+    redactor.add(["pin-1"])  # most recently used
+    redactor.add(["pin-4"])
+    assert list(redactor.secrets) == ["pin-3", "pin-1", "pin-4"]
+    assert redactor.redact("pin-2 pin-3") == "pin-2 ***"
+
+
+def test_permanent_secrets_not_evicted():
+    redactor = Redactor(mask="***")
+    redactor.max_secrets = 2
+    redactor.add(["00000000"], permanent=True)
+    for n in range(10):
+        redactor.add(["pin-%s" % n])
+    assert len(redactor.secrets) == 2
+    assert redactor.redact("00000000 pin-0 pin-9") == "*** pin-0 ***"
+
+
+def test_found_secrets_rotating():
+    redactor = Redactor(mask="***")
+    redactor.max_secrets = 2
+    for n in range(10):
+        redactor.redact('set_network 0 psk "secret-%s"' % n)
+    assert redactor.permanent == set()
+    assert list(redactor.secrets) == ['"secret-8"', '"secret-9"']
+    assert redactor.redact('"secret-0" "secret-9"') == '"secret-0" ***'
+    assert redactor.redact('set_network 0 psk "secret-0"') == (
+        "set_network 0 psk ***")  # found again
+
+
+def test_rotating_secret_made_permanent():
+    redactor = Redactor(mask="***")
+    redactor.max_secrets = 1
+    redactor.add(["pin-1"])
+    redactor.add(["pin-1"], permanent=True)
+    redactor.add(["pin-2", "pin-3"])
+    assert redactor.redact("pin-1 pin-2 pin-3") == "*** pin-2 ***"
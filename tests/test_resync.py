@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Differences between the state cached by the Core and the one reported by
+wpa_supplicant after a reconnection (resync).
+"""
+
+import pytest
+
+from hostp2pd import HostP2pD
+
+CONFIG_PARMS = {"update_config": 1, "device_name": "DIRECT-test"}
+STATE = {
+    "interface": "p2p-dev-wlan0",
+    "config_method": "keypad",
+    "persistent_network_id": "0",
+    "monitor_group": "p2p-wlan0-0",
+    "ssid_group": "DIRECT-PP-group",
+    "group_type": "Persistent",
+}
+REPLIES = {
+    "interface": ["Available interfaces:", "p2p-wlan0-0", "p2p-dev-wlan0",
+                  "wlan0"],
+    "get config_methods": ["keypad"],
+    "list_networks": [
+        "network id / ssid / bssid / flags",
+        "0\tDIRECT-PP-group\t00:00:00:00:00:00\t[DISABLED][P2P-PERSISTENT]"],
+    "get update_config": ["1"],
+    "get device_name": ["DIRECT-test"],
+}
+IN_SYNC = {
+    "config_parms": {},
+    "config_method": None,
+    "group": "p2p-wlan0-0",
+    "start_group": None,
+}
+
+
+@pytest.fixture
+def hostp2pd():
+    hostp2pd = HostP2pD()
+    hostp2pd.config_parms = dict(CONFIG_PARMS)
+    return hostp2pd
+
+
+@pytest.mark.parametrize("state, replies, expected", [
+    ({}, {}, IN_SYNC),
+    ({}, {"get device_name": ["other"], "get update_config": ["", " 1 "]},
+     dict(IN_SYNC, config_parms={"device_name": "DIRECT-test"})),
+    ({}, {"get update_config": []},
+     dict(IN_SYNC, config_parms={"update_config": 1})),
+    ({}, {"get config_methods": ["virtual_push_button"]},
+     dict(IN_SYNC, config_method="keypad")),
+    ({"config_method": ""}, {"get config_methods": ["virtual_push_button"]},
+     IN_SYNC),  # config method never set
+    ({}, {"interface": ["p2p-dev-wlan0", "p2p-wlan0-1"]},
+     dict(IN_SYNC, group="p2p-wlan0-1")),  # group renamed
+    ({}, {"interface": ["p2p-dev-wlan0"]},
+     dict(IN_SYNC, group=None, start_group="p2p_group_add persistent=0")),
+    ({"group_type": "Autonomous", "persistent_network_id": None},
+     {"interface": ["p2p-dev-wlan0"]},
+     dict(IN_SYNC, group=None, start_group="p2p_group_add")),
+    ({"group_type": "Negotiated (always won)",
+      "persistent_network_id": None},
+     {"interface": ["p2p-dev-wlan0"]},
+     None),  # the group cannot be restarted
+    ({"monitor_group": None}, {"interface": ["p2p-dev-wlan0"]},
+     dict(IN_SYNC, group=None)),
+    ({}, {"interface": ["p2p-dev-wlan1", "p2p-wlan0-0"]},
+     None),  # interface not available
+    ({}, {"list_networks": ["network id / ssid / bssid / flags"]},
+     None),  # persistent group deleted
+    ({}, {"get device_name": None}, None),  # query failed
+], ids=[
+    "in sync", "parameter changed", "parameter unset", "config method",
+    "config method not set", "group renamed", "persistent group lost",
+    "autonomous group lost", "negotiated group lost", "no group",
+    "interface not available", "persistent group deleted", "query failed",
+])
+def test_resync_differences(hostp2pd, state, replies, expected):
+    hostp2pd.synced_state = dict(STATE, **state)
+    queries = hostp2pd.resync_queries()
+    assert queries == list(REPLIES)
+    assert hostp2pd.resync_differences(
+        [replies.get(query, REPLIES[query]) for query in queries]
+    ) == expected
+
+
+def test_not_synced(hostp2pd):
+    hostp2pd.synced_state = None  # not yet activated
+    assert hostp2pd.resync_differences(list(REPLIES.values())) is None
+
+
+def test_save_synced_state(hostp2pd):
+    for name, value in STATE.items():
+        if name != "config_method":
+            setattr(hostp2pd, name, value)
+    hostp2pd.config_method_in_use = STATE["config_method"]
+    hostp2pd.save_synced_state()
+    assert hostp2pd.synced_state == STATE
+    assert hostp2pd.resync_differences(list(REPLIES.values())) == IN_SYNC
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Adaptive period of the p2p_find refreshes.
+"""
+
+import pytest
+
+import hostp2pd.hostp2pd
+from hostp2pd.hostp2pd import HostP2pD, ScanGovernor
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(hostp2pd.hostp2pd.time, "monotonic", clock)
+    return clock
+
+
+def test_initial_interval_bounded(clock):
+    assert ScanGovernor(2, 5, 60).interval == 5
+    assert ScanGovernor(100, 5, 60).interval == 60
+    assert ScanGovernor(10, 5, 60).interval == 10
+
+
+def test_idle_grows_to_max(clock):
+    governor = ScanGovernor(10, 5, 60)
+    intervals = []
+    for n in range(6):
+        clock.now += governor.interval
+        intervals.append(governor.update())
+    assert intervals == [15, 22.5, 33.75, 50.625, 60, 60]
+    assert governor.rate == 0
+
+
+def test_new_stations_halve(clock):
+    governor = ScanGovernor(40, 5, 60)
+    intervals = []
+    for n in range(4):
+        governor.device_found()
+        clock.now += governor.interval
+        intervals.append(governor.update())
+    assert intervals == [20, 10, 5, 5]  # min_interval
+
+
+def test_prov_disc_resets_to_min(clock):
+    governor = ScanGovernor(60, 5, 60)
+    governor.device_found()
+    governor.prov_disc()  # prevails on the stations found
+    clock.now += 60
+    assert governor.update() == 5
+    assert governor.found == governor.requests == 0  # new period
+    clock.now += 5
+    assert governor.update() == 7.5  # idle again
+
+
+def test_scan_rejected(clock):
+    governor = ScanGovernor(10, 5, 60)
+    governor.scan_rejected()
+    assert governor.interval == 20  # immediately
+    for n in range(3):
+        governor.scan_rejected()
+    assert governor.interval == 60
+    assert governor.rejected == 4
+
+
+@pytest.mark.parametrize("found, elapsed, rate", [
+    (0, 60, 0.0),
+    (10, 60, 3.0),  # 0.3 * 10 per minute
+    (1, 6, 3.0),  # 10 per minute
+    (5, 0, 90.0),  # elapsed time at least one second
+])
+def test_rate(clock, found, elapsed, rate):
+    governor = ScanGovernor(10, 5, 60)
+    for n in range(found):
+        governor.device_found()
+    clock.now += elapsed
+    governor.update()
+    assert governor.rate == pytest.approx(rate)
+
+
+def test_rate_moving_average(clock):
+    governor = ScanGovernor(10, 5, 60)
+    for n in range(10):
+        governor.device_found()
+    clock.now += 60
+    governor.update()
+    clock.now += 60
+    governor.update()  # idle period
+    assert governor.rate == pytest.approx(0.7 * 3)
+
+
+def test_find_interval():
+    hostp2pd = HostP2pD()
+    hostp2pd.scan_governor.interval = 42
+    hostp2pd.find_timing_level = "normal"
+    assert hostp2pd.find_interval() == 42  # adaptive
+    hostp2pd.find_timing_level = "connect"
+    assert hostp2pd.find_interval() == (
+        hostp2pd.select_timeout_secs["connect"])
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Deadline scheduler of the periodic and one-shot tasks.
+"""
+
+import pytest
+
+import hostp2pd.hostp2pd
+from hostp2pd.hostp2pd import Scheduler
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(hostp2pd.hostp2pd.time, "monotonic", clock)
+    return clock
+
+
+def test_order_of_deadline(clock):
+    scheduler = Scheduler()
+    calls = []
+    scheduler.add("c", 3, lambda: calls.append("c"))
+    scheduler.add("a", 1, lambda: calls.append("a"))
+    scheduler.add("b", 1, lambda: calls.append("b"))  # same deadline
+    assert scheduler.timeout(10) == 1
+    assert scheduler.timeout(0.5) == 0.5
+    clock.now += 1
+    scheduler.run_due()
+    assert calls == ["a", "b"]  # by order of insertion
+    assert "a" not in scheduler
+    assert scheduler.timeout(10) == 2
+    clock.now += 5
+    assert scheduler.timeout(10) == 0  # expired
+    scheduler.run_due()
+    assert calls == ["a", "b", "c"]
+    assert scheduler.timeout(10) == 10  # no tasks
+
+
+def test_replace_and_cancel(clock):
+    scheduler = Scheduler()
+    calls = []
+    scheduler.add("task", 1, lambda: calls.append(1))
+    scheduler.add("task", 5, lambda: calls.append(5))  # replaces it
+    scheduler.add("other", 2, lambda: calls.append(2))
+    scheduler.cancel("other")
+    scheduler.cancel("missing")
+    assert scheduler.timeout(10) == 5  # cancelled entries skipped
+    assert len(scheduler.heap) == 1
+    clock.now += 5
+    scheduler.run_due()
+    assert calls == [5]
+
+
+def test_recurring(clock):
+    scheduler = Scheduler()
+    calls = []
+    scheduler.add("tick", 2, lambda: calls.append(clock.now), interval=2)
+    for n in range(3):
+        clock.now += 2
+        scheduler.run_due()
+    assert calls == [1002, 1004, 1006]
+    clock.now += 3  # late: the next deadline keeps the period
+    scheduler.run_due()
+    assert scheduler.timeout(10) == 1
+    assert "tick" in scheduler
+
+
+def test_task_rescheduling_itself(clock):
+    scheduler = Scheduler()
+    calls = []
+
+    def task():
+        calls.append(clock.now)
+        if len(calls) < 3:
+            scheduler.add("task", 1, task)
+
+    scheduler.add("task", 1, task)
+    for n in range(5):
+        clock.now += 1
+        scheduler.run_due()
+    assert calls == [1001, 1002, 1003]
+    assert "task" not in scheduler
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Restart policy and supervision of the child processes (wpa_cli and the
+Enroller).
+"""
+
+import os
+from select import select
+
+import pytest
+
+import hostp2pd.hostp2pd
+from hostp2pd import HostP2pD
+from hostp2pd.hostp2pd import Supervisor
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Enroller(object):
+    """ Enroller process which already exited """
+
+    def __init__(self, exitcode):
+        self.exitcode = exitcode
+        self.pid = 1
+
+    def join(self, timeout=None):
+        pass
+
+    def is_alive(self):
+        return False
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(hostp2pd.hostp2pd.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def core(clock):
+    core = HostP2pD()
+    core.p2p_client = "false"  # wpa_cli exiting at once
+    yield core
+    core.terminate_is_active = True
+    core.close_process_fd()
+    if core.process is not None:
+        core.process.wait()
+    for fd in core.master_fd, core.slave_fd:
+        if fd is not None:
+            os.close(fd)
+
+
+def run_due(core, clock, name):
+    """ advance the clock to the task "name"; return its delay """
+    delay = core.scheduler.timeout(3600)
+    assert name in core.scheduler
+    clock.now += delay
+    core.scheduler.run_due()
+    return delay
+
+
+def test_backoff(clock):
+    supervisor = Supervisor(1, 10)
+    delays = []
+    for n in range(6):
+        delays.append(supervisor.exited())
+        clock.now += delays[-1]
+        supervisor.restarted()
+    assert delays == [1, 2, 4, 8, 10, 10]
+    assert supervisor.restarts == 6
+    assert supervisor.downtime == sum(delays)
+
+
+def test_reset_after_stable_run(clock):
+    supervisor = Supervisor(1, 10)
+    for n in range(3):
+        supervisor.exited()
+        supervisor.restarted()
+    clock.now += 10
+    assert supervisor.exited() == 8  # not more than max_delay seconds
+    supervisor.restarted()
+    clock.now += 10.5
+    assert supervisor.exited() == 1  # it was running fine
+    assert supervisor.exited() == 2  # still down: next failure
+
+
+def test_downtime(clock):
+    supervisor = Supervisor(1, 10)
+    assert supervisor.exited() == 1
+    clock.now += 3
+    assert supervisor.downtime == 3  # current
+    supervisor.cancel()  # not needed any more
+    clock.now += 5
+    assert supervisor.downtime == 3
+    assert supervisor.restarts == 0
+
+
+def test_pidfd(core, clock):
+    if not hasattr(os, "pidfd_open"):
+        pytest.skip("pidfd not supported")
+    assert core.start_process()
+    delays = []
+    for n in range(4):
+        fd = core.process_fd
+        assert fd is not None
+        assert select([fd], [], [], 5)[0] == [fd]  # wpa_cli exited
+        core.child_fds[fd]()  # callback invoked by child_exited()
+        assert fd not in core.child_fds
+        delays.append(run_due(core, clock, "restart_process"))
+    assert delays == [1, 2, 4, 8]
+    assert core.process_supervisor.restarts == 4
+
+
+def test_polling(core, clock, monkeypatch):
+    monkeypatch.delattr(os, "pidfd_open", raising=False)
+    assert core.start_process()
+    assert core.process_fd is None
+    assert core.child_fds == {}
+    delays = []
+    for n in range(3):
+        core.process.wait()
+        core.check_liveness()
+        core.check_liveness()  # already scheduled
+        delays.append(run_due(core, clock, "restart_process"))
+    assert delays == [1, 2, 4]
+    clock.now += core.max_restart_delay + 1  # stable run
+    core.process.wait()
+    core.check_liveness()
+    assert run_due(core, clock, "restart_process") == 1
+
+
+def test_enroller_restart(core, clock, monkeypatch):
+    started = []
+    monkeypatch.setattr(
+        core, "run_enrol", lambda: started.append(clock.now))
+    core.use_enroller = True
+    core.monitor_group = "p2p-wlan0-0"
+    delays = []
+    for n in range(3):
+        core.enroller = Enroller(exitcode=-9)
+        core.enroller_exited()
+        assert core.enroller is None
+        delays.append(run_due(core, clock, "restart_enroller"))
+    assert delays == [1, 2, 4]
+    assert len(started) == 3
+    core.enroller = Enroller(exitcode=0)  # terminated regularly
+    core.enroller_exited()
+    assert "restart_enroller" not in core.scheduler
+    core.enroller = Enroller(exitcode=1)
+    core.enroller_exited()
+    core.monitor_group = ""  # group removed meanwhile
+    run_due(core, clock, "restart_enroller")
+    assert len(started) == 3
+    assert core.enroller_supervisor.restarts == 3
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+##########################################################################
+# hostp2pd - The Wi-Fi Direct Session Manager
+# wpa_cli controller of Wi-Fi Direct connections handled by wpa_supplicant
+# https://github.com/Ircama/hostp2pd
+# (C) Ircama 2021 - CC-BY-NC-SA-4.0
+##########################################################################
+"""
+Socket transport (wpa_transport: "socket") against the local stand-in of
+the wpa_supplicant control interface.
+"""
+
+import time
+import logging
+import threading
+from select import select
+
+import pytest
+
+from hostp2pd import HostP2pD
+from hostp2pd.wpa_ctrl import WpaCtrl, WpaCtrlStub
+
+INTERFACE = "p2p-dev-wlan0"
+
+
+def wait(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def receive(wpa_ctrl, timeout=2):
+    """ read the events available within timeout """
+    select([wpa_ctrl.event_sock], [], [], timeout)
+    wpa_ctrl.receive()
+    return list(wpa_ctrl.lines)
+
+
+@pytest.fixture
+def stub(tmp_path):
+    stub = WpaCtrlStub(str(tmp_path), INTERFACE).start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def wpa_ctrl(stub):
+    wpa_ctrl = WpaCtrl(stub.ctrl_interface, INTERFACE)
+    yield wpa_ctrl
+    wpa_ctrl.close()
+
+
+def test_connect(stub, wpa_ctrl):
+    assert wpa_ctrl.open()
+    assert wpa_ctrl.connected
+    assert wpa_ctrl.fileno() is not None
+    assert stub.requests == ["ATTACH"]
+    assert not wpa_ctrl.lines
+
+
+def test_connect_auto(stub):
+    wpa_ctrl = WpaCtrl(stub.ctrl_interface, "auto")
+    try:
+        assert wpa_ctrl.open()
+        assert wpa_ctrl.interface == INTERFACE
+    finally:
+        wpa_ctrl.close()
+
+
+def test_connect_missing_interface(tmp_path):
+    wpa_ctrl = WpaCtrl(str(tmp_path), INTERFACE)
+    assert not wpa_ctrl.open()
+    assert not wpa_ctrl.connected
+    assert wpa_ctrl.fileno() is None
+    assert list(wpa_ctrl.lines) == [
+        "Could not connect to wpa_supplicant: " + INTERFACE + " - re-trying"]
+
+
+def test_pipelined_replies(stub, wpa_ctrl):
+    stub.replies["GET"] = lambda request: request.split()[1] + "\n"
+    stub.replies["LIST_NETWORKS"] = "network id / ssid / bssid / flags\n"
+    wpa_ctrl.open()
+    replies = wpa_ctrl.request_all(
+        ["get config_methods", "list_networks", "get device_name", "ping"])
+    assert replies == [
+        "config_methods\n",
+        "network id / ssid / bssid / flags\n",
+        "device_name\n",
+        "PONG\n",
+    ]
+    assert stub.requests[1:] == [  # command names in upper case
+        "GET config_methods", "LIST_NETWORKS", "GET device_name", "PING"]
+
+
+def test_execute_all(stub, wpa_ctrl):
+    stub.replies["STA-FIRST"] = "aa:bb:cc:dd:ee:01\nflags=[AUTH]\n"
+    stub.replies["STA-NEXT"] = lambda request: (
+        "aa:bb:cc:dd:ee:02\n" if request.endswith(":01") else "FAIL\n")
+    wpa_ctrl.open()
+    assert wpa_ctrl.execute_all(
+        ["interface", "list_sta", "p2p_find", "status"]
+    ) == [
+        ["Available interfaces:", INTERFACE],
+        ["aa:bb:cc:dd:ee:01", "aa:bb:cc:dd:ee:02"],
+        ["OK"],
+        ["OK"],
+    ]
+
+
+def test_command_timeout(stub, wpa_ctrl):
+    stub.replies["SLOW"] = lambda request: time.sleep(0.5) or "OK\n"
+    wpa_ctrl.open()
+    assert wpa_ctrl.request_all(["slow", "ping"], timeout=0.2) == [None, None]
+    assert "'slow' command timed out." in wpa_ctrl.lines
+    time.sleep(1)  # the late replies are received
+    assert wpa_ctrl.request("ping") == "PONG\n"  # late replies discarded
+
+
+def test_events(stub, wpa_ctrl):
+    wpa_ctrl.open()
+    stub.send_event("P2P-DEVICE-FOUND ae:e2:d3:41:27:14 name='test'")
+    assert receive(wpa_ctrl) == [
+        "<3>P2P-DEVICE-FOUND ae:e2:d3:41:27:14 name='test'"]
+
+
+def test_reconnect_after_terminating(stub, wpa_ctrl):
+    wpa_ctrl.open()
+    stub.send_event("CTRL-EVENT-TERMINATING", level=2)
+    assert receive(wpa_ctrl) == [
+        "<2>CTRL-EVENT-TERMINATING",
+        "Connection to wpa_supplicant lost - trying to reconnect",
+    ]
+    assert not wpa_ctrl.connected
+    assert wpa_ctrl.fileno() is None
+    wpa_ctrl.lines.clear()
+    assert wpa_ctrl.reconnect()
+    assert wpa_ctrl.connected
+    assert list(wpa_ctrl.lines) == [
+        "Connection to wpa_supplicant re-established"]
+    assert stub.requests.count("ATTACH") == 2
+    stub.send_event("P2P-FIND-STOPPED")
+    assert receive(wpa_ctrl)[-1] == "<3>P2P-FIND-STOPPED"
+
+
+def test_reconnect_failure(stub, wpa_ctrl):
+    wpa_ctrl.open()
+    stub.stop()
+    receive(wpa_ctrl)
+    wpa_ctrl.lines.clear()
+    assert not wpa_ctrl.reconnect()
+    assert not wpa_ctrl.reconnect()
+    assert not wpa_ctrl.lines  # the failure is not repeated
+    assert wpa_ctrl.request_all(["ping"]) == [None]
+    assert list(wpa_ctrl.lines) == [
+        "Not connected to wpa_supplicant - command dropped."]
+
+
+def test_activation(stub, monkeypatch):
+    """ the Core activates itself as soon as it is connected, without
+        waiting for an event of wpa_supplicant
+    """
+    stub.replies["GET"] = "keypad\n"
+    monkeypatch.setattr(HostP2pD, "wpa_transport", "socket")
+    monkeypatch.setattr(HostP2pD, "ctrl_interface", stub.ctrl_interface)
+    hostp2pd = HostP2pD(interface=INTERFACE, force_logging=logging.CRITICAL)
+    with hostp2pd:
+        assert wait(lambda: "P2P_FIND" in stub.requests, 3)
+    commands = [request.split()[0] for request in stub.requests]
+    assert commands.index("GET") < commands.index("P2P_FIND")
+
+
+def test_timeout_uses_monotonic_clock(stub, wpa_ctrl, monkeypatch):
+    stub.replies["SLOW"] = lambda request: time.sleep(0.3) or "OK\n"
+    wpa_ctrl.open()
+    steps = iter(range(10 ** 6))
+    monkeypatch.setattr(  # wall clock stepping 100 seconds at each read
+        time, "time", lambda: 1e9 + 100 * next(steps))
+    assert wpa_ctrl.request_all(["slow"], timeout=2) == ["OK\n"]
+
+
+def test_switch_while_receiving(stub, wpa_ctrl):
+    """ the sockets are replaced by a thread while events are read """
+    wpa_ctrl.open()
+    errors = []
+
+    def switch():
+        try:
+            for n in range(50):
+                wpa_ctrl.execute("interface " + INTERFACE)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=switch)
+    thread.start()
+    while thread.is_alive():
+        stub.send_event("P2P-DEVICE-FOUND ae:e2:d3:41:27:14")
+        wpa_ctrl.fileno()
+        wpa_ctrl.receive()
+    thread.join()
+    assert not errors
+    assert wpa_ctrl.connected
+    assert "Connection to wpa_supplicant lost - trying to reconnect" \
+        not in wpa_ctrl.lines